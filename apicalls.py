@@ -1,15 +1,23 @@
 # Importing necessary libraries
-import requests
+import argparse
 import os
 import json
+import time
+import threading
+import functools
 import logging
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from settings import load_config
 
 # Setting up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # Loading configuration
-with open('config.json', 'r') as f:
-    config = json.load(f)
+config = load_config()
 
 # Setting up data paths
 test_data_path = config['test_data_path']
@@ -19,32 +27,225 @@ logging.info(f"Apicalls: Data path: {data_path}")
 
 
 #Specify a URL that resolves to your workspace
-URL = "http://127.0.0.1:8000"
+URL = config.get('api_url', "http://127.0.0.1:8000")
 logging.info(f"Apicalls: URL: {URL}")
+# seconds to connect and to wait for the response
+api_timeout = tuple(config.get('api_timeout', [3.05, 60]))
+# retries of failed connections and 502/503/504 answers, waiting backoff * 2 ** retry seconds in between
+api_retries = config.get('api_retries', 3)
+api_backoff = config.get('api_backoff', 0.5)
+# keep-alive connections kept open to the server
+api_pool_size = config.get('api_pool_size', 10)
+# records sent per request when a large prediction input is submitted in chunks
+api_batch_records = config.get('api_batch_records', 5000)
+
+
+##################API client
+class ApiClient:
+    '''
+    Client for the risk assessment API: one pooled keep-alive session shared by all threads,
+    with timeouts and retries with exponential backoff on every call
+    '''
+    def __init__(self, url=None, timeout=None, retries=None, backoff=None, pool_size=None):
+        self.url = (url or URL).rstrip('/')
+        self.timeout = timeout or api_timeout
+        self.pool_size = pool_size or api_pool_size
+        retry = Retry(total=api_retries if retries is None else retries,
+                      backoff_factor=api_backoff if backoff is None else backoff,
+                      status_forcelist=(502, 503, 504),
+                      # every endpoint is safe to repeat, POST /prediction only scores
+                      allowed_methods=frozenset(['GET', 'POST']),
+                      raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def request(self, method, endpoint, **kwargs):
+        '''
+        Returns the decoded JSON of a call, raising requests.HTTPError on an error status
+        '''
+        response = self.session.request(method, f"{self.url}{endpoint}", timeout=self.timeout, **kwargs)
+        response.raise_for_status()
+        return response.json()
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    ##################Endpoints
+    def prediction(self, file_path=None):
+        return self.request('POST', '/prediction', json={'file_path': file_path or data_path})
+
+    def scoring(self):
+        return self.request('GET', '/scoring')
+
+    def summary_stats(self):
+        return self.request('GET', '/summarystats')
+
+    def diagnostics(self):
+        return self.request('GET', '/diagnostics')
+
+    def health(self):
+        return self.request('GET', '/health')
+
+    def predict_batches(self, data, batch_records=None):
+        '''
+        Function to score a large DataFrame in chunks of batch_records rows sent concurrently as
+        columnar JSON, returns the predictions and probabilities in the order of the rows
+        '''
+        batch_records = batch_records or api_batch_records
+        # the server ignores the columns it does not use, text columns are left out of the upload
+        data = data.select_dtypes('number')
+        chunks = [data.iloc[start:start + batch_records] for start in range(0, len(data), batch_records)]
+
+        def submit(chunk):
+            return self.request('POST', '/prediction', json={'columns': chunk.to_dict(orient='list')})
+
+        with ThreadPoolExecutor(max_workers=self.pool_size) as executor:
+            results = list(executor.map(submit, chunks))
+        return {'predictions': [label for result in results for label in result['predictions']],
+                'probabilities': [p for result in results for p in result['probabilities']]}
+
+    def predict_stream(self, data, batch_records=None):
+        '''
+        Function to score a large DataFrame through the NDJSON streaming endpoint: the rows are uploaded
+        in chunks of batch_records while the answers are read back line by line
+        '''
+        batch_records = batch_records or api_batch_records
+
+        def body():
+            for start in range(0, len(data), batch_records):
+                chunk = data.iloc[start:start + batch_records]
+                yield chunk.to_json(orient='records', lines=True).encode().rstrip(b'\n') + b'\n'
+
+        # a generator body is sent chunked and cannot be replayed, so this call is not retried
+        response = self.session.post(f"{self.url}/prediction/stream", data=body(), timeout=self.timeout, stream=True)
+        response.raise_for_status()
+        predictions, probabilities = [], []
+        for line in response.iter_lines():
+            result = json.loads(line)
+            if 'error' in result:
+                raise ValueError(result['error'])
+            predictions.append(result['prediction'])
+            probabilities.append(result['probability'])
+        return {'predictions': predictions, 'probabilities': probabilities}
+
+
+##################Calls
+def timed_call(func):
+    '''
+    Function to run one call and describe its outcome: response or error, and seconds taken
+    '''
+    start = time.perf_counter()
+    try:
+        outcome = {'status': 'ok', 'response': func()}
+    except (requests.RequestException, ValueError) as e:
+        outcome = {'status': 'error', 'error': f"{type(e).__name__}: {e}"}
+    outcome['seconds'] = time.perf_counter() - start
+    return outcome
+
+
+def endpoint_calls(client, prediction_mode='file', batch_records=None):
+    '''
+    Function to get the independent endpoint calls by name, the prediction is made from the
+    test data path on the server ('file') or uploaded from here in chunks ('batch' or 'stream')
+    '''
+    if prediction_mode == 'file':
+        prediction = client.prediction
+    else:
+        data = pd.read_csv(data_path)
+        predict = client.predict_batches if prediction_mode == 'batch' else client.predict_stream
+        prediction = functools.partial(predict, data, batch_records)
+    return {'prediction': prediction,
+            'scoring': client.scoring,
+            'summary_stats': client.summary_stats,
+            'diagnostics': client.diagnostics}
+
+
+def call_all(calls):
+    '''
+    Function to make the independent endpoint calls concurrently
+    '''
+    with ThreadPoolExecutor(max_workers=len(calls)) as executor:
+        futures = {name: executor.submit(timed_call, call) for name, call in calls.items()}
+        return {name: future.result() for name, future in futures.items()}
+
+
+def run_load(client, calls, concurrency, duration):
+    '''
+    Function to use the client as a load generator: concurrency threads make the calls in turn for
+    duration seconds, returns the throughput and latency percentiles per call
+    '''
+    from loadtest import latency_summary
+    samples = [[] for _ in range(concurrency)]
+    names = list(calls)
+    stop_at = time.monotonic() + duration
+
+    def worker(index):
+        turn = index
+        while time.monotonic() < stop_at:
+            name = names[turn % len(names)]
+            outcome = timed_call(calls[name])
+            samples[index].append((name, outcome['seconds'] if outcome['status'] == 'ok' else None))
+            turn += 1
 
+    start = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(index,)) for index in range(concurrency)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
 
+    all_samples = [sample for worker_samples in samples for sample in worker_samples]
+    ok = [latency for _, latency in all_samples if latency is not None]
+    result = dict(latency_summary(ok, len(all_samples) - len(ok)), seconds=elapsed,
+                  requests_per_second=len(ok) / elapsed, concurrency=concurrency, calls={})
+    for name in names:
+        call_samples = [latency for call, latency in all_samples if call == name]
+        call_ok = [latency for latency in call_samples if latency is not None]
+        result['calls'][name] = latency_summary(call_ok, len(call_samples) - len(call_ok))
+    return result
 
-#Call each API endpoint and store the responses
-response1 = requests.post(
-    f"{URL}/prediction",
-    json={"file_path": data_path}
-).json()
-response2 = requests.get(f"{URL}/scoring").json()
-response3 = requests.get(f"{URL}/summarystats").json()
-response4 = requests.get(f"{URL}/diagnostics").json()
 
-#combine all API responses
-responses = {'prediction': response1, 
-             'scoring': response2, 
-             'summary_stats': response3, 
-             'diagnostics': response4}
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Call the API endpoints and save their responses as JSON")
+    parser.add_argument('--url', default=URL, help="base URL of the running app")
+    parser.add_argument('--prediction-mode', choices=['file', 'batch', 'stream'], default='file',
+                        help="score the test data by path on the server, or upload it in chunks as JSON batches "
+                             "or to the streaming endpoint")
+    parser.add_argument('--batch-records', type=int, default=api_batch_records, help="records per uploaded chunk")
+    parser.add_argument('--load', type=float, metavar='SECONDS', help="generate load for this many seconds instead")
+    parser.add_argument('--concurrency', type=int, default=api_pool_size, help="load generator threads")
+    parser.add_argument('--output', default=os.path.join(config['output_model_path'], 'apireturns.txt'),
+                        help="JSON results file")
+    args = parser.parse_args(argv)
 
-#write the responses to your workspace
-save_path = os.path.join(config['output_model_path'], 'apireturns.txt')
-with open(save_path, 'w') as f:
-    for key, value in responses.items():
-        f.write(f"{key}: {value}\n")
+    with ApiClient(args.url, pool_size=max(args.concurrency, api_pool_size)) as client:
+        calls = endpoint_calls(client, args.prediction_mode, args.batch_records)
+        if args.load:
+            results = {'url': client.url, 'prediction_mode': args.prediction_mode,
+                       'load': run_load(client, calls, args.concurrency, args.load)}
+            logging.info(f"Apicalls: {results['load']['requests_per_second']:.0f} req/s, "
+                         f"p99 {results['load']['p99_ms']} ms, {results['load']['errors']} errors")
+        else:
+            results = {'url': client.url, 'prediction_mode': args.prediction_mode, 'calls': call_all(calls)}
+            failed = [name for name, outcome in results['calls'].items() if outcome['status'] != 'ok']
+            if failed:
+                logging.warning(f"Apicalls: Failed calls: {failed}")
 
-logging.info(f"Apicalls: API responses saved to {save_path}")
+    #write the responses to your workspace
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    logging.info(f"Apicalls: API responses saved to {args.output}")
+    return results
 
 
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,17 @@
 # Importing necessary libraries
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, jsonify, request, stream_with_context
 import json
 import os
+import time
 import logging
 import pandas as pd
 import diagnostics
 import scoring
+from coalescer import PredictionCoalescer
+from jobs import JobManager
+from instrumentation import metrics, render_last_run
+from modelregistry import get_model_cache
+from settings import load_config
 
 # Setting up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -15,13 +21,62 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 app = Flask(__name__)
 app.secret_key = '1652d576-484a-49fd-913a-6879acfa6ba4'
 
-with open('config.json','r') as f:
-    config = json.load(f) 
+config = load_config()
 
 dataset_csv_path = os.path.join(config['output_folder_path']) 
 logging.info(f"App: Dataset CSV path: {dataset_csv_path}")
 
 prediction_model = None
+# rows scored per model call by the NDJSON streaming endpoint
+prediction_chunk_size = config.get('prediction_chunk_size', 10000)
+
+# slow diagnostics run as background jobs, results older than this many seconds are refreshed
+diagnostic_jobs = JobManager()
+diagnostics_max_age = config.get('diagnostics_max_age', 3600)
+diagnostic_job_functions = {
+    'execution_time': diagnostics.execution_time,
+    'outdated_packages': diagnostics.outdated_packages_list
+}
+
+# concurrent single-record lookups are scored together in micro-batches
+prediction_coalescer = PredictionCoalescer(
+    lambda X: diagnostics.batch_predictions(X, diagnostics.deployed_model()))
+
+
+####################### Request metrics
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    #latency and bytes of every request, by route pattern so ids in paths do not make new series
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    metrics.observe('risk_http_request_seconds', time.perf_counter() - g.request_start,
+                    help="Time to handle a request, up to the first byte of streamed responses",
+                    method=request.method, route=route, status=response.status_code)
+    metrics.inc('risk_http_request_bytes_total', request.content_length or 0,
+                help="Request body bytes received", route=route)
+    if not response.is_streamed:
+        metrics.inc('risk_http_response_bytes_total', response.calculate_content_length() or 0,
+                    help="Response body bytes sent", route=route)
+    return response
+
+@app.route("/metrics", methods=['GET'])
+def get_metrics():
+    #this process's counters and histograms, plus the last pipeline run, in the Prometheus text format
+    return Response(metrics.render() + render_last_run(), mimetype='text/plain; version=0.0.4')
+
+
+####################### Health Endpoint
+@app.route("/health", methods=['GET'])
+def get_health():
+    #readiness for load balancers: 200 with the served model version once a model is loaded, 503 until then
+    try:
+        _, version = get_model_cache(diagnostics.deployment_path).current()
+    except Exception as e:
+        return jsonify({'status': 'unavailable', 'error': str(e), 'pid': os.getpid()}), 503
+    return jsonify({'status': 'ok', 'model_version': version, 'pid': os.getpid()})
 
 
 ####################### Welcome Endpoint
@@ -37,20 +92,91 @@ def predict():
         # For GET requests, use a default test file
         file_path = 'testdata/testdata.csv'
     else:  # POST
-        file_path = request.json.get('file_path')
+        payload = request.get_json()
+        if not isinstance(payload, dict):
+            return jsonify({'error': "request body must be a JSON object"}), 400
+        if 'record' in payload:
+            return predict_single(payload['record'])
+        if 'records' in payload or 'columns' in payload:
+            return predict_inline(payload)
+        file_path = payload.get('file_path')
     
     logging.info(f"App: File path: {file_path}")
     data = pd.read_csv(file_path)
     prediction = diagnostics.model_predictions(data)
     return jsonify(prediction) 
 
+def predict_inline(payload):
+    #score records sent inline as JSON rows or columnar arrays
+    model = diagnostics.deployed_model()
+    try:
+        X = diagnostics.features_from_payload(payload, diagnostics.model_feature_names(model))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    predictions, probabilities = diagnostics.batch_predictions(X, model)
+    return jsonify({'predictions': predictions, 'probabilities': probabilities})
+
+def predict_single(record):
+    #score one record sent inline, batched with concurrent lookups by the coalescer
+    feature_names = diagnostics.model_feature_names(diagnostics.deployed_model())
+    try:
+        X = diagnostics.features_from_payload({'records': [record]}, feature_names)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    prediction, probability = prediction_coalescer.predict(X[0])
+    return jsonify({'prediction': prediction, 'probability': probability})
+
+@app.route("/prediction/stats", methods=['GET'])
+def get_prediction_stats():
+    #latency and throughput counters of the single-record coalescer
+    return jsonify(prediction_coalescer.stats())
+
+#######################Streaming Prediction Endpoint
+@app.route("/prediction/stream", methods=['POST'])
+def predict_stream():
+    #score newline-delimited JSON records, answering one JSON line per record as chunks are scored
+    model = diagnostics.deployed_model()
+    feature_names = diagnostics.model_feature_names(model)
+
+    def score(records):
+        X = diagnostics.features_from_payload({'records': records}, feature_names)
+        predictions, probabilities = diagnostics.batch_predictions(X, model)
+        return ''.join(f'{{"prediction": {label}, "probability": {probability!r}}}\n'
+                       for label, probability in zip(predictions, probabilities))
+
+    def lines():
+        # read the body in blocks, iterating the stream line by line is slow
+        tail = b''
+        for block in iter(lambda: request.stream.read(1 << 16), b''):
+            block_lines = (tail + block).split(b'\n')
+            tail = block_lines.pop()
+            yield from block_lines
+        yield tail
+
+    def generate():
+        records = []
+        try:
+            for line in lines():
+                if line.strip():
+                    records.append(json.loads(line))
+                if len(records) >= prediction_chunk_size:
+                    yield score(records)
+                    records = []
+            if records:
+                yield score(records)
+        except ValueError as e:
+            # the status is already sent, report the error as the last line
+            yield json.dumps({'error': str(e)}) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 #######################Scoring Endpoint
 @app.route("/scoring", methods=['GET','OPTIONS'])
 def get_score():        
-    #check the score of the deployed model
-    f1_score = scoring.score_model()
-    logging.info(f"App: F1 score: {f1_score}")
-    return {'f1_score': f1_score}
+    #check the score of the deployed model, only rescored when the model or test data changed
+    score = scoring.score_model_cached()
+    logging.info(f"App: F1 score: {score['f1_score']} (cache {score['cache']})")
+    return score
 
 #######################Summary Statistics Endpoint
 @app.route("/summarystats", methods=['GET','OPTIONS'])
@@ -59,19 +185,50 @@ def get_summary_stats():
     summary_stats = diagnostics.dataframe_summary()
     # Convert DataFrame to dictionary
     summary_stats_dict = summary_stats.to_dict()
-    logging.info(f"App: Summary stats: {summary_stats_dict}")
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug(f"App: Summary stats: {summary_stats_dict}")
     return jsonify(summary_stats_dict)
 
 #######################Diagnostics Endpoint
+def diagnostic_job_result(name):
+    #last finished result of a diagnostic job, refreshed in the background when missing or too old
+    done = diagnostic_jobs.latest(name, status='done')
+    if done is None or time.time() - done['finished_at'] > diagnostics_max_age:
+        job = diagnostic_jobs.submit(name, diagnostic_job_functions[name])
+    else:
+        job = diagnostic_jobs.latest(name)
+    summary = {key: job[key] for key in ('id', 'status', 'submitted_at', 'finished_at', 'error')}
+    return (done['result'] if done else None), summary
+
 @app.route("/diagnostics", methods=['GET','OPTIONS'])
 def get_diagnostics():        
+    execution_time, execution_time_job = diagnostic_job_result('execution_time')
+    outdated_packages, outdated_packages_job = diagnostic_job_result('outdated_packages')
     response_data = {
         'missing_data': diagnostics.missing_data(),
-        'execution_time': diagnostics.execution_time(),
-        'outdated_packages': diagnostics.outdated_packages_list()
+        'execution_time': execution_time,
+        'outdated_packages': outdated_packages,
+        'jobs': {'execution_time': execution_time_job, 'outdated_packages': outdated_packages_job}
     }
-    logging.info(f"App: Diagnostics response: {response_data}")
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug(f"App: Diagnostics response: {response_data}")
     return jsonify(response_data)
 
+@app.route("/diagnostics/jobs", methods=['POST'])
+def submit_diagnostic_job():
+    #force a refresh of one diagnostic, returns the queued or already running job
+    payload = request.get_json(silent=True)
+    name = payload.get('name') if isinstance(payload, dict) else None
+    if name not in diagnostic_job_functions:
+        return jsonify({'error': f"name must be one of {sorted(diagnostic_job_functions)}"}), 400
+    return jsonify(diagnostic_jobs.submit(name, diagnostic_job_functions[name])), 202
+
+@app.route("/diagnostics/jobs/<job_id>", methods=['GET'])
+def get_diagnostic_job(job_id):
+    job = diagnostic_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'unknown job'}), 404
+    return jsonify(job)
+
 if __name__ == "__main__":    
     app.run(host='0.0.0.0', port=8000, debug=True, threaded=True)
@@ -0,0 +1,291 @@
+# Importing necessary libraries
+import os
+import io
+import json
+import time
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from werkzeug.exceptions import HTTPException, InternalServerError, NotFound
+import app as flask_module
+import diagnostics
+from instrumentation import metrics
+from settings import load_config
+
+# Setting up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+##################Load config.json and get serving settings
+config = load_config()
+
+# threads running predictions and file reads off the event loop
+asgi_executor_workers = config.get('asgi_executor_workers') or min(32, (os.cpu_count() or 1) + 4)
+logging.info(f"ASGI: Executor workers: {asgi_executor_workers}")
+
+# routes, views and JSON encoding come from the Flask app, so both serve the same responses
+flask_app = flask_module.app
+executor = ThreadPoolExecutor(max_workers=asgi_executor_workers, thread_name_prefix='asgi')
+
+
+##################Requests and responses
+async def run_blocking(func, *args, **kwargs):
+    '''
+    Function to await blocking work (CPU-bound prediction, file reads) run on the executor,
+    the event loop keeps serving other requests meanwhile
+    '''
+    return await asyncio.get_running_loop().run_in_executor(executor, functools.partial(func, *args, **kwargs))
+
+
+def call_view(endpoint, **args):
+    '''
+    Function to run one of the Flask app's views that does not read the request
+    '''
+    with flask_app.app_context():
+        return flask_app.make_response(flask_app.view_functions[endpoint](**args))
+
+
+class Request:
+    '''
+    The parts of an ASGI HTTP request the endpoints use, the body is read as it arrives
+    '''
+    def __init__(self, scope, receive):
+        self.scope = scope
+        self.receive = receive
+        self.method = scope['method']
+        self.headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+
+    async def stream(self):
+        while True:
+            message = await self.receive()
+            if message['type'] == 'http.disconnect':
+                raise ConnectionError("client disconnected")
+            yield message.get('body', b'')
+            if not message.get('more_body', False):
+                return
+
+    async def body(self):
+        return b''.join([block async for block in self.stream()])
+
+    async def get_json(self, silent=False):
+        '''
+        Returns the JSON body, parsed and validated by Flask's request class so errors match too
+        '''
+        body = await self.body()
+        environ = {'REQUEST_METHOD': self.method, 'SCRIPT_NAME': '', 'PATH_INFO': self.scope['path'],
+                   'QUERY_STRING': self.scope.get('query_string', b'').decode('latin-1'),
+                   'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+                   'CONTENT_TYPE': self.headers.get('content-type', ''), 'CONTENT_LENGTH': str(len(body)),
+                   'wsgi.input': io.BytesIO(body), 'wsgi.url_scheme': self.scope.get('scheme', 'http')}
+        with flask_app.app_context():
+            return flask_app.request_class(environ).get_json(silent=silent)
+
+
+class StreamingResponse:
+    '''
+    A 200 response whose body is produced by an async generator of str chunks
+    '''
+    def __init__(self, chunks, mimetype):
+        self.chunks = chunks
+        self.mimetype = mimetype
+
+
+##################Async endpoints
+# views that read the request are rewritten here, the others run as they are on the executor
+def json_response(data, status=200):
+    with flask_app.app_context():
+        return flask_app.make_response((flask_module.jsonify(data), status))
+
+
+def call_function(func, *args):
+    with flask_app.app_context():
+        return flask_app.make_response(func(*args))
+
+
+def file_predictions(file_path):
+    return diagnostics.model_predictions(pd.read_csv(file_path))
+
+
+def single_record_features(record):
+    return diagnostics.features_from_payload(
+        {'records': [record]}, diagnostics.model_feature_names(diagnostics.deployed_model()))[0]
+
+
+async def predict(request):
+    if request.method == 'GET':
+        # For GET requests, use a default test file
+        file_path = 'testdata/testdata.csv'
+    else:  # POST
+        payload = await request.get_json()
+        if not isinstance(payload, dict):
+            return json_response({'error': "request body must be a JSON object"}, 400)
+        if 'record' in payload:
+            return await predict_single(payload['record'])
+        if 'records' in payload or 'columns' in payload:
+            return await run_blocking(call_function, flask_module.predict_inline, payload)
+        file_path = payload.get('file_path')
+
+    logging.info(f"ASGI: File path: {file_path}")
+    return json_response(await run_blocking(file_predictions, file_path))
+
+
+async def predict_single(record):
+    #one record, batched with concurrent lookups by the coalescer without holding a thread while it waits
+    try:
+        features = await run_blocking(single_record_features, record)
+    except ValueError as e:
+        return json_response({'error': str(e)}, 400)
+    prediction, probability = await asyncio.wrap_future(flask_module.prediction_coalescer.submit(features))
+    return json_response({'prediction': prediction, 'probability': probability})
+
+
+async def predict_stream(request):
+    #newline-delimited JSON records, each chunk is scored on the executor while the next one arrives
+    model = await run_blocking(diagnostics.deployed_model)
+    feature_names = diagnostics.model_feature_names(model)
+
+    def score(records):
+        X = diagnostics.features_from_payload({'records': records}, feature_names)
+        predictions, probabilities = diagnostics.batch_predictions(X, model)
+        return ''.join(f'{{"prediction": {label}, "probability": {probability!r}}}\n'
+                       for label, probability in zip(predictions, probabilities))
+
+    async def lines():
+        tail = b''
+        async for block in request.stream():
+            block_lines = (tail + block).split(b'\n')
+            tail = block_lines.pop()
+            for line in block_lines:
+                yield line
+        yield tail
+
+    async def generate():
+        records = []
+        try:
+            async for line in lines():
+                if line.strip():
+                    records.append(json.loads(line))
+                if len(records) >= flask_module.prediction_chunk_size:
+                    yield await run_blocking(score, records)
+                    records = []
+            if records:
+                yield await run_blocking(score, records)
+        except ValueError as e:
+            # the status is already sent, report the error as the last line
+            yield json.dumps({'error': str(e)}) + '\n'
+
+    return StreamingResponse(generate(), 'application/x-ndjson')
+
+
+async def submit_diagnostic_job(request):
+    payload = await request.get_json(silent=True)
+    name = payload.get('name') if isinstance(payload, dict) else None
+    if name not in flask_module.diagnostic_job_functions:
+        return json_response({'error': f"name must be one of {sorted(flask_module.diagnostic_job_functions)}"}, 400)
+    job = await run_blocking(flask_module.diagnostic_jobs.submit, name, flask_module.diagnostic_job_functions[name])
+    return json_response(job, 202)
+
+
+async def static(request, filename):
+    # the Flask app has no static folder
+    return NotFound().get_response()
+
+
+request_views = {
+    'predict': predict,
+    'predict_stream': predict_stream,
+    'submit_diagnostic_job': submit_diagnostic_job,
+    'static': static
+}
+
+
+##################ASGI application
+async def send_response(send, response, head=False):
+    body = response.get_data()
+    # the WSGI server adds it in the Flask app
+    if 'Content-Length' not in response.headers:
+        response.headers['Content-Length'] = str(len(body))
+    await send({'type': 'http.response.start', 'status': response.status_code,
+                'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                            for name, value in response.headers.items()]})
+    await send({'type': 'http.response.body', 'body': b'' if head else body})
+
+
+async def dispatch(request):
+    '''
+    Function to route a request with the Flask app's URL map and get its response
+    '''
+    host = request.headers.get('host', 'localhost')
+    adapter = flask_app.url_map.bind(host, url_scheme=request.scope.get('scheme', 'http'))
+    try:
+        rule, args = adapter.match(request.scope['path'], request.method, return_rule=True,
+                                   query_args=request.scope.get('query_string', b'').decode('latin-1'))
+    except HTTPException as e:
+        # unknown path, method not allowed or a redirect to the canonical URL
+        return None, e.get_response()
+    if request.method == 'OPTIONS' and getattr(rule, 'provide_automatic_options', False):
+        response = flask_app.response_class()
+        response.allow.update(adapter.allowed_methods(request.scope['path']))
+        return rule, response
+
+    try:
+        if rule.endpoint in request_views:
+            return rule, await request_views[rule.endpoint](request, **args)
+        return rule, await run_blocking(call_view, rule.endpoint, **args)
+    except HTTPException as e:
+        return rule, e.get_response()
+    except Exception:
+        logging.exception(f"ASGI: Error handling {request.method} {request.scope['path']}")
+        return rule, InternalServerError().get_response()
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            # load the deployed model before the first request
+            try:
+                await run_blocking(diagnostics.deployed_model)
+            except Exception as e:
+                logging.warning(f"ASGI: No deployed model to preload: {e}")
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    '''
+    ASGI entry point serving the same endpoints and responses as app.py: uvicorn asgi:app
+    '''
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+
+    start = time.perf_counter()
+    request = Request(scope, receive)
+    rule, response = await dispatch(request)
+    streamed = isinstance(response, StreamingResponse)
+    if streamed:
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': [(b'content-type', response.mimetype.encode('latin-1'))]})
+
+    # same request metrics as the Flask app
+    route = rule.rule if rule is not None else 'unmatched'
+    metrics.observe('risk_http_request_seconds', time.perf_counter() - start,
+                    help="Time to handle a request, up to the first byte of streamed responses",
+                    method=request.method, route=route, status=200 if streamed else response.status_code)
+    metrics.inc('risk_http_request_bytes_total', int(request.headers.get('content-length') or 0),
+                help="Request body bytes received", route=route)
+    if streamed:
+        async for chunk in response.chunks:
+            await send({'type': 'http.response.body', 'body': chunk.encode(), 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+        return
+    metrics.inc('risk_http_response_bytes_total', response.calculate_content_length() or 0,
+                help="Response body bytes sent", route=route)
+    await send_response(send, response, head=request.method == 'HEAD')
@@ -0,0 +1,340 @@
+# Importing necessary libraries
+import argparse
+import os
+import sys
+import json
+import shutil
+import subprocess
+import tempfile
+import time
+import tracemalloc
+import platform
+import logging
+
+# Setting up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+repo_path = os.path.dirname(os.path.abspath(__file__))
+
+# pipeline stages in the order they depend on each other
+stages = ['ingestion', 'training', 'scoring', 'prediction']
+# modules whose cold import time is tracked, cheapest first
+import_modules = ['settings', 'pipeline', 'fullprocess', 'datastore', 'ingestion', 'training', 'scoring',
+                  'deployment', 'diagnostics', 'reporting', 'app']
+
+
+##################Sandbox set-up
+def make_sandbox(sandbox_path, rows=None, files=4, source_folder=None, test_data_folder=None, seed=0,
+                 duplicate_rate=0.0):
+    '''
+    Function to lay out a temporary workspace with its own config.json, filled either with
+    copies of existing source and test data or with synthetic data of the given size
+    '''
+    with open(os.path.join(repo_path, 'config.json'), 'r') as f:
+        config = json.load(f)
+    config.update(input_folder_path='sourcedata', output_folder_path='ingesteddata', test_data_path='testdata',
+                  output_model_path='models', prod_deployment_path='production_deployment')
+    for folder in ('sourcedata', 'ingesteddata', 'testdata', 'models', 'production_deployment'):
+        os.makedirs(os.path.join(sandbox_path, folder), exist_ok=True)
+    with open(os.path.join(sandbox_path, 'config.json'), 'w') as f:
+        json.dump(config, f)
+
+    if source_folder is not None:
+        for name in os.listdir(source_folder):
+            if name.endswith('.csv'):
+                shutil.copy(os.path.join(source_folder, name), os.path.join(sandbox_path, 'sourcedata', name))
+        shutil.copy(os.path.join(test_data_folder, 'testdata.csv'), os.path.join(sandbox_path, 'testdata'))
+        return
+
+    import datagenerator
+    datagenerator.write_source_files(os.path.join(sandbox_path, 'sourcedata'), rows, files, seed,
+                                     duplicate_rate=duplicate_rate)
+    datagenerator.generate_dataset(rows, seed=seed + files + 1).to_csv(
+        os.path.join(sandbox_path, 'testdata', 'testdata.csv'), index=False)
+
+
+def run_sandboxed(stage_names, repeats, rows=None, files=4, source_folder=None, test_data_folder=None,
+                  trace_memory=True, log=False, duplicate_rate=0.0, training_modes=False, chunk_rows=None):
+    '''
+    Function to benchmark stages in a fresh temporary workspace and a separate Python process,
+    so the live data, models and deployment are never touched
+    '''
+    with tempfile.TemporaryDirectory(prefix='riskbench') as sandbox_path:
+        make_sandbox(sandbox_path, rows, files, source_folder, test_data_folder, duplicate_rate=duplicate_rate)
+        result_path = os.path.join(sandbox_path, 'result.json')
+        command = [sys.executable, os.path.join(repo_path, 'benchmark.py'), '--worker', result_path,
+                   '--stages', *stage_names, '--repeats', str(repeats)]
+        if not trace_memory:
+            command.append('--no-memory')
+        if log:
+            command.append('--log')
+        if training_modes:
+            command.append('--training-modes')
+        if chunk_rows:
+            command += ['--chunk-rows', str(chunk_rows)]
+        subprocess.run(command, cwd=sandbox_path, env=sandbox_env(), check=True,
+                       stdout=subprocess.DEVNULL, stderr=None if log else subprocess.DEVNULL)
+        with open(result_path, 'r') as f:
+            return json.load(f)
+
+
+def sandbox_env():
+    return dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [repo_path, os.environ.get('PYTHONPATH')])))
+
+
+##################Start-up timing
+def time_command(command, cwd, repeats):
+    '''
+    Function to time a command in a new Python process repeats times
+    '''
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=cwd, env=sandbox_env(), check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+    return {'runs': repeats, 'median_seconds': percentile(timings, 0.5),
+            'p95_seconds': percentile(timings, 0.95), 'min_seconds': min(timings)}
+
+
+def run_import_benchmark(repeats):
+    '''
+    Function to time the bare interpreter, the cold import of each module and a full process run
+    that finds no new data, each in a fresh process inside a deployed sandbox
+    '''
+    with tempfile.TemporaryDirectory(prefix='riskbench') as sandbox_path:
+        make_sandbox(sandbox_path, rows=1000, files=2)
+        # the prediction stage ingests, trains, scores and deploys, so every source file counts as seen
+        subprocess.run([sys.executable, os.path.join(repo_path, 'benchmark.py'), '--worker',
+                        os.path.join(sandbox_path, 'result.json'), '--stages', 'prediction', '--repeats', '1',
+                        '--no-memory'], cwd=sandbox_path, env=sandbox_env(), check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        results = {'interpreter': time_command([sys.executable, '-c', 'pass'], sandbox_path, repeats)}
+        for module in import_modules:
+            results[f"import_{module}"] = time_command([sys.executable, '-c', f"import {module}"], sandbox_path, repeats)
+        results['no_new_data_run'] = time_command([sys.executable, os.path.join(repo_path, 'pipeline.py')],
+                                                  sandbox_path, repeats)
+        with open(os.path.join(sandbox_path, 'models', 'pipelinerun.json'), 'r') as f:
+            if json.load(f)['stages']['check_new_data'].get('result') is not False:
+                logging.warning("Benchmark: The no-new-data run found new data, its timing includes a rebuild")
+        return results
+
+
+##################Timing inside the sandbox
+def percentile(values, q):
+    values = sorted(values)
+    index = (len(values) - 1) * q
+    lower = int(index)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (index - lower)
+
+
+def count_rows(file_path):
+    with open(file_path, 'rb') as f:
+        return sum(block.count(b'\n') for block in iter(lambda: f.read(1 << 20), b'')) - 1
+
+
+def worker(result_path, stage_names, repeats, trace_memory):
+    '''
+    Function run inside the sandbox: times each stage repeats times and measures its peak memory
+    '''
+    import pandas as pd
+    import datastore
+    import ingestion
+    import training
+    import scoring
+    import deployment
+    import diagnostics
+
+    test_data = pd.read_csv(os.path.join('testdata', 'testdata.csv'))
+    functions = {
+        'ingestion': ingestion.merge_multiple_dataframe,
+        'training': training.train_model,
+        'scoring': scoring.score_model,
+        'prediction': lambda: diagnostics.model_predictions(test_data)
+    }
+    rows = {
+        'ingestion': sum(count_rows(os.path.join('sourcedata', name))
+                         for name in os.listdir('sourcedata') if name.endswith('.csv')),
+        'scoring': len(test_data),
+        'prediction': len(test_data)
+    }
+
+    results = {}
+    # every stage needs the outputs of the ones before it, whether they are benchmarked or not
+    for stage in stages[:max(stages.index(stage) for stage in stage_names) + 1]:
+        if stage == 'prediction':
+            deployment.store_model_into_pickle()
+        if stage not in stage_names:
+            functions[stage]()
+            continue
+        if stage == 'training':
+            rows['training'] = len(datastore.load_dataset(ingestion.output_folder_path))
+
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            functions[stage]()
+            timings.append(time.perf_counter() - start)
+
+        peak_memory_mb = None
+        if trace_memory:
+            # separate run, tracing allocations slows the stage down
+            tracemalloc.start()
+            functions[stage]()
+            peak_memory_mb = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+            tracemalloc.stop()
+
+        median = percentile(timings, 0.5)
+        results[stage] = {
+            'rows': rows[stage],
+            'runs': repeats,
+            'median_seconds': median,
+            'p95_seconds': percentile(timings, 0.95),
+            'min_seconds': min(timings),
+            'rows_per_second': rows[stage] / median if median > 0 else None,
+            'peak_memory_mb': peak_memory_mb
+        }
+
+    with open(result_path, 'w') as f:
+        json.dump(results, f)
+
+
+def training_worker(result_path, repeats, trace_memory, chunk_rows=None):
+    '''
+    Function run inside the sandbox: ingests once, then times batch LogisticRegression training against
+    chunked SGD training and scores each model's accuracy and F1 on the test data
+    '''
+    import pandas as pd
+    import pickle
+    from sklearn.metrics import accuracy_score, f1_score
+    import ingestion
+    import training
+
+    ingestion.merge_multiple_dataframe()
+    test_data = pd.read_csv(os.path.join('testdata', 'testdata.csv'))
+    X_test, y_test = training.split_features(test_data)
+    functions = {
+        'training_batch': lambda: training.train_model(search=False, warm_start=False, mode='batch'),
+        'training_incremental': lambda: training.train_incremental(chunk_rows)
+    }
+
+    results = {}
+    for name, function in functions.items():
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            function()
+            timings.append(time.perf_counter() - start)
+
+        peak_memory_mb = None
+        if trace_memory:
+            tracemalloc.start()
+            function()
+            peak_memory_mb = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+            tracemalloc.stop()
+
+        with open(os.path.join(training.model_path, 'trainedmodel.pkl'), 'rb') as f:
+            predictions = pickle.load(f).predict(X_test)
+        with open(os.path.join(training.model_path, training.metadata_file_name), 'r') as f:
+            rows = json.load(f)['rows']
+        median = percentile(timings, 0.5)
+        results[name] = {
+            'rows': rows,
+            'runs': repeats,
+            'median_seconds': median,
+            'p95_seconds': percentile(timings, 0.95),
+            'min_seconds': min(timings),
+            'rows_per_second': rows / median if median > 0 else None,
+            'peak_memory_mb': peak_memory_mb,
+            'accuracy': float(accuracy_score(y_test, predictions)),
+            'f1_score': float(f1_score(y_test, predictions))
+        }
+
+    with open(result_path, 'w') as f:
+        json.dump(results, f)
+
+
+##################Reporting and regression checks
+def compare(results, baseline, threshold):
+    '''
+    Function to list the stages whose median time grew by more than threshold (0.1 = 10%) against a baseline run
+    '''
+    regressions = []
+    for size, size_results in results['results'].items():
+        for stage, stage_result in size_results.items():
+            previous = baseline.get('results', {}).get(size, {}).get(stage)
+            if previous and stage_result['median_seconds'] > previous['median_seconds'] * (1 + threshold):
+                regressions.append({'rows': size, 'stage': stage,
+                                    'median_seconds': stage_result['median_seconds'],
+                                    'baseline_median_seconds': previous['median_seconds']})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages on synthetic data in temporary workspaces")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 100000], help="rows of source data per run")
+    parser.add_argument('--files', type=int, default=4, help="source files the rows are split into")
+    parser.add_argument('--duplicate-rate', type=float, default=0.0, help="share of duplicated source rows")
+    parser.add_argument('--repeats', type=int, default=5, help="timed runs per stage")
+    parser.add_argument('--stages', nargs='+', default=stages, choices=stages)
+    parser.add_argument('--output', default='benchmarkresults.json', help="machine-readable results file")
+    parser.add_argument('--baseline', help="previous results file to check for regressions")
+    parser.add_argument('--threshold', type=float, default=0.1, help="relative slowdown reported as a regression")
+    parser.add_argument('--no-memory', action='store_true', help="skip the peak memory runs")
+    parser.add_argument('--log', action='store_true', help="keep the pipeline's logging on")
+    parser.add_argument('--imports', action='store_true',
+                        help="time module imports and a no-new-data run instead of the stages")
+    parser.add_argument('--training-modes', action='store_true',
+                        help="compare batch and chunked SGD training instead of the stages")
+    parser.add_argument('--chunk-rows', type=int, help="chunk size of the SGD training, training_chunk_rows by default")
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        if not args.log:
+            logging.disable(logging.INFO)
+        if args.training_modes:
+            training_worker(args.worker, args.repeats, not args.no_memory, args.chunk_rows)
+        else:
+            worker(args.worker, args.stages, args.repeats, not args.no_memory)
+        return
+
+    results = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeats': args.repeats,
+        'files': args.files,
+        'duplicate_rate': args.duplicate_rate,
+        'results': {}
+    }
+    if args.imports:
+        results['results']['startup'] = run_import_benchmark(args.repeats)
+        for name, result in results['results']['startup'].items():
+            logging.info(f"Benchmark: {name}: {result['median_seconds'] * 1000:.1f} ms")
+    for size in [] if args.imports else args.sizes:
+        logging.info(f"Benchmark: Running {'training modes' if args.training_modes else args.stages} on {size} rows")
+        results['results'][str(size)] = run_sandboxed(args.stages, args.repeats, size, args.files,
+                                                      trace_memory=not args.no_memory, log=args.log,
+                                                      duplicate_rate=args.duplicate_rate,
+                                                      training_modes=args.training_modes,
+                                                      chunk_rows=args.chunk_rows)
+        for stage, stage_result in results['results'][str(size)].items():
+            logging.info(f"Benchmark: {size} rows, {stage}: {stage_result}")
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    logging.info(f"Benchmark: Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for regression in regressions:
+            logging.warning(f"Benchmark: Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
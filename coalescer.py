@@ -0,0 +1,118 @@
+# Importing necessary libraries
+import numpy as np
+import queue
+import threading
+import time
+import logging
+from collections import deque
+from concurrent.futures import Future
+from settings import load_config
+
+# Setting up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+##################Load config.json and get coalescer settings
+config = load_config()
+
+# how long the first request of a batch waits for others, and the largest batch scored at once
+coalescer_window_ms = config.get('coalescer_window_ms', 2.0)
+logging.info(f"Coalescer: Window (ms): {coalescer_window_ms}")
+coalescer_max_batch = config.get('coalescer_max_batch', 256)
+logging.info(f"Coalescer: Max batch: {coalescer_max_batch}")
+
+
+##################Micro-batching request coalescer
+class PredictionCoalescer:
+    '''
+    Gathers concurrent single-row prediction requests for up to window_ms or max_batch rows,
+    scores them with one call to predict_batch(X) -> (labels, probabilities) on a background
+    thread and hands each caller its own result.
+    '''
+    def __init__(self, predict_batch, window_ms=None, max_batch=None, latency_samples=10000):
+        self.predict_batch = predict_batch
+        self.window = (coalescer_window_ms if window_ms is None else window_ms) / 1000
+        self.max_batch = coalescer_max_batch if max_batch is None else max_batch
+        self.queue = queue.Queue()
+        self.thread = None
+        self.thread_lock = threading.Lock()
+        # counters, only written by the batching thread
+        self.started = time.monotonic()
+        self.requests = 0
+        self.batches = 0
+        self.errors = 0
+        self.largest_batch = 0
+        self.latencies = deque(maxlen=latency_samples)
+
+    def submit(self, features):
+        '''
+        Queues one row of features and returns a Future resolving to (label, probability)
+        '''
+        if self.thread is None:
+            with self.thread_lock:
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self.run, name='prediction-coalescer', daemon=True)
+                    self.thread.start()
+        future = Future()
+        self.queue.put((features, future, time.perf_counter()))
+        return future
+
+    def predict(self, features, timeout=None):
+        '''
+        Scores one row of features, blocking until its batch has been scored
+        '''
+        return self.submit(features).result(timeout)
+
+    def next_batch(self):
+        items = [self.queue.get()]
+        deadline = time.perf_counter() + self.window
+        while len(items) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                items.append(self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return items
+
+    def run(self):
+        while True:
+            items = self.next_batch()
+            try:
+                X = np.array([item[0] for item in items], dtype=np.float64)
+                labels, probabilities = self.predict_batch(X)
+            except Exception as e:
+                logging.error(f"Coalescer: Error scoring batch of {len(items)}: {e}")
+                self.errors += len(items)
+                for _, future, _ in items:
+                    future.set_exception(e)
+                continue
+
+            done = time.perf_counter()
+            for (_, future, queued), label, probability in zip(items, labels, probabilities):
+                future.set_result((label, probability))
+                self.latencies.append(done - queued)
+            self.requests += len(items)
+            self.batches += 1
+            self.largest_batch = max(self.largest_batch, len(items))
+
+    def stats(self):
+        '''
+        Returns latency and throughput counters to tune window_ms and max_batch
+        '''
+        latencies = np.array(self.latencies.copy()) * 1000
+        elapsed = time.monotonic() - self.started
+        return {
+            'window_ms': self.window * 1000,
+            'max_batch': self.max_batch,
+            'requests': self.requests,
+            'batches': self.batches,
+            'errors': self.errors,
+            'mean_batch_size': self.requests / self.batches if self.batches else 0.0,
+            'largest_batch': self.largest_batch,
+            'queued': self.queue.qsize(),
+            'requests_per_second': self.requests / elapsed if elapsed > 0 else 0.0,
+            'latency_ms_p50': float(np.percentile(latencies, 50)) if len(latencies) else None,
+            'latency_ms_p95': float(np.percentile(latencies, 95)) if len(latencies) else None,
+            'latency_ms_p99': float(np.percentile(latencies, 99)) if len(latencies) else None,
+            'latency_ms_max': float(latencies.max()) if len(latencies) else None
+        }
@@ -0,0 +1,118 @@
+# Importing necessary libraries
+import argparse
+import pandas as pd
+import numpy as np
+import os
+import json
+import logging
+
+# Setting up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+feature_columns = ['lastmonth_activity', 'lastyear_activity', 'number_of_employees']
+
+
+##################Functions to generate synthetic data
+def generate_dataset(rows, seed=0, missing_rate=0.0, drift=0.0):
+    '''
+    Function to make a corporate-attrition dataset with the same schema as the source data.
+    Corporations are 4-letter codes, activity and headcount are heavy-tailed like the sample data,
+    and exited follows a logistic model of the activity whose intercept is shifted by drift
+    (positive drift means more exits). missing_rate blanks that share of feature values.
+    '''
+    rng = np.random.default_rng(seed)
+    letters = rng.integers(ord('a'), ord('z') + 1, size=(rows, 4), dtype=np.uint8)
+    employees = np.maximum(rng.lognormal(3.5, 1.8, rows).astype(np.int64), 1)
+    # yearly activity grows with headcount, monthly activity is a noisy twelfth of it
+    lastyear = rng.poisson(rng.gamma(0.8, 40 * np.sqrt(employees))).astype(np.int64)
+    lastmonth = rng.poisson(lastyear / 12 * rng.gamma(2, 0.5, rows)).astype(np.int64)
+    logit = 0.4 - 0.8 * np.log1p(lastmonth) + 0.5 * np.log1p(lastyear) - 0.2 * np.log1p(employees) + drift
+    exited = (rng.random(rows) < 1 / (1 + np.exp(-logit))).astype(np.int64)
+
+    data = pd.DataFrame({
+        'corporation': letters.view('S4').ravel().astype('U4'),
+        'lastmonth_activity': lastmonth,
+        'lastyear_activity': lastyear,
+        'number_of_employees': employees,
+        'exited': exited
+    })
+    if missing_rate > 0:
+        for column in feature_columns:
+            data.loc[rng.random(rows) < missing_rate, column] = np.nan
+    return data
+
+
+def add_duplicates(data, duplicate_rate, rng, pool=None):
+    '''
+    Function to replace duplicate_rate of the rows with exact copies of other rows
+    of this dataset or of pool (rows written to earlier files), in shuffled order
+    '''
+    duplicates = rng.random(len(data)) < duplicate_rate
+    if not duplicates.any():
+        return data
+    sources = data if pool is None else pd.concat([pool, data], ignore_index=True)
+    copies = sources.iloc[rng.integers(0, len(sources), duplicates.sum())]
+    data = pd.concat([data[~duplicates], copies], ignore_index=True)
+    return data.iloc[rng.permutation(len(data))].reset_index(drop=True)
+
+
+def write_source_files(folder_path, rows, files=1, seed=0, duplicate_rate=0.0, missing_rate=0.0, drift=0.0,
+                       prefix='dataset'):
+    '''
+    Function to split rows over files CSVs in folder_path, ready for ingestion.
+    Label drift grows linearly from 0 in the first file to drift in the last one, and
+    duplicate_rate of each file's rows repeat rows from the same or earlier files.
+    Returns the written file paths.
+    '''
+    os.makedirs(folder_path, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    paths = []
+    # sample of earlier rows to draw cross-file duplicates from
+    pool = None
+    for i in range(files):
+        file_rows = (i + 1) * rows // files - i * rows // files
+        file_drift = drift * i / (files - 1) if files > 1 else drift
+        data = generate_dataset(file_rows, seed=seed + i + 1, missing_rate=missing_rate, drift=file_drift)
+        data = add_duplicates(data, duplicate_rate, rng, pool)
+        path = os.path.join(folder_path, f"{prefix}{i:04d}.csv")
+        data.to_csv(path, index=False)
+        paths.append(path)
+        pool = data.sample(min(len(data), 10000), random_state=seed + i) if pool is None else pd.concat(
+            [pool, data.sample(min(len(data), 10000), random_state=seed + i)]).tail(100000)
+        logging.info(f"Data generator: Wrote {file_rows} rows to {path}")
+    return paths
+
+
+def prediction_payload(rows, layout='records', seed=0):
+    '''
+    Function to make a /prediction request body of rows synthetic records, as JSON 'records',
+    'columns' or an NDJSON string for /prediction/stream
+    '''
+    data = generate_dataset(rows, seed=seed)[feature_columns]
+    if layout == 'records':
+        return {'records': data.to_dict('records')}
+    if layout == 'columns':
+        return {'columns': data.to_dict('list')}
+    return ''.join(json.dumps(record) + '\n' for record in data.to_dict('records'))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate synthetic corporate-attrition CSVs")
+    parser.add_argument('--rows', type=int, default=100000, help="source rows over all files")
+    parser.add_argument('--files', type=int, default=4)
+    parser.add_argument('--output-folder', default='sourcedata')
+    parser.add_argument('--test-rows', type=int, default=0, help="also write testdata.csv with this many rows")
+    parser.add_argument('--test-folder', default='testdata')
+    parser.add_argument('--duplicate-rate', type=float, default=0.0)
+    parser.add_argument('--missing-rate', type=float, default=0.0,
+                        help="share of blank feature values, training needs 0")
+    parser.add_argument('--drift', type=float, default=0.0, help="label drift reached by the last file")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    write_source_files(args.output_folder, args.rows, args.files, args.seed,
+                       args.duplicate_rate, args.missing_rate, args.drift)
+    if args.test_rows:
+        os.makedirs(args.test_folder, exist_ok=True)
+        generate_dataset(args.test_rows, seed=args.seed + args.files + 1, drift=args.drift).to_csv(
+            os.path.join(args.test_folder, 'testdata.csv'), index=False)
@@ -0,0 +1,197 @@
+# Importing necessary libraries
+import pandas as pd
+import numpy as np
+import os
+import json
+import shutil
+import logging
+from settings import load_config
+
+# Setting up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+##################Load config.json and get path variables
+config = load_config()
+
+dataset_folder_path = os.path.join(config['output_folder_path'])
+logging.info(f"Datastore: Dataset folder path: {dataset_folder_path}")
+# one of 'csv', 'numpy' (memory-mapped column files), 'parquet' or 'feather' (need pyarrow)
+dataset_format = config.get('dataset_format', 'csv')
+logging.info(f"Datastore: Dataset format: {dataset_format}")
+# whether finaldata.csv is still written next to a binary format
+dataset_csv_export = config.get('dataset_csv_export', True)
+logging.info(f"Datastore: Dataset CSV export: {dataset_csv_export}")
+
+dataset_file_names = {
+    'csv': 'finaldata.csv',
+    'numpy': 'finaldata.npcols',
+    'parquet': 'finaldata.parquet',
+    'feather': 'finaldata.feather'
+}
+
+
+##################Functions for the numpy column layout
+def save_numpy_columns(data, path):
+    '''
+    Function to write one .npy file per column plus a meta.json describing them.
+    String columns are stored fixed-width with a null mask so every file can be memory-mapped.
+    '''
+    tmp_path = path + '.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    meta = {'columns': [], 'rows': len(data)}
+    for i, column in enumerate(data.columns):
+        values = data[column]
+        column_meta = {'name': column, 'file': f"{i}.npy", 'dtype': str(values.dtype)}
+        if values.dtype.kind in 'biuf':
+            np.save(os.path.join(tmp_path, column_meta['file']), values.to_numpy())
+        else:
+            mask = values.isna().to_numpy()
+            np.save(os.path.join(tmp_path, column_meta['file']), values.fillna('').astype(str).to_numpy(dtype=str))
+            if mask.any():
+                column_meta['mask'] = f"{i}.mask.npy"
+                np.save(os.path.join(tmp_path, column_meta['mask']), mask)
+        meta['columns'].append(column_meta)
+    with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+    # swap the directories so readers never see a partially written dataset
+    old_path = path + '.old'
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.exists(path):
+        os.rename(path, old_path)
+    os.rename(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+def load_numpy_columns(path):
+    '''
+    Function to load the numpy column layout, numeric columns stay memory-mapped
+    '''
+    with open(os.path.join(path, 'meta.json'), 'r') as f:
+        meta = json.load(f)
+    columns = {}
+    for column_meta in meta['columns']:
+        values = np.load(os.path.join(path, column_meta['file']), mmap_mode='r')
+        if values.dtype.kind == 'U':
+            values = values.astype(object)
+            if 'mask' in column_meta:
+                values[np.load(os.path.join(path, column_meta['mask']))] = np.nan
+        columns[column_meta['name']] = values
+    return pd.DataFrame(columns, copy=False)
+
+
+def iter_numpy_columns(path, chunk_rows):
+    '''
+    Function to read the numpy column layout in row chunks, only the rows of a chunk are materialized
+    '''
+    with open(os.path.join(path, 'meta.json'), 'r') as f:
+        meta = json.load(f)
+    columns = [(column_meta, np.load(os.path.join(path, column_meta['file']), mmap_mode='r'),
+                np.load(os.path.join(path, column_meta['mask']), mmap_mode='r') if 'mask' in column_meta else None)
+               for column_meta in meta['columns']]
+    for start in range(0, meta['rows'], chunk_rows):
+        chunk = {}
+        for column_meta, values, mask in columns:
+            values = np.array(values[start:start + chunk_rows])
+            if values.dtype.kind == 'U':
+                values = values.astype(object)
+                if mask is not None:
+                    values[mask[start:start + chunk_rows]] = np.nan
+            chunk[column_meta['name']] = values
+        yield pd.DataFrame(chunk, copy=False)
+
+
+##################Functions to save and load the ingested dataset
+def dataset_path(file_format=None, folder_path=None):
+    '''
+    Function to get the path of the ingested dataset in the given format (default the configured one)
+    '''
+    return os.path.join(folder_path or dataset_folder_path, dataset_file_names[file_format or dataset_format])
+
+
+def dataset_exists(folder_path=None):
+    '''
+    Function to check whether the ingested dataset exists in the configured format
+    '''
+    return os.path.exists(dataset_path(folder_path=folder_path))
+
+
+def save_dataset(data, folder_path=None):
+    '''
+    Function to write the ingested dataset in the configured format, plus the optional CSV export
+    '''
+    path = dataset_path(folder_path=folder_path)
+    if dataset_format == 'numpy':
+        save_numpy_columns(data, path)
+    elif dataset_format in ('parquet', 'feather'):
+        tmp_path = path + '.tmp'
+        if dataset_format == 'parquet':
+            data.to_parquet(tmp_path, index=False)
+        else:
+            data.reset_index(drop=True).to_feather(tmp_path)
+        os.replace(tmp_path, path)
+    if dataset_format == 'csv' or dataset_csv_export:
+        data.to_csv(dataset_path('csv', folder_path), index=False)
+    logging.info(f"Datastore: Dataset saved to {path}")
+
+
+def discard_dataset(folder_path=None):
+    '''
+    Function to remove the binary dataset when finaldata.csv was rewritten without it
+    '''
+    if dataset_format == 'csv':
+        return
+    path = dataset_path(folder_path=folder_path)
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+    logging.info(f"Datastore: Stale dataset {path} removed")
+
+
+def load_dataset(folder_path=None):
+    '''
+    Function to load the ingested dataset, falling back to finaldata.csv when the binary format is missing
+    '''
+    path = dataset_path(folder_path=folder_path)
+    if dataset_format != 'csv' and not os.path.exists(path):
+        logging.info(f"Datastore: {path} not found, reading the CSV export")
+        path = dataset_path('csv', folder_path)
+        return pd.read_csv(path, dtype={'corporation': str})
+
+    if dataset_format == 'numpy':
+        return load_numpy_columns(path)
+    if dataset_format == 'parquet':
+        return pd.read_parquet(path)
+    if dataset_format == 'feather':
+        return pd.read_feather(path)
+    return pd.read_csv(path, dtype={'corporation': str})
+
+
+def iter_dataset(chunk_rows, folder_path=None):
+    '''
+    Function to read the ingested dataset in chunks of chunk_rows rows, so it never has to fit in memory
+    '''
+    path = dataset_path(folder_path=folder_path)
+    file_format = dataset_format
+    if dataset_format != 'csv' and not os.path.exists(path):
+        logging.info(f"Datastore: {path} not found, reading the CSV export")
+        path = dataset_path('csv', folder_path)
+        file_format = 'csv'
+
+    if file_format == 'numpy':
+        yield from iter_numpy_columns(path, chunk_rows)
+    elif file_format == 'parquet':
+        import pyarrow.parquet
+        for batch in pyarrow.parquet.ParquetFile(path).iter_batches(batch_size=chunk_rows):
+            yield batch.to_pandas()
+    elif file_format == 'feather':
+        import pyarrow.feather
+        # memory-mapped, a slice only reads its own rows
+        table = pyarrow.feather.read_table(path, memory_map=True)
+        for start in range(0, table.num_rows, chunk_rows):
+            yield table.slice(start, chunk_rows).to_pandas()
+    else:
+        yield from pd.read_csv(path, dtype={'corporation': str}, chunksize=chunk_rows)
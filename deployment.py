@@ -1,9 +1,15 @@
 # Importing necessary libraries
+import argparse
 import os
 import json
-import logging  
-from glob import glob
+import logging
 import shutil
+import time
+from datetime import datetime
+from fingerprints import file_fingerprint
+from instrumentation import traced, annotate
+from numpymodel import model_file_name as numpy_model_file_name
+from settings import load_config
 
 # Setting up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -11,66 +17,255 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 
 
 ##################Load config.json and correct path variable
-with open('config.json','r') as f:
-    config = json.load(f) 
+config = load_config()
 
-dataset_folder_path = os.path.join(config['output_folder_path']) 
+dataset_folder_path = os.path.join(config['output_folder_path'])
 logging.info(f"Deployment: Dataset folder path: {dataset_folder_path}")
-prod_deployment_path = os.path.join(config['prod_deployment_path']) 
+prod_deployment_path = os.path.join(config['prod_deployment_path'])
 logging.info(f"Deployment: Prod deployment path: {prod_deployment_path}")
-model_folder_path = os.path.join(config['output_model_path']) 
+model_folder_path = os.path.join(config['output_model_path'])
 logging.info(f"Deployment: Model folder path: {model_folder_path}")
+# deployed versions kept on disk, the current one and the one before it are always kept
+deployment_retention = config.get('deployment_retention', 5)
+logging.info(f"Deployment: Retention: {deployment_retention}")
 #logging.info(f"Model path: {model_path}")
 
+model_file_name = 'trainedmodel.pkl'
+score_file_name = 'latestscore.txt'
+record_file_name = 'ingestedfiles.txt'
+manifest_file_name = 'manifest.json'
+drift_reference_file_name = 'driftreference.json'
+metadata_file_name = 'modelmetadata.json'
+versions_folder_name = 'versions'
+current_link_name = 'current'
+# files also reachable at the top of the deployment directory, through the current link
+published_file_names = [model_file_name, numpy_model_file_name, score_file_name, record_file_name]
+
+####################function for atomic copies
+def atomic_copy(source_path, destination_path):
+    '''
+    Function to copy a file so that readers see either the old or the new file, never a torn one
+    '''
+    tmp_path = destination_path + '.tmp'
+    shutil.copy(source_path, tmp_path)
+    os.replace(tmp_path, destination_path)
+
+
+def atomic_symlink(target, link_path):
+    '''
+    Function to point link_path at target, replacing whatever was there in one rename
+    '''
+    tmp_path = f"{link_path}.tmp-{os.getpid()}"
+    if os.path.lexists(tmp_path):
+        os.remove(tmp_path)
+    os.symlink(target, tmp_path)
+    os.replace(tmp_path, link_path)
+
+
+####################Versioned model store
+def list_versions(deployment_path=None):
+    '''
+    Function to list the deployed versions, oldest first
+    '''
+    versions_path = os.path.join(deployment_path or prod_deployment_path, versions_folder_name)
+    if not os.path.isdir(versions_path):
+        return []
+    return sorted(name for name in os.listdir(versions_path) if not name.startswith('.'))
+
+
+def current_version(deployment_path=None):
+    '''
+    Function to get the version the current pointer refers to, None for a flat deployment
+    '''
+    link_path = os.path.join(deployment_path or prod_deployment_path, current_link_name)
+    if not os.path.islink(link_path):
+        return None
+    return os.path.basename(os.readlink(link_path))
+
+
+def current_version_path(deployment_path=None):
+    '''
+    Function to get the directory the current model is served from, the deployment directory
+    itself for a deployment made before versioning
+    '''
+    deployment_path = deployment_path or prod_deployment_path
+    version = current_version(deployment_path)
+    if version is None:
+        return deployment_path
+    return os.path.join(deployment_path, versions_folder_name, version)
+
+
+def read_manifest(version, deployment_path=None):
+    '''
+    Function to read the manifest of a deployed version
+    '''
+    with open(os.path.join(deployment_path or prod_deployment_path, versions_folder_name, version,
+                           manifest_file_name), 'r') as f:
+        return json.load(f)
+
+
+def verify_version(version, deployment_path=None):
+    '''
+    Function to check the files of a deployed version against its manifest checksums
+    '''
+    version_path = os.path.join(deployment_path or prod_deployment_path, versions_folder_name, version)
+    manifest = read_manifest(version, deployment_path)
+    for name, expected in manifest['files'].items():
+        try:
+            actual = file_fingerprint(os.path.join(version_path, name))
+        except OSError:
+            return False
+        if actual['sha256'] != expected['sha256'] or actual['size'] != expected['size']:
+            return False
+    return True
+
+
+def activate_version(version, deployment_path=None):
+    '''
+    Function to make version the served one by flipping the current link, O(1) whatever the model size
+    '''
+    deployment_path = deployment_path or prod_deployment_path
+    version_path = os.path.join(deployment_path, versions_folder_name, version)
+    if not os.path.isdir(version_path):
+        raise ValueError(f"Unknown deployment version {version}")
+    atomic_symlink(os.path.join(versions_folder_name, version), os.path.join(deployment_path, current_link_name))
+
+    # top-level names follow the current link, so they switch with it
+    for name in published_file_names:
+        path = os.path.join(deployment_path, name)
+        if os.path.exists(os.path.join(version_path, name)):
+            if os.path.islink(path) and os.readlink(path) == os.path.join(current_link_name, name):
+                continue
+            atomic_symlink(os.path.join(current_link_name, name), path)
+        elif os.path.lexists(path):
+            # never serve an artifact that belongs to another model
+            os.remove(path)
+    logging.info(f"Deployment: Version {version} is now current")
+
+
+def publish_version(files, deployment_path=None):
+    '''
+    Function to deploy files ({name: source path}) as a new immutable version and make it current.
+    The version directory is complete, checksummed and read-only before the current link moves.
+    Deploying the same files as the current version keeps that version. Returns the version.
+    '''
+    deployment_path = deployment_path or prod_deployment_path
+    versions_path = os.path.join(deployment_path, versions_folder_name)
+    os.makedirs(versions_path, exist_ok=True)
+    checksums = {}
+    for name, source_path in files.items():
+        fingerprint = file_fingerprint(source_path)
+        checksums[name] = {'sha256': fingerprint['sha256'], 'size': fingerprint['size']}
+
+    previous = current_version(deployment_path)
+    if previous is not None and read_manifest(previous, deployment_path)['files'] == checksums:
+        logging.info(f"Deployment: Files unchanged, version {previous} stays current")
+        return previous
+
+    version = f"{datetime.now():%Y%m%dT%H%M%S%f}-{checksums[model_file_name]['sha256'][:8]}"
+    tmp_path = os.path.join(versions_path, f".tmp-{version}")
+    os.makedirs(tmp_path)
+    for name, source_path in files.items():
+        shutil.copyfile(source_path, os.path.join(tmp_path, name))
+    manifest = {'version': version, 'created_at': datetime.now().isoformat(), 'previous': previous,
+                'files': checksums, 'sources': files}
+    with open(os.path.join(tmp_path, manifest_file_name), 'w') as f:
+        json.dump(manifest, f)
+    for name in os.listdir(tmp_path):
+        os.chmod(os.path.join(tmp_path, name), 0o444)
+    os.rename(tmp_path, os.path.join(versions_path, version))
+    annotate(files=len(files), bytes_written=sum(checksum['size'] for checksum in checksums.values()))
+    logging.info(f"Deployment: Version {version} written to {versions_path}")
+
+    activate_version(version, deployment_path)
+    collect_garbage(deployment_path=deployment_path)
+    return version
+
+
+def rollback(version=None, deployment_path=None):
+    '''
+    Function to serve an earlier version again, by default the one deployed before the current one
+    '''
+    deployment_path = deployment_path or prod_deployment_path
+    if version is None:
+        current = current_version(deployment_path)
+        version = read_manifest(current, deployment_path)['previous'] if current else None
+        if version is None:
+            raise ValueError("No previous deployment version to roll back to")
+    activate_version(version, deployment_path)
+    return version
+
+
+def collect_garbage(retention=None, deployment_path=None):
+    '''
+    Function to remove all but the newest retention versions, always keeping the current version
+    and its previous one, plus versions left half-written for more than an hour
+    '''
+    deployment_path = deployment_path or prod_deployment_path
+    retention = deployment_retention if retention is None else retention
+    versions_path = os.path.join(deployment_path, versions_folder_name)
+    versions = list_versions(deployment_path)
+    current = current_version(deployment_path)
+    keep = set(versions[-retention:] if retention > 0 else [])
+    if current is not None:
+        keep.add(current)
+        keep.add(read_manifest(current, deployment_path)['previous'])
+    removed = [version for version in versions if version not in keep]
+    for version in removed:
+        shutil.rmtree(os.path.join(versions_path, version))
+        logging.info(f"Deployment: Version {version} removed")
+    for name in os.listdir(versions_path) if os.path.isdir(versions_path) else []:
+        path = os.path.join(versions_path, name)
+        if name.startswith('.tmp-') and os.stat(path).st_mtime < time.time() - 3600:
+            shutil.rmtree(path)
+    return removed
+
+
 ####################function for deployment
+@traced('deployment')
 def store_model_into_pickle():
     #copy the latest pickle file, the latestscore.txt value, and the ingestfiles.txt file into the deployment directory
-    # Create the deployment directory if it doesn't exist
-    os.makedirs(prod_deployment_path, exist_ok=True)
-
-    # Copy the latest pickle file
+    # Collect the files by name, other .pkl or .txt files in those folders are not part of a deployment
     logging.info(f"Deployment: Model path: {model_folder_path}")
     logging.info(f"Deployment: Model files: {os.listdir(model_folder_path)}")
-    model_file_path = glob(os.path.join(model_folder_path, '*.pkl'))
-    if not model_file_path:
-        logging.error("Deployment: No pickle files found in model directory")
-        return
-    model_file_name = os.path.basename(model_file_path[0])  # gets just the filename
-    logging.info(f"Deployment: Model file name: {model_file_name}")
-
-    deployment_model_path = os.path.join(prod_deployment_path, model_file_name)
-    logging.info(f"Deployment: Model path: {deployment_model_path}")
-    shutil.copy(model_file_path[0], deployment_model_path)
-
-    # Copy the latestscore.txt file     
-    score_file_path = glob(os.path.join(model_folder_path, '*.txt'))
-    if not score_file_path:
-        logging.error("Deployment: No score files found in model directory")
-        return
-    score_file_name = os.path.basename(score_file_path[0])  # gets just the filename    
-    logging.info(f"Deployment: Score file name: {score_file_name}")
-    score_file_path = os.path.join(model_folder_path, score_file_name)
-    logging.info(f"Deployment: Score file path: {score_file_path}")
-    deployment_score_path = os.path.join(prod_deployment_path, score_file_name)
-    logging.info(f"Deployment: Score path: {deployment_score_path}")
-    shutil.copy(score_file_path, deployment_score_path)
-
-    # Copy the ingestedfiles.txt file
-    ingested_files_path = glob(os.path.join(dataset_folder_path, '*.txt'))
-    logging.info(f"Deployment: Ingested files path: {ingested_files_path}")
-
-    if not ingested_files_path:
-        logging.error("Deployment: No ingested files found in dataset directory")
-        return
-        
-    ingested_files_name = os.path.basename(ingested_files_path[0])  # gets just the filename
-    logging.info(f"Deployment: Ingested files name: {ingested_files_name}")
-    deployment_ingested_path = os.path.join(prod_deployment_path, ingested_files_name)
-    logging.info(f"Deployment: Ingested path: {deployment_ingested_path}")
-    shutil.copy(ingested_files_path[0], deployment_ingested_path)
-
-    logging.info("Deployment: Model, score, and ingested files copied to deployment directory")    
-        
+    files = {
+        model_file_name: os.path.join(model_folder_path, model_file_name),
+        score_file_name: os.path.join(model_folder_path, score_file_name),
+        record_file_name: os.path.join(dataset_folder_path, record_file_name)
+    }
+    for name, path in files.items():
+        if not os.path.exists(path):
+            logging.error(f"Deployment: {path} not found, nothing deployed")
+            return None
+
+    # Add the NumPy inference artifact, the drift reference and the model metadata, if training wrote them
+    for name in (numpy_model_file_name, drift_reference_file_name, metadata_file_name):
+        if os.path.exists(os.path.join(model_folder_path, name)):
+            files[name] = os.path.join(model_folder_path, name)
+    logging.info(f"Deployment: Deploying {files}")
+
+    version = publish_version(files)
+    logging.info(f"Deployment: Model, score, and ingested files deployed as version {version}")
+    return version
+
 
 if __name__ == "__main__":
-    store_model_into_pickle()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Deploy the trained model as a new version, or manage deployed versions")
+    parser.add_argument('--list', action='store_true', help="list deployed versions")
+    parser.add_argument('--rollback', nargs='?', const='', metavar='VERSION',
+                        help="serve VERSION again, by default the previous version")
+    parser.add_argument('--verify', metavar='VERSION', help="check a version's files against its checksums")
+    parser.add_argument('--gc', action='store_true', help="remove versions beyond the retention policy")
+    args = parser.parse_args()
+
+    if args.list:
+        for version in list_versions():
+            print(version, '(current)' if version == current_version() else '')
+    elif args.rollback is not None:
+        rollback(args.rollback or None)
+    elif args.verify:
+        print('ok' if verify_version(args.verify) else 'corrupted')
+    elif args.gc:
+        collect_garbage()
+    else:
+        store_model_into_pickle()
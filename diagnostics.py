@@ -1,20 +1,23 @@
 import pandas as pd
-import timeit
+import numpy as np
 import os
 import json
 import logging
-import pickle
-from ingestion import merge_multiple_dataframe
-from training import train_model
+import benchmark
+from datastore import load_dataset, dataset_path
+from modelregistry import get_model_cache
+from numpymodel import LinearModel, sigmoid
+from profiling import dataset_summary
+from instrumentation import traced, annotate
 import subprocess
 from tabulate import tabulate
+from settings import load_config
 
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 ##################Load config.json and get environment variables
-with open('config.json','r') as f:
-    config = json.load(f) 
+config = load_config()
 
 dataset_csv_path = os.path.join(config['output_folder_path']) 
 logging.info(f"Diagnostics: Dataset CSV path: {dataset_csv_path}")
@@ -29,25 +32,25 @@ data_filename = 'testdata.csv'
 data_path = os.path.join(test_data_path, data_filename)
 logging.info(f"Diagnostics: Data path: {data_path}")
 
+# timed runs of each stage in execution_time, the median is reported
+execution_time_repeats = config.get('execution_time_repeats', 3)
+
+# seconds before pip list --outdated is abandoned, it needs the network
+outdated_packages_timeout = config.get('outdated_packages_timeout', 300)
+
 
 
 
 ##################Function to get model predictions
+@traced('prediction')
 def model_predictions(df):
     '''
     Function to get the model predictions on the test data
     '''
     #read the deployed model and a test dataset, calculate predictions
-    #logging.info(f"Deployment listdir: {os.listdir(deployment_path)}")
-    model_name = [name for name in os.listdir(deployment_path) if '.pkl' in name][0]
-    #logging.info(f"Model name: {model_name}")
-    model_path = os.path.join(deployment_path, model_name)
-    logging.info(f"Diagnostics: Model path: {model_path}")
-    
+    #the model is loaded once per process and reloaded when a new one is deployed
     try:
-        with open(model_path, 'rb') as f:
-            model = pickle.load(f)
-        logging.info("Diagnostics: Model loaded successfully") 
+        model = get_model_cache(deployment_path).get()
     except Exception as e:
         logging.error(f"Diagnostics: Error loading model: {e}")
         return None
@@ -61,6 +64,7 @@ def model_predictions(df):
     # Make predictions on the test data
     predictions = model.predict(X_test)
     logging.info(f"Diagnostics: Predictions shape: {predictions.shape}")
+    annotate(rows=len(predictions))
     #logging.info(f"Predictions: {type(predictions)}")
     try :
         assert df.shape[0] == predictions.shape[0], "Predictions shape does not match test data shape"
@@ -70,23 +74,103 @@ def model_predictions(df):
 
     return predictions.tolist() #return value should be a list containing all predictions
 
+##################Functions for inline batch predictions
+# features the model is trained on when it does not record them itself (scikit-learn < 1.0)
+feature_columns = ['lastmonth_activity', 'lastyear_activity', 'number_of_employees']
+
+def deployed_model():
+    '''
+    Function to get the deployed model from the in-process cache
+    '''
+    return get_model_cache(deployment_path).get()
+
+
+def model_feature_names(model):
+    '''
+    Function to get the feature names the model was trained on, in order
+    '''
+    return [str(name) for name in getattr(model, 'feature_names_in_', feature_columns)]
+
+
+def features_from_payload(payload, feature_names):
+    '''
+    Function to build the feature matrix from inline JSON, either row records
+    {"records": [{feature: value, ...}, ...]} or columnar arrays {"columns": {feature: [values], ...}}.
+    Extra fields are ignored, a ValueError describes any mismatch with the model schema.
+    '''
+    if 'records' in payload:
+        records = payload['records']
+        if not isinstance(records, list) or not all(isinstance(record, dict) for record in records):
+            raise ValueError("'records' must be a list of objects")
+        missing = [name for name in feature_names if any(name not in record for record in records)]
+        if missing:
+            raise ValueError(f"records are missing features: {missing}")
+        values = [[record[name] for name in feature_names] for record in records]
+    elif 'columns' in payload:
+        columns = payload['columns']
+        if not isinstance(columns, dict):
+            raise ValueError("'columns' must be an object of arrays")
+        missing = [name for name in feature_names if name not in columns]
+        if missing:
+            raise ValueError(f"columns are missing features: {missing}")
+        if not all(isinstance(columns[name], list) for name in feature_names):
+            raise ValueError("every column must be an array")
+        if len({len(columns[name]) for name in feature_names}) > 1:
+            raise ValueError("columns must all have the same length")
+        values = [columns[name] for name in feature_names]
+    else:
+        raise ValueError("payload must contain 'records' or 'columns'")
+
+    # numpy would read JSON true/false as 1.0/0.0 and spread nested arrays over extra rows
+    if not all(value is None or (isinstance(value, (int, float)) and not isinstance(value, bool))
+               for row in values for value in row):
+        raise ValueError("feature values must be numbers")
+    rows = len(values) if 'records' in payload else len(values[0]) if values else 0
+    X = np.array(values, dtype=np.float64) if values else np.empty((0, len(feature_names)))
+    if 'columns' in payload:
+        X = X.T
+    if X.shape != (rows, len(feature_names)):
+        raise ValueError(f"expected {rows} rows of {len(feature_names)} features, got shape {X.shape}")
+    if np.isnan(X).any():
+        raise ValueError("feature values must not be missing")
+    return X
+
+
+def batch_predictions(X, model):
+    '''
+    Function to get the predicted labels and exit probabilities for a feature matrix
+    whose columns follow model_feature_names(model)
+    '''
+    if len(X) == 0:
+        return [], []
+    if hasattr(model, 'feature_names_in_') and not isinstance(model, LinearModel):
+        X = pd.DataFrame(X, columns=model.feature_names_in_, copy=False)
+    # one decision_function pass gives both outputs, exactly as predict and predict_proba compute them
+    decision = model.decision_function(X)
+    labels = model.classes_[(decision > 0).astype(int)]
+    probabilities = sigmoid(decision)
+    return labels.tolist(), probabilities.tolist()
+
 ##################Function to get summary statistics
 def dataframe_summary():
     '''
     Function to get the summary statistics (mean, median, std) of the dataset
     '''
-    #calculate summary statistics here
-    data_path = os.path.join(dataset_csv_path, 'finaldata.csv')
+    #read the summary statistics from the profile written at ingestion time
+    data_path = dataset_path(folder_path=dataset_csv_path)
     logging.info(f"Diagnostics: Data path: {data_path}")
     try:
-        data = pd.read_csv(data_path)
-        logging.info(f"Diagnostics: Data shape: {data.shape}")
+        summary = dataset_summary(dataset_csv_path)
+        logging.info(f"Diagnostics: Data rows: {summary['rows']}")
     except Exception as e:
         logging.error(f"Diagnostics: Error loading data: {e}")
         return None
-    numerical_columns = data.select_dtypes(include=['int64', 'float64']).columns
-    stats = data[numerical_columns].agg(['mean', 'median', 'std']).transpose() 
-    logging.info(f"Diagnostics: Summary statistics: {stats}")
+    numerical_columns = [column for column, profile in summary['columns'].items() if profile['numeric']]
+    stats = pd.DataFrame([[summary['columns'][column][stat] for stat in ('mean', 'median', 'std')]
+                          for column in numerical_columns],
+                         index=numerical_columns, columns=['mean', 'median', 'std'])
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug(f"Diagnostics: Summary statistics: {stats}")
 
     return stats
 
@@ -96,26 +180,28 @@ def missing_data():
     '''
     Function to get the percentage of missing data in the dataset
     '''
-    #calculate missing data
-    data_path = os.path.join(dataset_csv_path, 'finaldata.csv')
+    #read the missing data shares from the profile written at ingestion time
+    data_path = dataset_path(folder_path=dataset_csv_path)
     logging.info(f"Diagnostics: Data path: {data_path}")
-    data = pd.read_csv(data_path)
-    logging.info(f"Diagnostics: Data shape: {data.shape}")
-    missing_data = data.isna().sum()
-    percentage_missing = (missing_data / data.shape[0]) * 100
-    logging.info(f"Diagnostics: Percentage missing list: {percentage_missing.tolist()}")
+    summary = dataset_summary(dataset_csv_path)
+    logging.info(f"Diagnostics: Data rows: {summary['rows']}")
+    percentage_missing = [profile['missing_percentage'] for profile in summary['columns'].values()]
+    logging.info(f"Diagnostics: Percentage missing list: {percentage_missing}")
     logging.info("Computing shares of missing data successfully")
-    return percentage_missing.tolist()
+    return percentage_missing
 
 ##################Function to get timings
 def execution_time():
     '''
     Function to get the execution time of the ingestion and training processes
     '''
-    
-    ingestion_time = timeit.timeit(lambda: merge_multiple_dataframe(), number=1)
+    #time copies of the live source and test data in a temporary workspace, so nothing in production is overwritten
+    results = benchmark.run_sandboxed(['ingestion', 'training'], execution_time_repeats,
+                                      source_folder=config['input_folder_path'], test_data_folder=test_data_path,
+                                      trace_memory=False)
+    ingestion_time = results['ingestion']['median_seconds']
     logging.info(f"Diagnostics: Ingestion time: {ingestion_time}")
-    training_time = timeit.timeit(lambda: train_model(), number=1)
+    training_time = results['training']['median_seconds']
     logging.info(f"Diagnostics: Training time: {training_time}")
     return [ingestion_time, training_time]
 
@@ -127,7 +213,7 @@ def outdated_packages_list():
     
     # Get list of outdated packages using pip
     result = subprocess.run(['pip', 'list', '--outdated', '--format=json'], 
-                          capture_output=True, text=True)
+                          capture_output=True, text=True, timeout=outdated_packages_timeout)
     packages = json.loads(result.stdout)
     
     # Format data for tabulate
@@ -0,0 +1,277 @@
+# Importing necessary libraries
+import pandas as pd
+import numpy as np
+import os
+import io
+import json
+import logging
+import datastore
+import ingestion
+from instrumentation import traced, annotate
+from settings import load_config
+
+# Setting up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+##################Load config.json and get drift settings
+config = load_config()
+
+dataset_folder_path = os.path.join(config['output_folder_path'])
+deployment_path = os.path.join(config['prod_deployment_path'])
+output_model_path = os.path.join(config['output_model_path'])
+# quantile bins of the reference histograms, PSI above this also counts as drift (None only reports it)
+drift_histogram_bins = config.get('drift_histogram_bins', 10)
+logging.info(f"Drift: Histogram bins: {drift_histogram_bins}")
+drift_psi_threshold = config.get('drift_psi_threshold')
+logging.info(f"Drift: PSI threshold: {drift_psi_threshold}")
+# model versions whose running counts are kept
+drift_state_versions = config.get('drift_state_versions', 5)
+
+reference_file_name = 'driftreference.json'
+state_file_name = 'driftstate.json'
+# bytes of the last scored CSV line kept to check the scored rows are still there
+tail_bytes = 256
+
+
+##################Position of the scored rows in the ingested dataset
+def dataset_position(rows, offset=None, tail=None):
+    '''
+    Function to describe the first rows rows of the ingested dataset: the ingested source files they
+    came from and, for a CSV dataset, the byte offset they end at and the bytes just before it
+    '''
+    manifest = ingestion.load_manifest()
+    files = None
+    if manifest is not None:
+        files = [[name, manifest['files'][name]['sha256']] for name in manifest['ingested_files']]
+    return {'rows': rows, 'files': files, 'offset': offset, 'tail': tail.hex() if tail is not None else None}
+
+
+def csv_source_path(folder_path=None):
+    path = datastore.dataset_path(folder_path=folder_path)
+    return path if path.endswith('.csv') else None
+
+
+def read_csv_bytes(data_bytes, columns=None):
+    if columns is None:
+        return pd.read_csv(io.BytesIO(data_bytes), dtype={'corporation': str})
+    return pd.read_csv(io.BytesIO(data_bytes), header=None, names=columns, dtype={'corporation': str})
+
+
+def read_all_rows(folder_path=None):
+    '''
+    Function to read the whole ingested dataset with its position
+    '''
+    folder_path = folder_path or dataset_folder_path
+    path = csv_source_path(folder_path)
+    if path is None:
+        data = datastore.load_dataset(folder_path)
+        return data, dataset_position(len(data))
+    with open(path, 'rb') as f:
+        data_bytes = f.read()
+    data = read_csv_bytes(data_bytes)
+    return data, dataset_position(len(data), len(data_bytes), data_bytes[-tail_bytes:])
+
+
+def read_new_rows(position, columns, folder_path=None):
+    '''
+    Function to read only the rows ingested after position, or None when the dataset was rebuilt
+    in a way that changed the rows position describes
+    '''
+    folder_path = folder_path or dataset_folder_path
+    current = dataset_position(position['rows'])
+    # rows come from the source files in ingested order, earlier files keep their rows when later ones are added
+    if position['files'] is None or current['files'] is None \
+            or current['files'][:len(position['files'])] != position['files']:
+        return None
+
+    path = csv_source_path(folder_path)
+    if path is None:
+        data = datastore.load_dataset(folder_path)
+        if len(data) < position['rows']:
+            return None
+        return data.iloc[position['rows']:].reset_index(drop=True), dict(current, rows=len(data))
+    if position['offset'] is None:
+        return None
+    tail = bytes.fromhex(position['tail'])
+    with open(path, 'rb') as f:
+        f.seek(max(position['offset'] - len(tail), 0))
+        # a rewrite that reformatted the old rows moves or changes the tail
+        if f.read(len(tail)) != tail:
+            return None
+        new_bytes = f.read()
+    data = read_csv_bytes(new_bytes, columns) if new_bytes else pd.DataFrame(columns=columns)
+    offset = position['offset'] + len(new_bytes)
+    last_bytes = tail + new_bytes
+    return data, dict(current, rows=position['rows'] + len(data), offset=offset, tail=last_bytes[-tail_bytes:].hex())
+
+
+##################Histograms, confusion counts and drift statistics
+def histogram_edges(values, bins=None):
+    '''
+    Function to get quantile bin edges of a feature, the outer bins are open-ended
+    '''
+    bins = drift_histogram_bins if bins is None else bins
+    return np.unique(np.quantile(np.asarray(values, dtype=np.float64), np.linspace(0, 1, bins + 1))[1:-1]).tolist()
+
+
+def histogram_counts(values, edges):
+    indices = np.searchsorted(np.asarray(edges), np.asarray(values, dtype=np.float64), side='right')
+    return np.bincount(indices, minlength=len(edges) + 1).tolist()
+
+
+def confusion_counts(y_true, y_pred):
+    '''
+    Function to get the [tn, fp, fn, tp] counts of binary labels
+    '''
+    cells = np.asarray(y_true, dtype=np.int64) * 2 + np.asarray(y_pred, dtype=np.int64)
+    return np.bincount(cells, minlength=4)[:4].tolist()
+
+
+def f1_from_counts(counts):
+    _, fp, fn, tp = counts
+    # same as sklearn.metrics.f1_score, including 0.0 when there are no positives at all
+    return 2 * tp / (2 * tp + fp + fn) if tp + fp + fn else 0.0
+
+
+def psi(expected, actual, epsilon=1e-4):
+    '''
+    Function to get the population stability index between two histograms over the same bins
+    '''
+    expected = np.maximum(np.asarray(expected, dtype=np.float64) / max(sum(expected), 1), epsilon)
+    actual = np.maximum(np.asarray(actual, dtype=np.float64) / max(sum(actual), 1), epsilon)
+    return float(np.sum((actual - expected) * np.log(actual / expected)))
+
+
+def ks(expected, actual):
+    '''
+    Function to get the Kolmogorov-Smirnov distance between two histograms over the same bins
+    '''
+    expected_cdf = np.cumsum(expected) / max(sum(expected), 1)
+    actual_cdf = np.cumsum(actual) / max(sum(actual), 1)
+    return float(np.max(np.abs(expected_cdf - actual_cdf)))
+
+
+##################Reference written at training time
+def write_reference(model, chunks, folder_path=None, model_folder_path=None):
+    '''
+    Function to store the reference histograms of the training features, the position of the
+    training rows in the ingested dataset and the model's confusion counts on them, so the deployed
+    model's drift checks start from there instead of re-predicting the training rows.
+    chunks is an iterable of (X, y) covering the training rows, the bin edges come from the first one.
+    '''
+    folder_path = folder_path or dataset_folder_path
+    path = csv_source_path(folder_path)
+    offset = tail = None
+    if path is not None:
+        offset = os.path.getsize(path)
+        with open(path, 'rb') as f:
+            f.seek(max(offset - tail_bytes, 0))
+            tail = f.read()
+    rows = 0
+    confusion = [0, 0, 0, 0]
+    features = {}
+    for X, y in chunks:
+        if not features:
+            features = {column: {'edges': histogram_edges(X[column])} for column in X.columns}
+            for feature in features.values():
+                feature['counts'] = [0] * (len(feature['edges']) + 1)
+        rows += len(X)
+        confusion = [a + b for a, b in zip(confusion, confusion_counts(y, model.predict(X)))]
+        for column, feature in features.items():
+            feature['counts'] = [a + b for a, b in zip(feature['counts'], histogram_counts(X[column], feature['edges']))]
+    reference = {'position': dataset_position(rows, offset, tail), 'confusion': confusion, 'features': features}
+
+    reference_path = os.path.join(model_folder_path or output_model_path, reference_file_name)
+    with open(reference_path + '.tmp', 'w') as f:
+        json.dump(reference, f)
+    os.replace(reference_path + '.tmp', reference_path)
+    logging.info(f"Drift: Reference of {rows} training rows saved to {reference_path}")
+
+
+def load_json(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+##################Incremental drift check
+@traced('drift_check')
+def check_drift():
+    '''
+    Function to update the deployed model's running confusion counts with the rows ingested since
+    its last check, and the histograms of those rows against the training reference.
+    Returns the F1 score over the whole dataset, as a full re-prediction would give it, plus
+    PSI and KS per feature and whether distribution drift passed drift_psi_threshold.
+    '''
+    from deployment import current_version_path
+    from diagnostics import model_feature_names
+    from modelregistry import get_model_cache
+
+    cache = get_model_cache(deployment_path)
+    model = cache.get()
+    version = cache.version()
+    reference = load_json(os.path.join(current_version_path(deployment_path), reference_file_name))
+    state_path = os.path.join(output_model_path, state_file_name)
+    state = load_json(state_path) or {'versions': {}}
+
+    entry = state['versions'].get(version)
+    if entry is None and reference is not None:
+        # a new model starts from the rows it was trained on
+        entry = {'position': reference['position'], 'confusion': reference['confusion'],
+                 'histograms': {column: [0] * len(feature['counts']) for column, feature in reference['features'].items()}}
+    # counts kept before the version had a reference have no histograms to add to, every row is scored again
+    rebuild = entry is not None and reference is not None and entry.get('histograms') is None
+
+    columns = list(pd.read_csv(csv_source_path(dataset_folder_path), nrows=0).columns) \
+        if csv_source_path(dataset_folder_path) else None
+    new_rows = read_new_rows(entry['position'], columns) if entry is not None and not rebuild else None
+    if new_rows is None:
+        logging.info(f"Drift: Scoring every row for model version {version}")
+        data, position = read_all_rows()
+        confusion = [0, 0, 0, 0]
+        mode = 'full'
+    else:
+        data, position = new_rows
+        confusion = entry['confusion']
+        mode = 'incremental'
+    logging.info(f"Drift: Scoring {len(data)} rows ({mode})")
+    annotate(rows=len(data), mode=mode)
+
+    if len(data):
+        predictions = model.predict(data[model_feature_names(model)])
+        confusion = [a + b for a, b in zip(confusion, confusion_counts(data['exited'], predictions))]
+
+    histograms = None
+    if reference is not None:
+        histograms = {}
+        for column, feature in reference['features'].items():
+            counts = histogram_counts(data[column], feature['edges']) if len(data) else [0] * len(feature['counts'])
+            if mode == 'full':
+                # rows beyond the training rows are the whole dataset minus the reference
+                histograms[column] = [max(c - r, 0) for c, r in zip(counts, feature['counts'])]
+            else:
+                histograms[column] = [a + b for a, b in zip(entry['histograms'][column], counts)]
+
+    # the most recently checked versions are kept
+    state['versions'].pop(version, None)
+    state['versions'][version] = {'position': position, 'confusion': confusion, 'histograms': histograms}
+    for old_version in list(state['versions'])[:-drift_state_versions]:
+        del state['versions'][old_version]
+    with open(state_path + '.tmp', 'w') as f:
+        json.dump(state, f)
+    os.replace(state_path + '.tmp', state_path)
+
+    features = {}
+    if histograms is not None:
+        for column, feature in reference['features'].items():
+            if sum(histograms[column]):
+                features[column] = {'psi': psi(feature['counts'], histograms[column]),
+                                    'ks': ks(feature['counts'], histograms[column])}
+    distribution_drift = drift_psi_threshold is not None and any(
+        statistics['psi'] > drift_psi_threshold for statistics in features.values())
+    return {'model_version': version, 'mode': mode, 'rows_scored': len(data), 'rows': position['rows'],
+            'confusion': confusion, 'f1_score': f1_from_counts(confusion), 'features': features,
+            'distribution_drift': distribution_drift}
@@ -0,0 +1,43 @@
+# Importing necessary libraries
+import os
+import hashlib
+
+
+##################Content fingerprints of files
+def file_fingerprint(file_path, previous=None):
+    '''
+    Function to get the size, mtime and sha256 content hash of a source file.
+    The hash is reused from the previous fingerprint when size and mtime are unchanged.
+    '''
+    stat = os.stat(file_path)
+    fingerprint = {'size': stat.st_size, 'mtime': stat.st_mtime}
+    if previous and previous['size'] == fingerprint['size'] and previous['mtime'] == fingerprint['mtime']:
+        fingerprint['sha256'] = previous['sha256']
+        return fingerprint
+
+    sha256 = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha256.update(block)
+    fingerprint['sha256'] = sha256.hexdigest()
+    return fingerprint
+
+
+def fingerprint_paths(paths, previous=None):
+    '''
+    Function to fingerprint files, and the files inside directories, reusing previous
+    content hashes when size and mtime are unchanged. Missing paths fingerprint as None.
+    '''
+    previous = previous or {}
+    fingerprints = {}
+    for path in paths:
+        if os.path.isdir(path):
+            files = sorted(os.path.join(root, name) for root, _, names in os.walk(path) for name in names)
+        else:
+            files = [path]
+        for file_path in files:
+            try:
+                fingerprints[file_path] = file_fingerprint(file_path, previous.get(file_path))
+            except OSError:
+                fingerprints[file_path] = None
+    return fingerprints
@@ -1,48 +1,56 @@
 # Importing libraries
 import os
-from ingestion import merge_multiple_dataframe
-from diagnostics import model_predictions, dataframe_summary, missing_data, execution_time, outdated_packages_list
-from deployment import store_model_into_pickle
-from training import train_model
-from scoring import score_model
-from sklearn import metrics
-from reporting import cm_model
 import json
 import logging
-import pandas as pd
+from functools import partial
+from settings import load_config, save_config
+from pipeline import Stage, Pipeline
 
 # Setting up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-# Loading configuration
-with open('config.json','r') as f:
-    config = json.load(f) 
+# Production paths every stage reads and writes
+production_paths = {'input_folder_path': 'sourcedata', 'output_model_path': 'models'}
 
-# Modifying config 
-config['input_folder_path'] = 'sourcedata'
-config['output_model_path'] = 'models'
 
-# Saving updated config
-logging.info(f"Fullprocess: Config: {config}")
-with open('config.json','w') as f:
-    json.dump(config, f)
-logging.info("Fullprocess: Config updated successfully")
+def production_config(config=None):
+    '''
+    Function to get the config with the production paths, saved to config.json when they differ, so the
+    pipeline modules read them when their stage first imports them
+    '''
+    config = load_config() if config is None else config
+    if any(config.get(key) != value for key, value in production_paths.items()):
+        config.update(production_paths)
+        save_config(config)
+        logging.info("Fullprocess: Config updated successfully")
+    return config
 
-# Define the paths
-input_folder_path = os.path.join(config['input_folder_path'])
-logging.info(f"Fullprocess: Input folder path: {input_folder_path}")
-output_folder_path = os.path.join(config['output_folder_path'])
-logging.info(f"Fullprocess: Output folder path: {output_folder_path}")
-output_model_path = os.path.join(config['output_model_path'])
-logging.info(f"Fullprocess: Output model path: {output_model_path}")
 
-# Main function
-def main():
-    ##################Check and read new data
+##################Stage inputs and outputs
+def source_files(config):
+    input_folder_path = config['input_folder_path']
+    return [os.path.join(input_folder_path, f) for f in os.listdir(input_folder_path) if f.endswith('.csv')]
+
+
+def ingested_dataset(config):
+    from datastore import dataset_path
+    return [dataset_path(folder_path=config['output_folder_path'])]
+
+
+def model_files(folder_path):
+    # the numpy export sits next to the pickle when training wrote one
+    numpy_model = os.path.join(folder_path, 'trainedmodel.npz')
+    return [os.path.join(folder_path, 'trainedmodel.pkl')] + ([numpy_model] if os.path.exists(numpy_model) else [])
+
+
+##################Check and read new data
+def check_new_data(config=None):
+    '''
+    Function to check for source files not ingested by the deployed model
+    '''
+    config = load_config() if config is None else config
     #first, read ingestedfiles.txt
-    deployment_path = os.path.join(config['prod_deployment_path'])
-    logging.info(f"Fullprocess: Deployment path: {deployment_path}")
-    deployment_data = os.path.join(deployment_path, 'ingestedfiles.txt')
+    deployment_data = os.path.join(config['prod_deployment_path'], 'ingestedfiles.txt')
     logging.info(f"Fullprocess: Deployment data: {deployment_data}") 
 
     # Reading ingestedfiles.txt
@@ -53,19 +61,14 @@ def main():
             logging.info(f"Fullprocess: Ingested data: {ingested_data}")
     except Exception as e:
         logging.error(f"Fullprocess: Error reading ingestedfiles.txt: {e}")
-        return  
+        return False
 
     # Extracting old CSV files
     old_csv_files = ingested_data['ingested_files'] 
     logging.info(f"Fullprocess: Old CSV files: {old_csv_files}")
 
-
-    # Checking if there are new CSV files
-    input_folder_path = os.path.join(config['input_folder_path'])
-    logging.info(f"Fullprocess: Input folder path: {input_folder_path}")
-
     # Extracting new CSV files
-    new_csv_files = [f for f in os.listdir(input_folder_path) if f.endswith('.csv')]
+    new_csv_files = [f for f in os.listdir(config['input_folder_path']) if f.endswith('.csv')]
     logging.info(f"Fullprocess: New CSV files found: {new_csv_files}")
 
     # Checking for new CSV files
@@ -77,16 +80,18 @@ def main():
         logging.info("Fullprocess: New data found. Proceeding with the process.")
     else:
         logging.info("Fullprocess: No new data found. Ending the process.")
-        exit()
+    return bool(new_csv)
+
 
-    ##################Deciding whether to proceed, part 1
-    #if you found new data, you should proceed. otherwise, do end the process here
-    merge_multiple_dataframe()
-    logging.info("Fullprocess: Merge multiple dataframe completed")
+##################Checking for model drift
+def check_model_drift(config=None):
+    '''
+    Function to check whether the deployed model scores worse on the newest ingested data than its deployed score
+    '''
+    from drift import check_drift
 
-    ##################Checking for model drift
-    #check whether the score from the deployed model is different from the score from the model that uses the newest ingested data
-    deployed_score_file = os.path.join(deployment_path, 'latestscore.txt')
+    config = load_config() if config is None else config
+    deployed_score_file = os.path.join(config['prod_deployment_path'], 'latestscore.txt')
     logging.info(f"Full process: Deployed score file: {deployed_score_file}")
 
     # Reading the deployed score
@@ -94,61 +99,96 @@ def main():
         deployed_score = float(file.read().strip())
     logging.info(f"Full process: Deployed score: {deployed_score}")
 
-    # Reading the new data
-    new_data_path = os.path.join(config['output_folder_path'], 'finaldata.csv') 
-    logging.info(f"Full process: New data path: {new_data_path}")
-    new_data = pd.read_csv(new_data_path)
-    logging.info(f"Full process: New data: {new_data.head()}")
-
-    # Making predictions from new data
-    predictions = model_predictions(new_data)
-    logging.info(f"Full process: Model predictions: {predictions}")
-
-    # Calculating F1 score from new data
-    y_test = new_data['exited']
-    f1_score = metrics.f1_score(y_test, predictions)
+    # Scoring the rows ingested since the last check, the F1 score covers the whole new data
+    drift = check_drift()
+    logging.info(f"Full process: Drift check: {drift}")
+    f1_score = drift['f1_score']
     logging.info(f"Full process: F1 score: {f1_score}")
 
     # Checking for model drift
     if f1_score < deployed_score:
         logging.info("Full process: Model drift detected. Proceeding with re-deployment.")
-    else:
-        logging.info("Full process: No model drift detected. Ending the process.")
-        exit()
-
-    ##################Deciding whether to proceed, part 2
-    #if you found model drift, you should proceed. otherwise, do end the process here
-    
-    # Re-training the model
-    train_model()
-    logging.info("Full process: Model re-training completed")
-
-    # Re-scoring the model
-    score_model()
-    logging.info("Full process: Model re-scoring completed")
-
-    ##################Re-deployment
-    #if you found evidence for model drift, re-run the deployment.py script
-    store_model_into_pickle()
-    logging.info("Full process: Model re-deployment completed")
-
-    ##################Diagnostics and reporting
-    #run diagnostics.py and reporting.py for the re-deployed model
-    cm_model()
-    logging.info("Full process: Confusion matrix completed")
-    dataframe_summary()
-    logging.info("Full process: Dataframe summary completed")
-    missing_data()
-    logging.info("Full process: Missing data completed")
-    execution_time()
-    logging.info("Full process: Execution time completed")
-    outdated_packages_list()
-    logging.info("Full process: Outdated packages list completed")
-
-if __name__ == "__main__":
-    main()
-
-
+        return True
+    if drift['distribution_drift']:
+        logging.info("Full process: Feature distribution drift detected. Proceeding with re-deployment.")
+        return True
+    logging.info("Full process: No model drift detected. Ending the process.")
+    return False
+
+
+##################Diagnostics and reporting
+def confusion_matrix(config=None):
+    '''
+    Function to plot the confusion matrix, ROC curve and score history of the re-deployed model on the test data
+    '''
+    import pandas as pd
+    from reporting import cm_model
+    config = load_config() if config is None else config
+    cm_model(pd.read_csv(os.path.join(config['test_data_path'], 'testdata.csv')))
+
+
+##################Pipeline definition
+def build_pipeline(config=None):
+    '''
+    Function to declare the full process as stages with their inputs and outputs:
+    new data check -> ingestion -> drift check -> training -> scoring -> deployment,
+    then the independent diagnostics and reporting stages side by side
+    '''
+    config = load_config() if config is None else config
+    input_folder_path = config['input_folder_path']
+    output_folder_path = config['output_folder_path']
+    output_model_path = config['output_model_path']
+    deployment_path = config['prod_deployment_path']
+    test_data_path = config['test_data_path']
+    logging.info(f"Fullprocess: Input folder path: {input_folder_path}")
+    logging.info(f"Fullprocess: Deployment path: {deployment_path}")
+    deployed_files = [os.path.join(deployment_path, f) for f in ('trainedmodel.pkl', 'latestscore.txt', 'ingestedfiles.txt')]
+    test_data_file = os.path.join(test_data_path, 'testdata.csv')
+    stages = [
+        Stage('check_new_data', partial(check_new_data, config), gate=True,
+              inputs=lambda: source_files(config) + [os.path.join(deployment_path, 'ingestedfiles.txt')]),
+        Stage('ingestion', 'ingestion:merge_multiple_dataframe', deps=['check_new_data'],
+              inputs=partial(source_files, config),
+              outputs=lambda: ingested_dataset(config) + [os.path.join(output_folder_path, 'ingestedfiles.txt')]),
+        # gate results are cached too, the same data and deployed model give the same answer
+        Stage('check_model_drift', partial(check_model_drift, config), deps=['ingestion'], gate=True,
+              inputs=lambda: ingested_dataset(config) + model_files(deployment_path)
+              + [os.path.join(deployment_path, 'latestscore.txt')]),
+        Stage('training', 'training:train_model', deps=['check_model_drift'],
+              inputs=partial(ingested_dataset, config),
+              outputs=lambda: model_files(output_model_path)),
+        Stage('scoring', 'scoring:score_model', deps=['training'],
+              inputs=lambda: model_files(output_model_path) + [test_data_file],
+              outputs=[os.path.join(output_model_path, 'latestscore.txt')]),
+        Stage('deployment', 'deployment:store_model_into_pickle', deps=['scoring'],
+              inputs=lambda: model_files(output_model_path) + [os.path.join(output_model_path, 'latestscore.txt'),
+                                                               os.path.join(output_folder_path, 'ingestedfiles.txt')],
+              outputs=deployed_files),
+        Stage('confusion_matrix', partial(confusion_matrix, config), deps=['deployment'],
+              inputs=lambda: model_files(deployment_path) + [test_data_file],
+              outputs=[os.path.join(output_model_path, name)
+                       for name in ('confusion_matrix.png', 'roc_curve.png', 'score_history.png')]),
+        Stage('summary_stats', 'diagnostics:dataframe_summary', deps=['deployment'],
+              inputs=partial(ingested_dataset, config)),
+        Stage('missing_data', 'diagnostics:missing_data', deps=['deployment'],
+              inputs=partial(ingested_dataset, config)),
+        Stage('execution_time', 'diagnostics:execution_time', deps=['deployment'],
+              inputs=lambda: source_files(config) + [test_data_file]),
+        # installed packages can go out of date without any file here changing
+        Stage('outdated_packages', 'diagnostics:outdated_packages_list', deps=['deployment'], cache=False)
+    ]
+    return Pipeline(stages, state_path=os.path.join(output_model_path, 'pipelinestate.json'),
+                    run_path=os.path.join(output_model_path, 'pipelinerun.json'),
+                    history_path=os.path.join(output_model_path, 'pipelineruns.jsonl'),
+                    trace_path=os.path.join(output_model_path, 'pipelinetrace.json'))
 
 
+# Main function
+def main(config=None):
+    run = build_pipeline(production_config(config)).run()
+    for name, stage in run['stages'].items():
+        logging.info(f"Full process: {name}: {stage['status']} {stage.get('seconds', 0):.3f}s")
+    return run
 
+if __name__ == "__main__":
+    main()
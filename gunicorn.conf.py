@@ -0,0 +1,74 @@
+# Gunicorn settings for serving app.py in production: gunicorn -c gunicorn.conf.py wsgi:app
+import os
+import signal
+import threading
+import time
+import logging
+from settings import load_config
+
+# Setting up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+##################Load config.json and get serving settings
+# not named config, gunicorn reads every name in this file as a setting and config is one of them
+serving_config = load_config()
+
+bind = serving_config.get('serving_bind', '0.0.0.0:8000')
+# prediction is CPU-bound numpy work that releases the GIL for part of it, so a few processes
+# with a few threads each; workers defaults to one per core plus one
+workers = serving_config.get('serving_workers') or (os.cpu_count() or 1) + 1
+threads = serving_config.get('serving_threads', 4)
+worker_class = 'gthread'
+timeout = serving_config.get('serving_timeout', 60)
+graceful_timeout = serving_config.get('serving_graceful_timeout', 30)
+keepalive = serving_config.get('serving_keepalive', 5)
+# recycle workers now and then, spread out so they do not all restart together
+max_requests = serving_config.get('serving_max_requests', 0)
+max_requests_jitter = max(max_requests // 10, 0)
+# import the app and load the deployed model once in the master, workers share it copy-on-write
+preload_app = True
+# seconds between two checks of the deployment directory for a new model version
+serving_deploy_check_interval = serving_config.get('serving_deploy_check_interval', 2.0)
+logging.info(f"Gunicorn: Configured for {workers} workers x {threads} threads on {bind}")
+
+
+##################Server hooks
+def watch_deployments(server):
+    '''
+    Runs in the master: when a new model version is deployed, loads it in the master and
+    gracefully replaces the workers, so the new workers share the new model copy-on-write
+    '''
+    import wsgi
+    cache = wsgi.model_cache()
+    # the version preloaded by the master, None when nothing was deployed yet: the first deployment
+    # then reloads the workers like any later one
+    version = cache.loaded_version()
+    error = None
+    while True:
+        time.sleep(serving_deploy_check_interval)
+        try:
+            latest = cache.version()
+        except Exception as e:
+            # logged once, not every check while nothing is deployed
+            if str(e) != error:
+                server.log.error(f"Gunicorn: Cannot read the deployed model: {e}")
+                error = str(e)
+            continue
+        error = None
+        if latest != version:
+            server.log.info(f"Gunicorn: Model version {latest} deployed, reloading workers")
+            version = latest
+            wsgi.preload()
+            os.kill(os.getpid(), signal.SIGHUP)
+
+
+def when_ready(server):
+    if serving_deploy_check_interval:
+        threading.Thread(target=watch_deployments, args=(server,), name='deployment-watcher', daemon=True).start()
+
+
+def post_fork(server, worker):
+    # a lock held by the master's watcher thread at fork time would never be released in the worker
+    import wsgi
+    wsgi.reset_locks()
@@ -1,80 +1,609 @@
-import pandas as pd
-import os
-import json
-from datetime import datetime
-import logging
-
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-
-
-
-
-#############Load config.json and get input and output paths
-with open('config.json','r') as f:
-    config = json.load(f) 
-logging.info("Ingestion: Config loaded successfully")
-logging.info(f"Ingestion: Config: {config}")
-
-input_folder_path = config['input_folder_path']
-logging.info(f"Ingestion: Input folder path: {input_folder_path}")
-output_folder_path = config['output_folder_path']
-logging.info(f"Ingestion: Output folder path: {output_folder_path}")
-
-#  get today's date
-today = datetime.now().strftime("%Y-%m-%d")
-
-
-#############Function for data ingestion
-def merge_multiple_dataframe():
-
-    # Create output directory if it doesn't exist
-    os.makedirs(output_folder_path, exist_ok=True)
-    
-    # check for datasets, compile them together, and write to an output file
-    data_files = os.listdir(input_folder_path)
-    logging.info(f"Ingestion: Data files: {data_files}")
-    files_names = [file for file in data_files if file.endswith('.csv')]
-    logging.info(f"Ingestion: Files names: {files_names}")
-
-
-    if len(files_names) == 0:
-        logging.error("Ingestion: No data files found")
-        return
-    
-    # read the first file
-    final_data = pd.read_csv(os.path.join(input_folder_path, files_names[0]))
-    logging.info(f"Ingestion: Data Shape: {final_data.shape}")
-
-    # read the rest of the files
-    for file in files_names[1:]:
-        data = pd.read_csv(os.path.join(input_folder_path, file))
-        logging.info(f"Ingestion: Data Shape: {data.shape}")
-        final_data = pd.concat([final_data, data])
-        logging.info(f"Ingestion: Final Data Shape: {final_data.shape}")
-
-    # drop duplicates
-    final_data.drop_duplicates(inplace=True)
-    logging.info(f"Ingestion: Final Data Shape after dropping duplicates: {final_data.shape}")
-
-    file_name = 'finaldata.csv'
-    final_data.to_csv(os.path.join(output_folder_path, file_name), index=False)
-    logging.info("Ingestion: Data ingestion completed successfully")
-
-    record_file_name = 'ingestedfiles.txt'
-    record = {
-        'ingestion_date': today,
-        'file_name': file_name,
-        'input_folder_path': input_folder_path,
-        'output_folder_path': output_folder_path,
-        'ingested_files': files_names
-    }
-    
-    record_file_path = os.path.join(output_folder_path, record_file_name)    
-    # Write record to file (overwrite mode)
-    with open(record_file_path, 'w') as f: 
-        f.write(json.dumps(record) + '\n')
-    logging.info("Ingestion: Record file created/updated successfully")
-
-
-if __name__ == '__main__':
-    merge_multiple_dataframe()
+import pandas as pd
+import numpy as np
+import os
+import io
+import json
+import mmap
+import itertools
+import tempfile
+import tracemalloc
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+import logging
+import datastore
+import profiling
+from fingerprints import file_fingerprint
+from instrumentation import traced, annotate
+from settings import load_config
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+try:
+    import pyarrow
+except ImportError:  # pandas only parses strings into Arrow memory when it is installed
+    pyarrow = None
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+
+
+#############Load config.json and get input and output paths
+config = load_config()
+logging.info("Ingestion: Config loaded successfully")
+
+input_folder_path = config['input_folder_path']
+logging.info(f"Ingestion: Input folder path: {input_folder_path}")
+output_folder_path = config['output_folder_path']
+logging.info(f"Ingestion: Output folder path: {output_folder_path}")
+incremental_ingestion = config.get('incremental_ingestion', False)
+logging.info(f"Ingestion: Incremental ingestion: {incremental_ingestion}")
+streaming_ingestion = config.get('streaming_ingestion', False)
+logging.info(f"Ingestion: Streaming ingestion: {streaming_ingestion}")
+ingestion_memory_budget_mb = config.get('ingestion_memory_budget_mb', 256)
+logging.info(f"Ingestion: Memory budget (MB): {ingestion_memory_budget_mb}")
+ingestion_workers = config.get('ingestion_workers', 1)
+logging.info(f"Ingestion: Workers: {ingestion_workers}")
+ingestion_executor = config.get('ingestion_executor', 'process')
+logging.info(f"Ingestion: Executor: {ingestion_executor}")
+
+file_name = 'finaldata.csv'
+record_file_name = 'ingestedfiles.txt'
+manifest_file_name = 'ingestionmanifest.json'
+row_hashes_file_name = 'rowhashes.npy'
+stats_file_name = 'ingestionstats.json'
+
+# known schema of the source datasets, numeric columns fall back to inference when they hold missing values
+schema_dtypes = {
+    'corporation': str,
+    'lastmonth_activity': 'int64',
+    'lastyear_activity': 'int64',
+    'number_of_employees': 'int64',
+    'exited': 'int64'
+}
+
+
+#############Functions for reading source files
+def read_dataset(file_path):
+    '''
+    Function to read one source file with the explicit schema dtypes
+    '''
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            return pd.read_csv(file_path, dtype=schema_dtypes)
+    except (ValueError, TypeError):
+        # an integer column has missing or non-integer values, let pandas infer it like before
+        return pd.read_csv(file_path, dtype={'corporation': str})
+
+
+def read_datasets(files_names, workers=None, executor=None):
+    '''
+    Function to read source files, in parallel when workers > 1 (default from config 'ingestion_workers').
+    executor is 'process' or 'thread' (default from config 'ingestion_executor').
+    The frames are returned in the order of files_names.
+    '''
+    if workers is None:
+        workers = ingestion_workers
+    if executor is None:
+        executor = ingestion_executor
+    file_paths = [os.path.join(input_folder_path, file) for file in files_names]
+    workers = min(workers, len(file_paths))
+    if workers <= 1:
+        datasets = [read_dataset(file_path) for file_path in file_paths]
+    else:
+        pool_class = ThreadPoolExecutor if executor == 'thread' else ProcessPoolExecutor
+        logging.info(f"Ingestion: Reading {len(file_paths)} files with {workers} {executor} workers")
+        with pool_class(max_workers=workers) as pool:
+            datasets = list(pool.map(read_dataset, file_paths))
+    annotate(files=len(file_paths), rows=sum(len(data) for data in datasets),
+             bytes_read=sum(os.path.getsize(file_path) for file_path in file_paths))
+    return datasets
+
+
+#############Helpers for incremental ingestion
+def row_hashes(data):
+    '''
+    Function to get one uint64 hash per row, with numeric columns normalised to float64
+    so that a row hashes the same whether pandas parsed its column as int or float
+    '''
+    # one converted copy per column, without copying the whole frame first
+    numerical_columns = set(data.select_dtypes(include='number').columns)
+    normalised = pd.DataFrame({column: values.astype('float64' if column in numerical_columns else object)
+                               for column, values in data.items()}, copy=False)
+    return pd.util.hash_pandas_object(normalised, index=False).to_numpy(dtype=np.uint64)
+
+
+def load_manifest():
+    '''
+    Function to load the ingestion manifest, returns None if there is none yet
+    '''
+    manifest_path = os.path.join(output_folder_path, manifest_file_name)
+    try:
+        with open(manifest_path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_manifest(manifest):
+    '''
+    Function to atomically write the ingestion manifest
+    '''
+    manifest_path = os.path.join(output_folder_path, manifest_file_name)
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, manifest_path)
+
+
+def load_row_hashes():
+    '''
+    Function to load the persisted set of row hashes, returns None if there is none yet
+    '''
+    try:
+        return np.load(os.path.join(output_folder_path, row_hashes_file_name))
+    except (OSError, ValueError):
+        return None
+
+
+def save_row_hashes(hashes):
+    '''
+    Function to atomically write the persisted set of row hashes (sorted, unique)
+    '''
+    hashes_path = os.path.join(output_folder_path, row_hashes_file_name)
+    tmp_path = hashes_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.save(f, np.unique(hashes))
+    os.replace(tmp_path, hashes_path)
+
+
+def write_record(files_names):
+    '''
+    Function to write the ingestedfiles.txt record
+    '''
+    # the date of this run, the watcher daemon keeps this module loaded across days
+    record = {
+        'ingestion_date': datetime.now().strftime("%Y-%m-%d"),
+        'file_name': file_name,
+        'input_folder_path': input_folder_path,
+        'output_folder_path': output_folder_path,
+        'ingested_files': files_names
+    }
+
+    record_file_path = os.path.join(output_folder_path, record_file_name)
+    # Write record to file (overwrite mode)
+    with open(record_file_path, 'w') as f:
+        f.write(json.dumps(record) + '\n')
+    logging.info("Ingestion: Record file created/updated successfully")
+
+
+def write_manifest(files_names, fingerprints, final_data):
+    '''
+    Function to persist the manifest and row hash set describing finaldata.csv
+    '''
+    save_row_hashes(row_hashes(final_data))
+    save_manifest({
+        'input_folder_path': input_folder_path,
+        'ingested_files': files_names,
+        'files': fingerprints,
+        'dtypes': {column: str(dtype) for column, dtype in final_data.dtypes.items()}
+    })
+    logging.info("Ingestion: Manifest created/updated successfully")
+
+
+def discard_manifest():
+    '''
+    Function to remove the manifest and row hash set once they no longer describe finaldata.csv,
+    the next incremental run then starts with a full rebuild
+    '''
+    for name in (manifest_file_name, row_hashes_file_name):
+        path = os.path.join(output_folder_path, name)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+#############Function for incremental data ingestion
+def merge_new_dataframes(files_names):
+    '''
+    Function to merge only new source files into the existing finaldata.csv.
+    Returns False when an incremental merge is not possible and a full rebuild is needed.
+    The output is identical to a full rebuild, which reads the files in sorted name order.
+    '''
+    manifest = load_manifest()
+    existing_hashes = load_row_hashes()
+    final_data_path = os.path.join(output_folder_path, file_name)
+    if manifest is None or existing_hashes is None or not datastore.dataset_exists(output_folder_path):
+        logging.info("Ingestion: No manifest found, falling back to full rebuild")
+        return False
+    if manifest['input_folder_path'] != input_folder_path:
+        logging.info("Ingestion: Input folder changed, falling back to full rebuild")
+        return False
+
+    # every previously ingested file must still be there, unchanged, and ahead of the new ones
+    ingested_files = manifest['ingested_files']
+    if files_names[:len(ingested_files)] != ingested_files:
+        logging.info("Ingestion: Ingested files removed or new files sort before them, falling back to full rebuild")
+        return False
+    fingerprints = {}
+    for file in ingested_files:
+        fingerprints[file] = file_fingerprint(os.path.join(input_folder_path, file), manifest['files'][file])
+        if fingerprints[file]['sha256'] != manifest['files'][file]['sha256']:
+            logging.info(f"Ingestion: {file} was modified, falling back to full rebuild")
+            return False
+
+    new_files = files_names[len(ingested_files):]
+    logging.info(f"Ingestion: New files: {new_files}")
+    ingested_files = files_names
+    if not new_files:
+        save_manifest(dict(manifest, files=fingerprints))
+        write_record(ingested_files)
+        return True
+
+    new_data = pd.concat(read_datasets(new_files))
+    for file in new_files:
+        fingerprints[file] = file_fingerprint(os.path.join(input_folder_path, file))
+    logging.info(f"Ingestion: New Data Shape: {new_data.shape}")
+
+    # keep the first occurrence of rows that are neither already ingested nor repeated in the new files
+    new_hashes = row_hashes(new_data)
+    keep = ~pd.Series(new_hashes).duplicated().to_numpy() & ~np.isin(new_hashes, existing_hashes)
+    new_data = new_data[keep]
+    logging.info(f"Ingestion: New Data Shape after dropping duplicates: {new_data.shape}")
+
+    # appending is only byte-identical to a rebuild if the new rows do not change any column dtype
+    new_dtypes = {column: str(dtype) for column, dtype in new_data.dtypes.items()}
+    if datastore.dataset_format == 'csv' and list(new_dtypes.items()) == list(manifest['dtypes'].items()):
+        new_data.to_csv(final_data_path, mode='a', header=False, index=False)
+        dtypes = manifest['dtypes']
+    else:
+        final_data = pd.concat([datastore.load_dataset(output_folder_path), new_data])
+        datastore.save_dataset(final_data, output_folder_path)
+        dtypes = {column: str(dtype) for column, dtype in final_data.dtypes.items()}
+    logging.info("Ingestion: Data ingestion completed successfully")
+
+    # the profile is mergeable, only the new rows need profiling
+    profile = profiling.load_profile(output_folder_path)
+    if profile is None:
+        profile = profiling.profile_dataset(output_folder_path)
+    else:
+        profile.update(new_data)
+    profiling.save_profile(profile, output_folder_path)
+
+    save_row_hashes(np.concatenate([existing_hashes, new_hashes[keep]]))
+    save_manifest({
+        'input_folder_path': input_folder_path,
+        'ingested_files': ingested_files,
+        'files': fingerprints,
+        'dtypes': dtypes
+    })
+    logging.info("Ingestion: Manifest created/updated successfully")
+    write_record(ingested_files)
+    return True
+
+
+#############Helpers for streaming ingestion
+class RowHashIndex:
+    '''
+    Compact set of uint64 row hashes kept as sorted runs (8 bytes per unique row), merged geometrically.
+    The runs held in memory take at most a quarter of max_memory_bytes: merging them needs the inputs, the
+    result and mergesort's buffer at once, and a lookup maps in one spilled run of up to that size. Past it
+    the largest run is spilled to a file in spill_dir, mapped read-only and released after every lookup.
+    '''
+    def __init__(self, spill_dir, max_memory_bytes):
+        self.spill_dir = spill_dir
+        self.max_memory_bytes = max_memory_bytes
+        # (sorted hashes, mmap of the spill file or None while in memory)
+        self.runs = []
+        self.spilled = 0
+
+    def __len__(self):
+        return sum(len(run) for run, _ in self.runs)
+
+    def memory_bytes(self):
+        return sum(run.nbytes for run, mapped in self.runs if mapped is None)
+
+    def contains(self, hashes):
+        found = np.zeros(len(hashes), dtype=bool)
+        for run, mapped in self.runs:
+            positions = np.searchsorted(run, hashes)
+            positions[positions == len(run)] = 0
+            found |= run[positions] == hashes
+            if mapped is not None and hasattr(mmap, 'MADV_DONTNEED'):
+                mapped.madvise(mmap.MADV_DONTNEED)
+        return found
+
+    def add_new(self, hashes):
+        '''
+        Adds hashes to the index and returns the mask of rows seen for the first time
+        '''
+        new = ~pd.Series(hashes).duplicated().to_numpy()
+        if self.runs:
+            new &= ~self.contains(hashes)
+        run = np.sort(hashes[new])
+        if len(run) == 0:
+            return new
+        # keep run sizes geometric so each hash is merged O(log n) times, spilled runs are never reloaded
+        while self.runs and self.runs[-1][1] is None and len(self.runs[-1][0]) <= 2 * len(run):
+            run = np.concatenate([self.runs.pop()[0], run])
+            run.sort(kind='mergesort')
+        self.runs.append((run, None))
+        while self.memory_bytes() > self.max_memory_bytes / 4:
+            largest = max((i for i, (_, mapped) in enumerate(self.runs) if mapped is None),
+                          key=lambda i: self.runs[i][0].nbytes)
+            self.runs[largest] = self.spill(self.runs[largest][0])
+        return new
+
+    def spill(self, run):
+        spill_path = os.path.join(self.spill_dir, f"run{self.spilled}.bin")
+        self.spilled += 1
+        run.tofile(spill_path)
+        with open(spill_path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return np.frombuffer(mapped, dtype=np.uint64), mapped
+
+    def close(self):
+        # the arrays over the mappings must be gone before these can close
+        mappings = [mapped for _, mapped in self.runs if mapped is not None]
+        self.runs = []
+        for mapped in mappings:
+            mapped.close()
+
+
+def rss_bytes():
+    '''
+    Function to get the resident set size of this process: the current one on Linux, elsewhere
+    the peak so far, None if unknown
+    '''
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return peak_rss_bytes()
+
+
+def peak_rss_bytes():
+    '''
+    Function to get the peak resident set size of this process in bytes, None if unknown
+    '''
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak if os.uname().sysname == 'Darwin' else peak * 1024
+
+
+def reset_peak_rss():
+    '''
+    Function to restart the peak RSS measurement from the current RSS (Linux), returns whether it could
+    '''
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def sample_text(file_path, rows):
+    '''
+    Function to get the header and first rows of a CSV as bytes
+    '''
+    with open(file_path, 'rb') as f:
+        return b''.join(itertools.islice(f, rows + 1))
+
+
+def ingest_chunk(chunk, index, output):
+    '''
+    Function to drop the rows of a chunk already in the index and append the others to output
+    '''
+    chunk = chunk[index.add_new(row_hashes(chunk))]
+    chunk.to_csv(output, header=False, index=False)
+    return chunk
+
+
+def arrow_bytes():
+    '''
+    Function to get the bytes held by Arrow's default memory pool, which tracemalloc does not see
+    '''
+    return pyarrow.default_memory_pool().bytes_allocated() if pyarrow is not None else 0
+
+
+# resident memory the process grows by per byte allocated while ingesting a chunk: what the allocators
+# keep on top of what is in use, measured as peak RSS growth over the traced and Arrow bytes of a
+# 10000-row sample (1.58 on Linux with glibc, pandas 3), rounded up
+rss_per_allocated_byte = 1.6
+
+
+def measure_row_cost(file_path, spill_dir, sample_rows=10000):
+    '''
+    Function to estimate what ingesting a chunk costs in memory, per byte of CSV text: parsing, the
+    hashing copies, deduplication and writing. A small chunk is ingested first to load what the
+    libraries only set up on first use; that fixed cost is returned too, as (fixed bytes, bytes per text byte).
+    '''
+    start = rss_bytes()
+    with open(os.devnull, 'w') as output:
+        ingest_chunk(pd.read_csv(io.BytesIO(sample_text(file_path, 1000))),
+                     RowHashIndex(spill_dir, float('inf')), output)
+        warm = rss_bytes()
+        text = sample_text(file_path, sample_rows)
+        # a trace already running, e.g. benchmark's, is left running
+        tracing = tracemalloc.is_tracing()
+        if not tracing:
+            tracemalloc.start()
+        try:
+            traced_start = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            arrow_start = arrow_bytes()
+            chunk = pd.read_csv(io.BytesIO(text))
+            # the parsed columns stay in the pool until the chunk is dropped
+            arrow = arrow_bytes() - arrow_start
+            ingest_chunk(chunk, RowHashIndex(spill_dir, float('inf')), output)
+            del chunk
+            traced = tracemalloc.get_traced_memory()[1] - traced_start
+        finally:
+            if not tracing:
+                tracemalloc.stop()
+    fixed = max(warm - start, 0) if start is not None and warm is not None else 0
+    cost = rss_per_allocated_byte * (traced + arrow)
+    # a file too small to show any growth still needs a cost, the frame takes at least its text
+    return fixed, max(cost / max(len(text), 1), 1.0)
+
+
+#############Function for streaming data ingestion
+def stream_multiple_dataframe(files_names, memory_budget_mb=None):
+    '''
+    Function to ingest the source files chunk by chunk with the growth of the process's memory bounded
+    by memory_budget_mb. The memory a chunk costs is measured on a sample first; what is left of the
+    budget after the libraries' first-use setup and the profile goes half to the chunks and half to the
+    RowHashIndex that deduplicates the rows before they are appended to finaldata.csv.
+    Kept rows and their order match a full rebuild; numbers keep the formatting of their own chunk.
+    '''
+    if memory_budget_mb is None:
+        memory_budget_mb = ingestion_memory_budget_mb
+    memory_budget_bytes = memory_budget_mb * 1024 * 1024
+    final_data_path = os.path.join(output_folder_path, file_name)
+    tmp_path = final_data_path + '.tmp'
+    start = time.perf_counter()
+    start_rss = rss_bytes()
+    peak_reset = reset_peak_rss()
+    rows_read = 0
+    rows_written = 0
+    bytes_read = 0
+    columns = None
+
+    with tempfile.TemporaryDirectory(dir=output_folder_path) as spill_dir:
+        fixed_bytes, bytes_per_text_byte = measure_row_cost(os.path.join(input_folder_path, files_names[0]),
+                                                            spill_dir)
+        # exact median values kept by the profile before it switches to a sketch, per numeric column
+        sample = pd.read_csv(os.path.join(input_folder_path, files_names[0]), nrows=1000)
+        profile_bytes = 2 * 8 * profiling.profile_exact_max_rows * len(sample.select_dtypes('number').columns)
+        # a tenth is left for the allocator's fragmentation when chunks and index runs interleave
+        available = 0.9 * (memory_budget_bytes - fixed_bytes - profile_bytes)
+        if available < 2 * 1024 * 1024:
+            logging.warning(f"Ingestion: Memory budget of {memory_budget_mb} MB is below the fixed cost of "
+                            f"{(fixed_bytes + profile_bytes) / 2 ** 20:.1f} MB, using the smallest chunks")
+            available = 2 * 1024 * 1024
+        index = RowHashIndex(spill_dir, available // 2)
+        profile = profiling.DatasetProfile()
+        with open(tmp_path, 'w', newline='') as output:
+            for file in files_names:
+                file_path = os.path.join(input_folder_path, file)
+                bytes_read += os.path.getsize(file_path)
+                text_bytes_per_row = max(len(sample_text(file_path, 1000)) / 1001, 1)
+                chunksize = max(1000, int(available // 2 / (bytes_per_text_byte * text_bytes_per_row)))
+                logging.info(f"Ingestion: Streaming {file} in chunks of {chunksize} rows")
+                for chunk in pd.read_csv(file_path, chunksize=chunksize):
+                    if columns is None:
+                        columns = list(chunk.columns)
+                        chunk.head(0).to_csv(output, index=False)
+                    elif list(chunk.columns) != columns:
+                        chunk = chunk.reindex(columns=columns)
+                    rows_read += len(chunk)
+                    chunk = ingest_chunk(chunk, index, output)
+                    rows_written += len(chunk)
+                    profile.update(chunk)
+                    del chunk
+        index.close()
+        os.replace(tmp_path, final_data_path)
+    # streaming only writes the CSV, readers fall back to it until the next full rebuild
+    datastore.discard_dataset(output_folder_path)
+    profiling.save_profile(profile, output_folder_path)
+
+    elapsed = time.perf_counter() - start
+    peak_rss = peak_rss_bytes()
+    stats = {
+        'rows_read': rows_read,
+        'rows_written': rows_written,
+        'bytes_read': bytes_read,
+        'elapsed_seconds': elapsed,
+        'rows_per_second': rows_read / elapsed if elapsed > 0 else None,
+        # growth of the process over its RSS when the run started, comparable with the budget; where the
+        # peak cannot be restarted it is the process's all-time peak and may include earlier work
+        'peak_rss_growth_mb': (peak_rss - start_rss) / 2 ** 20 if peak_rss and start_rss else None,
+        'peak_rss_exact': peak_reset,
+        'fixed_mb': (fixed_bytes + profile_bytes) / 2 ** 20,
+        'chunk_bytes_per_text_byte': bytes_per_text_byte,
+        'spilled_runs': index.spilled,
+        'memory_budget_mb': memory_budget_mb
+    }
+    logging.info(f"Ingestion: Streaming stats: {stats}")
+    annotate(files=len(files_names), rows=rows_read, bytes_read=bytes_read)
+    with open(os.path.join(output_folder_path, stats_file_name), 'w') as f:
+        json.dump(stats, f)
+    logging.info("Ingestion: Data ingestion completed successfully")
+
+    discard_manifest()
+    write_record(files_names)
+    return stats
+
+
+#############Function for data ingestion
+@traced('ingestion')
+def merge_multiple_dataframe(incremental=None, streaming=None):
+    '''
+    Function to compile the source datasets into finaldata.csv.
+    With incremental=True (default from config 'incremental_ingestion') only new files are parsed.
+    With streaming=True (default from config 'streaming_ingestion') files are read in memory-bounded chunks,
+    every run, incremental is then ignored.
+    '''
+    if incremental is None:
+        incremental = incremental_ingestion
+    if streaming is None:
+        streaming = streaming_ingestion
+    if incremental and streaming:
+        # the manifest's row hashes would all have to be held in memory to be saved, which the budget rules out
+        logging.warning("Ingestion: incremental_ingestion is ignored with streaming_ingestion, "
+                        "finaldata.csv is rebuilt within the memory budget on every run")
+        incremental = False
+
+    # Create output directory if it doesn't exist
+    os.makedirs(output_folder_path, exist_ok=True)
+
+    # check for datasets, compile them together, and write to an output file
+    data_files = os.listdir(input_folder_path)
+    logging.info(f"Ingestion: Data files: {data_files}")
+    files_names = sorted(file for file in data_files if file.endswith('.csv'))
+    logging.info(f"Ingestion: Files names: {files_names}")
+
+
+    if len(files_names) == 0:
+        logging.error("Ingestion: No data files found")
+        return
+
+    if incremental and merge_new_dataframes(files_names):
+        return
+
+    if streaming:
+        return stream_multiple_dataframe(files_names)
+
+    # read every file and concatenate them once
+    datasets = read_datasets(files_names)
+    for data in datasets:
+        logging.info(f"Ingestion: Data Shape: {data.shape}")
+    final_data = pd.concat(datasets)
+    logging.info(f"Ingestion: Final Data Shape: {final_data.shape}")
+
+    # drop duplicates
+    final_data.drop_duplicates(inplace=True)
+    logging.info(f"Ingestion: Final Data Shape after dropping duplicates: {final_data.shape}")
+
+    datastore.save_dataset(final_data, output_folder_path)
+    profiling.save_profile(profiling.profile_frame(final_data), output_folder_path)
+    logging.info("Ingestion: Data ingestion completed successfully")
+
+    write_record(files_names)
+
+    # hashing every row is a sizeable part of a rebuild, the manifest is only kept in incremental mode
+    if incremental:
+        fingerprints = {file: file_fingerprint(os.path.join(input_folder_path, file)) for file in files_names}
+        write_manifest(files_names, fingerprints, final_data)
+    else:
+        discard_manifest()
+
+
+if __name__ == '__main__':
+    merge_multiple_dataframe()
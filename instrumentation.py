@@ -0,0 +1,293 @@
+# Importing necessary libraries
+import os
+import json
+import time
+import uuid
+import threading
+import functools
+import contextvars
+import logging
+from contextlib import contextmanager
+from datetime import datetime
+from settings import load_config
+
+# Setting up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+##################Load config.json and get metrics settings
+config = load_config()
+
+output_model_path = os.path.join(config['output_model_path'])
+# upper bounds in seconds of the latency histogram buckets
+metrics_latency_buckets = sorted(config.get('metrics_latency_buckets', [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                                                                       0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0]))
+
+trace_file_name = 'pipelinetrace.json'
+# span attributes that are also added up in a counter per span
+counted_attributes = ['rows', 'bytes_read', 'bytes_written']
+
+
+##################Metrics registry
+def format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def format_value(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Metrics:
+    '''
+    Process-wide counters and histograms keyed by name and labels, rendered in the Prometheus
+    text exposition format. Each process has its own, so a server with several worker processes
+    reports per worker. Counters on the request path can be counted per thread with add_local,
+    without the shared lock, and are added up when the metrics are read.
+    '''
+    def __init__(self, buckets=None):
+        self.buckets = list(buckets or metrics_latency_buckets)
+        self.lock = threading.Lock()
+        # name -> (type, help), name -> {labels: value or [bucket counts..., sum, count]}
+        self.descriptions = {}
+        self.values = {}
+        # {(name, labels): value} of each thread that used add_local, written only by that thread
+        self.local = threading.local()
+        self.thread_values = []
+
+    def inc(self, name, value=1, help='', **labels):
+        self.add(name, tuple(sorted(labels.items())), value, help)
+
+    def add(self, name, key, value=1, help=''):
+        '''
+        Adds to a counter whose labels are already a sorted tuple of pairs, for hot paths
+        '''
+        with self.lock:
+            series = self.values.get(name)
+            if series is None:
+                self.descriptions[name] = ('counter', help)
+                series = self.values[name] = {}
+            series[key] = series.get(key, 0) + value
+
+    def add_local(self, name, key, value=1, help=''):
+        '''
+        Adds to a counter like add, in this thread's own counts: only a thread's first use of a
+        series takes the lock
+        '''
+        counts = getattr(self.local, 'values', None)
+        series = (name, key)
+        if counts is None or series not in counts:
+            with self.lock:
+                if counts is None:
+                    counts = self.local.values = {}
+                    self.thread_values.append(counts)
+                self.descriptions.setdefault(name, ('counter', help))
+                counts.setdefault(series, 0)
+        counts[series] += value
+
+    def observe(self, name, value, help='', **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.descriptions.setdefault(name, ('histogram', help))
+            series = self.values.setdefault(name, {})
+            counts = series.get(key)
+            if counts is None:
+                counts = series[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            counts[-2] += value
+            counts[-1] += 1
+
+    def snapshot(self):
+        with self.lock:
+            values = {name: {key: list(value) if isinstance(value, list) else value for key, value in series.items()}
+                      for name, series in self.values.items()}
+            for counts in self.thread_values:
+                # copying a dict is atomic under the GIL, its thread may be adding to it meanwhile
+                for (name, key), value in dict(counts).items():
+                    series = values.setdefault(name, {})
+                    series[key] = series.get(key, 0) + value
+            return dict(self.descriptions), values
+
+    def render(self):
+        '''
+        Returns every metric in the Prometheus text format, plus the hit ratio of each cache
+        '''
+        descriptions, values = self.snapshot()
+        lines = []
+        for name in sorted(values):
+            kind, help = descriptions[name]
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+            for key, value in sorted(values[name].items()):
+                if kind == 'counter':
+                    lines.append(f"{name}{format_labels(key)} {format_value(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(self.buckets, value):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{format_labels(key, [('le', bound)])} {cumulative}")
+                lines.append(f"{name}_bucket{format_labels(key, [('le', '+Inf')])} {value[-1]}")
+                lines.append(f"{name}_sum{format_labels(key)} {format_value(value[-2])}")
+                lines.append(f"{name}_count{format_labels(key)} {value[-1]}")
+
+        ratios = cache_hit_ratios(values.get('risk_cache_requests_total', {}))
+        if ratios:
+            lines += ["# HELP risk_cache_hit_ratio Share of cache lookups served from the cache",
+                      "# TYPE risk_cache_hit_ratio gauge"]
+            lines += [f"risk_cache_hit_ratio{format_labels([('cache', cache)])} {format_value(ratio)}"
+                      for cache, ratio in sorted(ratios.items())]
+        return '\n'.join(lines) + '\n'
+
+
+def cache_hit_ratios(series):
+    totals = {}
+    for key, value in series.items():
+        labels = dict(key)
+        hits, lookups = totals.get(labels['cache'], (0, 0))
+        totals[labels['cache']] = (hits + (value if labels['result'] == 'hit' else 0), lookups + value)
+    return {cache: hits / lookups for cache, (hits, lookups) in totals.items() if lookups}
+
+
+metrics = Metrics()
+
+
+def count_cache(cache, hit):
+    '''
+    Function to count one lookup of a cache as a hit or a miss, without contention between threads
+    '''
+    metrics.add_local('risk_cache_requests_total', (('cache', cache), ('result', 'hit' if hit else 'miss')),
+                help="Cache lookups by cache and result")
+
+
+##################Spans and traces
+# the trace of the running pipeline and the innermost running span, per thread or task
+current_trace = contextvars.ContextVar('current_trace', default=None)
+current_span = contextvars.ContextVar('current_span', default=None)
+
+
+class Trace:
+    '''
+    The spans of one run, in the order they finished
+    '''
+    def __init__(self, name):
+        self.name = name
+        self.trace_id = uuid.uuid4().hex
+        self.started_at = datetime.now().isoformat()
+        self.start = time.perf_counter()
+        self.spans = []
+        self.lock = threading.Lock()
+
+    def add(self, span):
+        with self.lock:
+            self.spans.append(span)
+
+    def to_dict(self):
+        with self.lock:
+            return {'trace_id': self.trace_id, 'name': self.name, 'started_at': self.started_at,
+                    'seconds': time.perf_counter() - self.start, 'spans': list(self.spans)}
+
+
+@contextmanager
+def trace(name):
+    '''
+    Function to collect the spans run inside the block, and in threads started with its context, into one trace
+    '''
+    run_trace = Trace(name)
+    token = current_trace.set(run_trace)
+    try:
+        yield run_trace
+    finally:
+        current_trace.reset(token)
+
+
+@contextmanager
+def span(name, **attributes):
+    '''
+    Function to time a block: the time goes to the risk_span_seconds histogram and, inside a trace,
+    the span is recorded with its attributes. annotate() adds attributes from within the block.
+    '''
+    run_trace = current_trace.get()
+    parent = current_span.get()
+    record = {'name': name, 'parent': parent['name'] if parent else None, 'status': 'ok',
+              'thread': threading.current_thread().name, 'attributes': dict(attributes)}
+    token = current_span.set(record)
+    start = time.perf_counter()
+    try:
+        yield record['attributes']
+    except BaseException as e:
+        record['status'] = 'error'
+        record['error'] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        current_span.reset(token)
+        metrics.observe('risk_span_seconds', seconds, help="Duration of pipeline stages and operations",
+                        span=name, status=record['status'])
+        for attribute in counted_attributes:
+            if isinstance(record['attributes'].get(attribute), (int, float)):
+                metrics.inc(f"risk_{attribute}_total", record['attributes'][attribute],
+                            help=f"{attribute.replace('_', ' ').capitalize()} by span", span=name)
+        if run_trace is not None:
+            record['offset_seconds'] = start - run_trace.start
+            record['seconds'] = seconds
+            run_trace.add(record)
+
+
+def traced(name):
+    '''
+    Decorator running the function in a span
+    '''
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def annotate(**attributes):
+    '''
+    Function to set attributes, such as rows or bytes_read, on the innermost running span
+    '''
+    record = current_span.get()
+    if record is not None:
+        record['attributes'].update(attributes)
+
+
+def save_trace(run_trace, path=None):
+    '''
+    Function to write a trace as JSON
+    '''
+    path = path or os.path.join(output_model_path, trace_file_name)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(run_trace.to_dict(), f)
+    os.replace(path + '.tmp', path)
+    return path
+
+
+def render_last_run(path=None):
+    '''
+    Function to render the stage timings and status of the last pipeline run, which happens in
+    another process, as Prometheus gauges
+    '''
+    try:
+        with open(path or os.path.join(output_model_path, trace_file_name), 'r') as f:
+            last_run = json.load(f)
+    except (OSError, ValueError):
+        return ''
+    lines = ["# HELP risk_last_run_stage_seconds Duration of each stage in the last pipeline run",
+             "# TYPE risk_last_run_stage_seconds gauge"]
+    for record in last_run['spans']:
+        if record['name'].startswith('pipeline.'):
+            labels = format_labels([('stage', record['name'][len('pipeline.'):]),
+                                    ('status', record['attributes'].get('status', record['status']))])
+            lines.append(f"risk_last_run_stage_seconds{labels} {format_value(record['seconds'])}")
+    lines += ["# HELP risk_last_run_seconds Duration of the last pipeline run",
+              "# TYPE risk_last_run_seconds gauge", f"risk_last_run_seconds {format_value(last_run['seconds'])}"]
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,204 @@
+# Importing necessary libraries
+import os
+import sys
+import json
+import fcntl
+import signal
+import uuid
+import time
+import threading
+import multiprocessing
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from settings import load_config
+
+# Setting up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+##################Load config.json and get job settings
+config = load_config()
+
+output_model_path = os.path.join(config['output_model_path'])
+# jobs running at the same time, seconds before a job is killed, and finished jobs kept in the store
+jobs_max_workers = config.get('jobs_max_workers', 2)
+logging.info(f"Jobs: Max workers: {jobs_max_workers}")
+jobs_timeout = config.get('jobs_timeout', 600)
+logging.info(f"Jobs: Timeout: {jobs_timeout}")
+jobs_history = config.get('jobs_history', 50)
+# seconds a timed-out job gets to clean up after SIGTERM before it is killed
+jobs_kill_grace = config.get('jobs_kill_grace', 5)
+
+jobs_file_name = 'jobs.json'
+
+
+##################Running a function in a child process
+def exit_on_sigterm(signum, frame):
+    # unwinds the job so its finally blocks and context managers (temporary folders, subprocesses) run
+    sys.exit(128 + signum)
+
+
+def child_main(func, connection):
+    # the job and the processes it starts form their own group, so a timeout stops all of them
+    os.setpgid(0, 0)
+    signal.signal(signal.SIGTERM, exit_on_sigterm)
+    try:
+        connection.send(('done', func()))
+    except Exception as e:
+        connection.send(('failed', f"{type(e).__name__}: {e}"))
+    finally:
+        connection.close()
+
+
+def run_in_process(func, timeout):
+    '''
+    Function to run func() in a child process so it can be killed after timeout seconds.
+    Returns (status, result or error) with status 'done', 'failed' or 'timeout'.
+    '''
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=child_main, args=(func, sender), daemon=True)
+    process.start()
+    try:
+        # also set from here, in case the timeout comes before the child got to it
+        os.setpgid(process.pid, process.pid)
+    except OSError:
+        pass
+    sender.close()
+    try:
+        if not receiver.poll(timeout):
+            stop_process_group(process)
+            return 'timeout', f"job did not finish within {timeout} seconds"
+        return receiver.recv()
+    except EOFError:
+        return 'failed', f"job process exited with code {process.exitcode}"
+    finally:
+        process.join(1)
+        receiver.close()
+
+
+def stop_process_group(process, grace=None):
+    '''
+    Function to stop a job's process and every process it started: SIGTERM first so they can clean up,
+    then SIGKILL for whatever is left after grace seconds
+    '''
+    grace = jobs_kill_grace if grace is None else grace
+    for signum in (signal.SIGTERM, signal.SIGKILL):
+        try:
+            os.killpg(process.pid, signum)
+        except ProcessLookupError:
+            return
+        except PermissionError:
+            # not a group of ours, only the direct child can be stopped
+            if signum == signal.SIGKILL:
+                process.kill()
+            else:
+                process.terminate()
+        process.join(grace)
+
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+##################Persisted job store and worker pool
+class JobManager:
+    '''
+    Runs named jobs on a bounded worker pool, each in a child process with a timeout,
+    and persists their status and results to a small JSON store. The store is shared by
+    every process using the same path (such as the workers of a server): each operation
+    re-reads it under a file lock, so at most one job per name is queued or running at a
+    time across all of them and any of them can answer for any job.
+    '''
+    def __init__(self, store_path=None, max_workers=None, timeout=None):
+        self.store_path = store_path or os.path.join(output_model_path, jobs_file_name)
+        self.timeout = jobs_timeout if timeout is None else timeout
+        self.pool = ThreadPoolExecutor(max_workers=jobs_max_workers if max_workers is None else max_workers,
+                                       thread_name_prefix='job')
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def locked_store(self, exclusive=True):
+        '''
+        Function to hold the store's lock, exclusive to change it or shared to read it, and get its jobs
+        '''
+        os.makedirs(os.path.dirname(self.store_path) or '.', exist_ok=True)
+        # flock serializes processes, the thread lock the threads of this one
+        with self.lock, open(self.store_path + '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield self.load()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def load(self):
+        try:
+            with open(self.store_path, 'r') as f:
+                jobs = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        # jobs queued or running in a process that has stopped will never finish
+        for job in jobs.values():
+            if job['status'] in ('queued', 'running') and not process_alive(job.get('pid', -1)):
+                job.update(status='failed', error='interrupted by a restart', finished_at=time.time())
+        return jobs
+
+    def save(self, jobs):
+        finished = sorted((job for job in jobs.values() if job['status'] not in ('queued', 'running')),
+                          key=lambda job: job['finished_at'])
+        for job in finished[:-jobs_history]:
+            del jobs[job['id']]
+        tmp_path = self.store_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(jobs, f)
+        os.replace(tmp_path, self.store_path)
+
+    def submit(self, name, func):
+        '''
+        Queues func under name and returns its job, or the job of that name already queued or running
+        '''
+        with self.locked_store() as jobs:
+            for job in jobs.values():
+                if job['name'] == name and job['status'] in ('queued', 'running'):
+                    return job
+            job = {'id': uuid.uuid4().hex, 'name': name, 'status': 'queued', 'submitted_at': time.time(),
+                   'started_at': None, 'finished_at': None, 'result': None, 'error': None, 'pid': os.getpid()}
+            jobs[job['id']] = job
+            self.save(jobs)
+        self.pool.submit(self.run, job, func)
+        logging.info(f"Jobs: Submitted {name} job {job['id']}")
+        return dict(job)
+
+    def update(self, job, **changes):
+        with self.locked_store() as jobs:
+            # the stored job, or this process's copy if it was dropped from the store meanwhile
+            job = jobs[job['id']] = dict(jobs.get(job['id'], job), **changes)
+            self.save(jobs)
+        return job
+
+    def run(self, job, func):
+        job = self.update(job, status='running', started_at=time.time())
+        status, result = run_in_process(func, self.timeout)
+        self.update(job, status=status, finished_at=time.time(), **{'result' if status == 'done' else 'error': result})
+        logging.info(f"Jobs: {job['name']} job {job['id']} {status}")
+
+    def get(self, job_id):
+        '''
+        Returns the job with this id, None if unknown
+        '''
+        with self.locked_store(exclusive=False) as jobs:
+            return jobs.get(job_id)
+
+    def latest(self, name, status=None):
+        '''
+        Returns the most recently submitted job of this name, optionally only with the given status
+        '''
+        with self.locked_store(exclusive=False) as jobs:
+            jobs = [job for job in jobs.values() if job['name'] == name and status in (None, job['status'])]
+            return max(jobs, key=lambda job: job['submitted_at']) if jobs else None
@@ -0,0 +1,232 @@
+# Importing necessary libraries
+import argparse
+import os
+import sys
+import json
+import time
+import signal
+import subprocess
+import random
+import threading
+import platform
+import logging
+import requests
+from benchmark import percentile
+
+# Setting up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+repo_path = os.path.dirname(os.path.abspath(__file__))
+
+
+##################Load generation
+def wait_until_ready(url, timeout=60):
+    '''
+    Function to poll /health until the server answers with a loaded model
+    '''
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            response = requests.get(f"{url}/health", timeout=1)
+            if response.status_code == 200:
+                return response.json()
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise TimeoutError(f"{url} not ready after {timeout}s")
+
+
+def record_payload(count):
+    return [{'lastmonth_activity': 100 + i, 'lastyear_activity': 1000 + i,
+             'number_of_employees': 10 + i % 50} for i in range(count)]
+
+
+def mix_calls(records):
+    '''
+    Function to get the calls a mixed load can be made of: name -> (endpoint, JSON payload or raw body or None for GET)
+    '''
+    return {
+        'record': ('/prediction', {'record': record_payload(1)[0]}),
+        'records': ('/prediction', {'records': record_payload(records)}),
+        'prediction': ('/prediction', None),
+        'stream': ('/prediction/stream', ''.join(json.dumps(record) + '\n' for record in record_payload(records)).encode()),
+        'scoring': ('/scoring', None),
+        'summarystats': ('/summarystats', None),
+        'diagnostics': ('/diagnostics', None),
+        'health': ('/health', None)
+    }
+
+
+def latency_summary(latencies, errors):
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'p50_ms': percentile(latencies, 0.5) * 1000 if latencies else None,
+        'p95_ms': percentile(latencies, 0.95) * 1000 if latencies else None,
+        'p99_ms': percentile(latencies, 0.99) * 1000 if latencies else None
+    }
+
+
+def run_load(url, calls, concurrency, duration):
+    '''
+    Function to make calls from concurrency keep-alive clients for duration seconds. calls is a list of
+    (name, endpoint, payload, weight), each request picks one at random by weight.
+    Returns the throughput, the latency percentiles and the number of errors, overall and per call.
+    '''
+    latencies = [[] for _ in range(concurrency)]
+    stop_at = time.monotonic() + duration
+    weights = [weight for _, _, _, weight in calls]
+
+    def client(index):
+        session = requests.Session()
+        chooser = random.Random(index)
+        while time.monotonic() < stop_at:
+            name, endpoint, payload, _ = chooser.choices(calls, weights)[0]
+            start = time.perf_counter()
+            try:
+                if payload is None:
+                    response = session.get(f"{url}{endpoint}", timeout=30)
+                elif isinstance(payload, bytes):
+                    response = session.post(f"{url}{endpoint}", data=payload, timeout=30)
+                else:
+                    response = session.post(f"{url}{endpoint}", json=payload, timeout=30)
+                ok = response.status_code == 200
+            except requests.RequestException:
+                ok = False
+            # failed requests are kept with a None latency to count the errors per call
+            latencies[index].append((name, time.perf_counter() - start if ok else None))
+
+    start = time.perf_counter()
+    clients = [threading.Thread(target=client, args=(index,)) for index in range(concurrency)]
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    samples = [sample for client_latencies in latencies for sample in client_latencies]
+    ok_latencies = [latency for _, latency in samples if latency is not None]
+    result = dict(latency_summary(ok_latencies, len(samples) - len(ok_latencies)),
+                  seconds=elapsed, requests_per_second=len(ok_latencies) / elapsed)
+    if len(calls) > 1:
+        result['calls'] = {}
+        for name, _, _, _ in calls:
+            call_samples = [latency for call, latency in samples if call == name]
+            call_latencies = [latency for latency in call_samples if latency is not None]
+            result['calls'][name] = latency_summary(call_latencies, len(call_samples) - len(call_latencies))
+    return result
+
+
+##################Server runs
+def start_gunicorn(workers, threads, port):
+    '''
+    Function to start the production server with the given number of workers
+    '''
+    command = [sys.executable, '-m', 'gunicorn', '-c', os.path.join(repo_path, 'gunicorn.conf.py'),
+               '--workers', str(workers), '--threads', str(threads), '--bind', f"127.0.0.1:{port}", 'wsgi:app']
+    return subprocess.Popen(command, cwd=os.getcwd(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def start_uvicorn(workers, port):
+    '''
+    Function to start the ASGI variant of the app with the given number of worker processes
+    '''
+    command = [sys.executable, '-m', 'uvicorn', '--app-dir', repo_path, '--workers', str(workers),
+               '--host', '127.0.0.1', '--port', str(port), '--log-level', 'warning', 'asgi:app']
+    return subprocess.Popen(command, cwd=os.getcwd(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def stop_server(process):
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def log_result(name, result):
+    logging.info(f"Load test: {name}: {result['requests_per_second']:.0f} req/s, p50 {result['p50_ms']:.1f} ms, "
+                 f"p99 {result['p99_ms']:.1f} ms, {result['errors']} errors")
+    for call, call_result in result.get('calls', {}).items():
+        if call_result['requests']:
+            logging.info(f"Load test: {name}: {call}: p50 {call_result['p50_ms']:.1f} ms, "
+                         f"p95 {call_result['p95_ms']:.1f} ms, p99 {call_result['p99_ms']:.1f} ms, "
+                         f"{call_result['errors']} errors")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the app on gunicorn (WSGI) or uvicorn (ASGI) "
+                                                 "with a growing number of workers")
+    parser.add_argument('--servers', nargs='+', choices=['wsgi', 'asgi'], default=['wsgi'],
+                        help="gunicorn with wsgi:app and/or uvicorn with asgi:app")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4], help="worker counts to compare")
+    parser.add_argument('--threads', type=int, default=4, help="threads per gunicorn worker")
+    parser.add_argument('--concurrency', type=int, default=16, help="concurrent keep-alive clients")
+    parser.add_argument('--duration', type=float, default=10.0, help="seconds of load per run")
+    parser.add_argument('--endpoint', default='/prediction', help="endpoint to call")
+    parser.add_argument('--records', type=int, default=0,
+                        help="POST this many inline records instead of GET on the test file")
+    parser.add_argument('--mix', nargs='+', metavar='CALL=WEIGHT',
+                        help=f"mixed load instead of --endpoint, calls: {', '.join(mix_calls(0))}, "
+                             "e.g. record=8 records=1 diagnostics=1")
+    parser.add_argument('--port', type=int, default=8123)
+    parser.add_argument('--url', help="load an already running server instead of starting one")
+    parser.add_argument('--output', default='loadtestresults.json', help="machine-readable results file")
+    args = parser.parse_args(argv)
+
+    if args.mix:
+        available = mix_calls(args.records or 100)
+        calls = []
+        for item in args.mix:
+            name, _, weight = item.partition('=')
+            if name not in available:
+                parser.error(f"unknown call {name}, choose from {', '.join(available)}")
+            calls.append((name, *available[name], float(weight or 1)))
+    else:
+        payload = {'records': record_payload(args.records)} if args.records else None
+        calls = [(args.endpoint, args.endpoint, payload, 1)]
+
+    results = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'endpoint': args.endpoint,
+        'mix': {name: weight for name, _, _, weight in calls} if args.mix else None,
+        'records': args.records,
+        'concurrency': args.concurrency,
+        'duration': args.duration,
+        'results': {}
+    }
+    if args.url:
+        health = wait_until_ready(args.url)
+        results['results']['external'] = dict(run_load(args.url, calls, args.concurrency, args.duration),
+                                              model_version=health['model_version'])
+        log_result('external', results['results']['external'])
+    for server in [] if args.url else args.servers:
+        for workers in args.workers:
+            if server == 'wsgi':
+                process = start_gunicorn(workers, args.threads, args.port)
+            else:
+                process = start_uvicorn(workers, args.port)
+            url = f"http://127.0.0.1:{args.port}"
+            try:
+                health = wait_until_ready(url)
+                # warm every worker up before measuring
+                run_load(url, calls, args.concurrency, min(1.0, args.duration))
+                result = run_load(url, calls, args.concurrency, args.duration)
+            finally:
+                stop_server(process)
+            name = f"{server}:{workers}"
+            results['results'][name] = dict(result, server=server, workers=workers,
+                                            threads=args.threads if server == 'wsgi' else None,
+                                            model_version=health['model_version'])
+            log_result(name, result)
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    logging.info(f"Load test: Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
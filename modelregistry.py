@@ -0,0 +1,152 @@
+# Importing necessary libraries
+import os
+import pickle
+import threading
+import time
+import logging
+import numpymodel
+from deployment import current_version_path
+from instrumentation import metrics, count_cache
+from settings import load_config
+
+# Setting up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+##################Load config.json and get path variables
+config = load_config()
+
+# seconds between two checks of the deployment directory for a newly published model
+model_reload_interval = config.get('model_reload_interval', 1.0)
+logging.info(f"Model registry: Reload interval: {model_reload_interval}")
+# 'numpy' serves the trainedmodel.npz artifact when deployed, 'pickle' always unpickles the scikit-learn model
+serving_model_format = config.get('serving_model_format', 'numpy')
+logging.info(f"Model registry: Serving model format: {serving_model_format}")
+
+
+##################In-process model cache
+class ModelCache:
+    '''
+    Keeps the model deployed in folder_path loaded once per process, as a numpymodel.LinearModel
+    when the NumPy artifact is deployed and serving_model_format is 'numpy'.
+    The read path is a plain attribute read, the deployment directory is only checked
+    every check_interval seconds and the model is reloaded when the current deployment
+    version or the model file's stamp (inode, mtime, size) changes. Deployed versions are
+    complete before the current link moves, so a reload never sees a half-written pickle;
+    if loading still fails the previous model keeps being served.
+    '''
+    def __init__(self, folder_path, check_interval=None):
+        self.folder_path = folder_path
+        self.check_interval = model_reload_interval if check_interval is None else check_interval
+        # (version stamp, model, model path, deployment version), replaced as a whole so readers never see a mix
+        self.entry = None
+        self.next_check = 0.0
+        self.loads = 0
+        self.lock = threading.Lock()
+
+    def get(self):
+        '''
+        Returns the deployed model, loading or reloading it if needed
+        '''
+        entry = self.entry
+        if entry is not None and time.monotonic() < self.next_check:
+            count_cache('model', True)
+            return entry[1]
+        return self.refresh()[1]
+
+    def version(self):
+        '''
+        Returns the deployment version of the cached model, or its version stamp as a string
+        for a deployment made before versioning
+        '''
+        return self.current()[1]
+
+    def current(self):
+        '''
+        Returns the deployed model together with its version, both from the same load
+        '''
+        entry = self.entry
+        if entry is None or time.monotonic() >= self.next_check:
+            entry = self.refresh()
+        else:
+            count_cache('model', True)
+        return entry[1], self.entry_version(entry)
+
+    def loaded_version(self):
+        '''
+        Returns the version of the model already loaded without checking the deployment, None if none is
+        '''
+        entry = self.entry
+        return None if entry is None else self.entry_version(entry)
+
+    @staticmethod
+    def entry_version(entry):
+        return entry[3] or '-'.join(str(part) for part in entry[0])
+
+    def model_path(self, folder_path=None):
+        '''
+        Returns the path of the current deployed model, preferring the NumPy artifact when configured
+        '''
+        folder_path = folder_path or current_version_path(self.folder_path)
+        names = os.listdir(folder_path)
+        if serving_model_format == 'numpy' and numpymodel.model_file_name in names:
+            return os.path.join(folder_path, numpymodel.model_file_name)
+        return os.path.join(folder_path, sorted(name for name in names if name.endswith('.pkl'))[0])
+
+    def refresh(self):
+        entry = self.entry
+        # only one thread reloads, the others keep serving the current model
+        if not self.lock.acquire(blocking=entry is None):
+            return entry
+        try:
+            entry = self.entry
+            if entry is not None and time.monotonic() < self.next_check:
+                return entry
+            try:
+                # the current link is read once, so the version and the model path always match
+                folder_path = current_version_path(self.folder_path)
+                version = os.path.basename(folder_path) if folder_path != self.folder_path else None
+                model_path = self.model_path(folder_path)
+                stat = os.stat(model_path)
+                stamp = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+                loaded = entry is None or entry[0] != stamp or entry[2] != model_path
+                count_cache('model', not loaded)
+                if loaded:
+                    start = time.perf_counter()
+                    if model_path.endswith('.npz'):
+                        model = numpymodel.load_model(model_path)
+                    else:
+                        with open(model_path, 'rb') as f:
+                            model = pickle.load(f)
+                    entry = (stamp, model, model_path, version)
+                    self.entry = entry
+                    self.loads += 1
+                    metrics.inc('risk_model_loads_total', help="Models loaded from the deployment directory",
+                                format=os.path.splitext(model_path)[1][1:])
+                    metrics.observe('risk_model_load_seconds', time.perf_counter() - start,
+                                    help="Time to load a deployed model")
+                    logging.info(f"Model registry: Model loaded from {model_path}")
+            except Exception as e:
+                if entry is None:
+                    raise
+                logging.error(f"Model registry: Error reloading model, keeping previous model: {e}")
+            self.next_check = time.monotonic() + self.check_interval
+            return entry
+        finally:
+            self.lock.release()
+
+
+model_caches = {}
+model_caches_lock = threading.Lock()
+
+
+def get_model_cache(folder_path):
+    '''
+    Function to get the process-wide model cache for a deployment directory
+    '''
+    folder_path = os.path.abspath(folder_path)
+    cache = model_caches.get(folder_path)
+    if cache is None:
+        with model_caches_lock:
+            cache = model_caches.setdefault(folder_path, ModelCache(folder_path))
+    return cache
@@ -0,0 +1,95 @@
+# Importing necessary libraries
+# only numpy here, so a serving process can score without importing scikit-learn
+import numpy as np
+import os
+import logging
+from settings import load_config
+
+# Setting up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+##################Load config.json and get settings
+config = load_config()
+
+# largest absolute difference from scikit-learn's probabilities accepted when exporting
+numpy_model_tolerance = config.get('numpy_model_tolerance', 1e-12)
+logging.info(f"Numpy model: Tolerance: {numpy_model_tolerance}")
+
+model_file_name = 'trainedmodel.npz'
+
+
+##################Pure NumPy logistic regression scorer
+def sigmoid(x):
+    '''
+    Function to compute the logistic function, within about one ulp of scipy.special.expit
+    '''
+    with np.errstate(over='ignore'):
+        return 1 / (1 + np.exp(-np.asarray(x, dtype=np.float64)))
+
+
+class LinearModel:
+    '''
+    Binary logistic regression scored with a dot product plus sigmoid.
+    Mirrors the parts of scikit-learn's LogisticRegression used by this project.
+    '''
+    def __init__(self, coef, intercept, classes, feature_names):
+        self.coef_ = np.asarray(coef, dtype=np.float64).reshape(1, -1)
+        self.intercept_ = np.asarray(intercept, dtype=np.float64).reshape(1)
+        self.classes_ = np.asarray(classes)
+        self.feature_names_in_ = np.asarray(feature_names, dtype=object)
+
+    def features(self, X):
+        if hasattr(X, 'columns'):
+            X = X[list(self.feature_names_in_)]
+        return np.asarray(X, dtype=np.float64)
+
+    def decision_function(self, X):
+        return self.features(X) @ self.coef_[0] + self.intercept_[0]
+
+    def predict_proba(self, X):
+        probability = sigmoid(self.decision_function(X))
+        return np.column_stack([1 - probability, probability])
+
+    def predict(self, X):
+        return self.classes_[(self.decision_function(X) > 0).astype(int)]
+
+
+def load_model(model_path):
+    '''
+    Function to load a LinearModel from its .npz artifact
+    '''
+    with np.load(model_path, allow_pickle=False) as artifact:
+        return LinearModel(artifact['coef'], artifact['intercept'], artifact['classes'],
+                           artifact['feature_names'].tolist())
+
+
+def export_model(model, model_path, X, tolerance=None):
+    '''
+    Function to write the coefficients, intercept, classes and feature order of a fitted
+    LogisticRegression to model_path, after checking on X that the NumPy scorer gives the
+    same labels and probabilities within tolerance. Returns False, and removes any stale
+    artifact, when the check fails.
+    '''
+    if tolerance is None:
+        tolerance = numpy_model_tolerance
+    feature_names = [str(name) for name in getattr(model, 'feature_names_in_', X.columns)]
+    linear_model = LinearModel(model.coef_, model.intercept_, model.classes_, feature_names)
+
+    max_difference = float(np.max(np.abs(linear_model.predict_proba(X) - model.predict_proba(X)), initial=0.0))
+    labels_match = bool(np.array_equal(linear_model.predict(X), model.predict(X)))
+    logging.info(f"Numpy model: Max probability difference: {max_difference}, labels match: {labels_match}")
+    if max_difference > tolerance or not labels_match:
+        logging.error(f"Numpy model: Scorer does not match scikit-learn within {tolerance}, artifact not written")
+        if os.path.exists(model_path):
+            os.remove(model_path)
+        return False
+
+    tmp_path = model_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, coef=linear_model.coef_, intercept=linear_model.intercept_,
+                 classes=linear_model.classes_, feature_names=np.array(feature_names),
+                 max_difference=max_difference)
+    os.replace(tmp_path, model_path)
+    logging.info(f"Numpy model: Artifact written to {model_path}")
+    return True
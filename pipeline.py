@@ -0,0 +1,224 @@
+# Importing necessary libraries
+import os
+import json
+import time
+import importlib
+import contextvars
+import logging
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+from fingerprints import fingerprint_paths
+from instrumentation import trace, span, count_cache, save_trace, trace_file_name
+from settings import load_config
+
+# Setting up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+##################Load config.json and get pipeline settings
+config = load_config()
+
+output_model_path = os.path.join(config['output_model_path'])
+# stages run at the same time when they do not depend on each other
+pipeline_max_workers = config.get('pipeline_max_workers', 4)
+logging.info(f"Pipeline: Max workers: {pipeline_max_workers}")
+
+state_file_name = 'pipelinestate.json'
+run_file_name = 'pipelinerun.json'
+history_file_name = 'pipelineruns.jsonl'
+
+
+##################Stages
+class Stage:
+    '''
+    One step of the pipeline. func is a function, or a 'module:function' string imported only when
+    the stage runs, so skipped stages cost no imports. inputs and outputs are lists of paths, or functions returning them
+    when they are only known at run time. A gate stage returns True to let the stages after it run.
+    With cache=True the stage is skipped when its inputs have the same content as at its last
+    successful run and its outputs still exist.
+    '''
+    def __init__(self, name, func, deps=(), inputs=(), outputs=(), gate=False, cache=True):
+        self.name = name
+        self.func = func
+        self.deps = list(deps)
+        self.inputs = inputs
+        self.outputs = outputs
+        self.gate = gate
+        self.cache = cache
+
+    def function(self):
+        if callable(self.func):
+            return self.func
+        module_name, function_name = self.func.split(':')
+        return getattr(importlib.import_module(module_name), function_name)
+
+    def paths(self, paths):
+        return sorted(paths() if callable(paths) else paths)
+
+
+##################DAG executor
+def find_cycle(stages):
+    '''
+    Function to find a dependency cycle among stages (a dict by name), returns the names along it, each
+    depending on the next and the first repeated at the end, or None when the stages form a DAG
+    '''
+    visiting = []
+    done = set()
+
+    def visit(name):
+        if name in done:
+            return None
+        if name in visiting:
+            return visiting[visiting.index(name):] + [name]
+        visiting.append(name)
+        for dep in stages[name].deps:
+            cycle = visit(dep)
+            if cycle:
+                return cycle
+        visiting.pop()
+        done.add(name)
+        return None
+
+    for name in stages:
+        cycle = visit(name)
+        if cycle:
+            return cycle
+    return None
+
+
+class Pipeline:
+    '''
+    Runs stages in dependency order, independent stages concurrently, skipping cached ones.
+    Stage states (input fingerprints and gate results) persist in state_path, and every run's
+    per-stage status and timing is written to run_path and appended to history_path, and the
+    spans of the run, stages and the operations inside them, to trace_path.
+    '''
+    def __init__(self, stages, state_path=None, run_path=None, history_path=None, max_workers=None,
+                 trace_path=None):
+        self.stages = {stage.name: stage for stage in stages}
+        for stage in stages:
+            unknown = [dep for dep in stage.deps if dep not in self.stages]
+            if unknown:
+                raise ValueError(f"Stage {stage.name} depends on unknown stages {unknown}")
+        # stages in a cycle would wait for each other forever
+        cycle = find_cycle(self.stages)
+        if cycle:
+            raise ValueError(f"Stages depend on each other in a cycle: {' -> '.join(cycle)}")
+        self.state_path = state_path or os.path.join(output_model_path, state_file_name)
+        self.run_path = run_path or os.path.join(output_model_path, run_file_name)
+        self.history_path = history_path or os.path.join(output_model_path, history_file_name)
+        self.trace_path = trace_path or os.path.join(output_model_path, trace_file_name)
+        self.max_workers = pipeline_max_workers if max_workers is None else max_workers
+
+    def load_state(self):
+        try:
+            with open(self.state_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_json(self, path, data):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(data, f)
+        os.replace(path + '.tmp', path)
+
+    def run_stage(self, stage, previous_state):
+        '''
+        Runs or skips one stage in a span, returns its record for the run log and its new state
+        '''
+        with span(f"pipeline.{stage.name}") as attributes:
+            record, state = self.run_stage_inputs(stage, previous_state)
+            attributes['status'] = record['status']
+        if stage.cache:
+            count_cache('pipeline_stage', record['status'] == 'cached')
+        return record, state
+
+    def run_stage_inputs(self, stage, previous_state):
+        start = time.perf_counter()
+        input_paths = stage.paths(stage.inputs)
+        fingerprints = fingerprint_paths(input_paths, (previous_state or {}).get('inputs'))
+        outputs_exist = all(os.path.exists(path) for path in stage.paths(stage.outputs))
+        if (stage.cache and previous_state is not None and input_paths
+                and previous_state['inputs'] == fingerprints and outputs_exist):
+            result = previous_state.get('result')
+            logging.info(f"Pipeline: {stage.name} inputs unchanged, skipped")
+            return {'status': 'cached', 'result': result, 'seconds': time.perf_counter() - start}, previous_state
+
+        logging.info(f"Pipeline: Running {stage.name}")
+        result = stage.function()()
+        if stage.gate:
+            result = bool(result)
+        seconds = time.perf_counter() - start
+        logging.info(f"Pipeline: {stage.name} completed in {seconds:.3f}s")
+        # outputs written by the stage are fingerprinted by the stages that read them
+        state = {'inputs': fingerprint_paths(input_paths, fingerprints), 'result': result if stage.gate else None}
+        return {'status': 'ran', 'result': result if stage.gate else None, 'seconds': seconds}, state
+
+    def run(self):
+        '''
+        Runs the pipeline, returns the run record with the status and timing of every stage
+        '''
+        with trace('pipeline') as run_trace:
+            run = self.run_traced()
+        run['trace_id'] = run_trace.trace_id
+        save_trace(run_trace, self.trace_path)
+        self.save_json(self.run_path, run)
+        with open(self.history_path, 'a') as f:
+            f.write(json.dumps(run) + '\n')
+        logging.info(f"Pipeline: Run {run['status']} in {run['seconds']:.3f}s, trace in {self.trace_path}")
+        return run
+
+    def run_traced(self):
+        state = self.load_state()
+        run = {'started_at': datetime.now().isoformat(), 'status': 'running', 'stages': {}}
+        run_start = time.perf_counter()
+        records = run['stages']
+        pending = dict(self.stages)
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='stage') as pool:
+            while pending or running:
+                for name, stage in list(pending.items()):
+                    dep_records = [records.get(dep) for dep in stage.deps]
+                    if any(record is None for record in dep_records):
+                        continue
+                    del pending[name]
+                    blocked = [dep for dep, record in zip(stage.deps, dep_records)
+                               if record['status'] in ('failed', 'blocked', 'stopped')
+                               or (self.stages[dep].gate and not record['result'])]
+                    if blocked:
+                        # a failed stage or a closed gate stops everything after it
+                        status = 'blocked' if any(records[dep]['status'] in ('failed', 'blocked')
+                                                  for dep in blocked) else 'stopped'
+                        records[name] = {'status': status, 'after': blocked}
+                        logging.info(f"Pipeline: {name} {status} by {blocked}")
+                        continue
+                    # the stage thread records its spans in this run's trace
+                    running[pool.submit(contextvars.copy_context().run, self.run_stage, stage,
+                                        state.get(name))] = name
+                if not running:
+                    continue
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        records[name], state[name] = future.result()
+                    except Exception as e:
+                        logging.error(f"Pipeline: {name} failed: {e}")
+                        records[name] = {'status': 'failed', 'error': f"{type(e).__name__}: {e}"}
+                        state.pop(name, None)
+                    self.save_json(self.state_path, state)
+
+        run['status'] = 'failed' if any(record['status'] in ('failed', 'blocked')
+                                        for record in records.values()) else 'succeeded'
+        run['seconds'] = time.perf_counter() - run_start
+        return run
+
+
+if __name__ == '__main__':
+    from fullprocess import main
+    run = main()
+    if run['status'] != 'succeeded':
+        raise SystemExit(1)
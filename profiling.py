@@ -0,0 +1,265 @@
+# Importing necessary libraries
+import pandas as pd
+import numpy as np
+import os
+import json
+import pickle
+import math
+import threading
+import logging
+import datastore
+from settings import load_config
+
+# Setting up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+##################Load config.json and get profiling settings
+config = load_config()
+
+dataset_folder_path = os.path.join(config['output_folder_path'])
+# medians are exact up to this many values per column, then come from a sketch with this relative accuracy
+profile_exact_max_rows = config.get('profile_exact_max_rows', 100000)
+logging.info(f"Profiling: Exact max rows: {profile_exact_max_rows}")
+profile_relative_accuracy = config.get('profile_relative_accuracy', 0.005)
+logging.info(f"Profiling: Relative accuracy: {profile_relative_accuracy}")
+profile_chunk_rows = config.get('profile_chunk_rows', 100000)
+
+profile_file_name = 'datasetprofile.json'
+profile_state_file_name = 'datasetprofile.pkl'
+
+# summaries already read by this process, keyed by profile path
+summary_cache = {}
+summary_cache_lock = threading.Lock()
+
+
+##################Mergeable quantile sketch
+class QuantileSketch:
+    '''
+    Keeps the values themselves until there are more than exact_max_rows of them, then switches
+    to log-spaced buckets (as in DDSketch) whose quantiles are within relative_accuracy of the
+    true value. A relative_accuracy of 0 keeps every value. Sketches can be merged.
+    '''
+    def __init__(self, relative_accuracy=None, exact_max_rows=None):
+        self.relative_accuracy = profile_relative_accuracy if relative_accuracy is None else relative_accuracy
+        self.exact_max_rows = profile_exact_max_rows if exact_max_rows is None else exact_max_rows
+        self.count = 0
+        self.values = []
+        # bucket counts, None while the values are kept exactly
+        self.positive = None
+        self.negative = None
+        self.zeros = 0
+
+    def is_exact(self):
+        return self.positive is None
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        self.count += len(values)
+        if not self.is_exact():
+            self.add_to_buckets(values)
+            return
+        self.values.append(values)
+        if self.count > self.exact_max_rows and self.relative_accuracy > 0:
+            self.to_buckets()
+
+    def to_buckets(self):
+        values = np.concatenate(self.values) if self.values else np.empty(0)
+        self.values = []
+        self.positive = {}
+        self.negative = {}
+        self.add_to_buckets(values)
+
+    def add_to_buckets(self, values):
+        log_gamma = math.log((1 + self.relative_accuracy) / (1 - self.relative_accuracy))
+        self.zeros += int(np.count_nonzero(values == 0))
+        for buckets, magnitudes in ((self.positive, values[values > 0]), (self.negative, -values[values < 0])):
+            keys, counts = np.unique(np.ceil(np.log(magnitudes) / log_gamma).astype(np.int64), return_counts=True)
+            for key, count in zip(keys.tolist(), counts.tolist()):
+                buckets[key] = buckets.get(key, 0) + count
+
+    def merge(self, other):
+        if other.is_exact():
+            for values in other.values:
+                self.add(values)
+            return
+        if self.is_exact():
+            self.to_buckets()
+        for buckets, other_buckets in ((self.positive, other.positive), (self.negative, other.negative)):
+            for key, count in other_buckets.items():
+                buckets[key] = buckets.get(key, 0) + count
+        self.zeros += other.zeros
+        self.count += other.count
+
+    def quantile(self, q):
+        if self.count == 0:
+            return float('nan')
+        if self.is_exact():
+            return float(np.quantile(np.concatenate(self.values), q))
+
+        gamma = (1 + self.relative_accuracy) / (1 - self.relative_accuracy)
+        bucket_values = ([(-2 * gamma ** key / (gamma + 1), self.negative[key]) for key in sorted(self.negative, reverse=True)]
+                         + [(0.0, self.zeros)]
+                         + [(2 * gamma ** key / (gamma + 1), self.positive[key]) for key in sorted(self.positive)])
+        rank = q * (self.count - 1)
+        seen = 0
+        for value, count in bucket_values:
+            seen += count
+            if seen > rank:
+                return float(value)
+        return float(bucket_values[-1][0])
+
+
+##################Single-pass dataset profile
+class ColumnProfile:
+    '''
+    Null count for any column, plus count, mean and variance (Welford/Chan updates)
+    and a quantile sketch while the column stays numeric
+    '''
+    def __init__(self, nulls=0):
+        self.nulls = nulls
+        self.numeric = True
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.sketch = QuantileSketch()
+
+    def update(self, values):
+        self.nulls += int(values.isna().sum())
+        if not self.numeric:
+            return
+        if values.dtype.kind not in 'iuf':
+            # an all-missing chunk parses as float, anything else non-numeric makes the column non-numeric
+            if values.notna().any():
+                self.numeric = False
+                self.sketch = None
+            return
+        x = values.to_numpy(dtype=np.float64)
+        x = x[~np.isnan(x)]
+        if len(x) == 0:
+            return
+        # merge the chunk's mean and sum of squared deviations into the running ones
+        chunk_mean = x.mean()
+        chunk_m2 = float(((x - chunk_mean) ** 2).sum())
+        count = self.count + len(x)
+        delta = chunk_mean - self.mean
+        self.mean += delta * len(x) / count
+        self.m2 += chunk_m2 + delta ** 2 * self.count * len(x) / count
+        self.count = count
+        self.sketch.add(x)
+
+    def summary(self, rows):
+        summary = {'nulls': self.nulls, 'missing_percentage': self.nulls / rows * 100 if rows else float('nan'),
+                   'numeric': self.numeric}
+        if self.numeric:
+            summary.update(count=self.count,
+                           mean=self.mean if self.count else float('nan'),
+                           median=self.sketch.quantile(0.5),
+                           std=math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else float('nan'),
+                           exact_median=self.sketch.is_exact())
+        return summary
+
+
+class DatasetProfile:
+    '''
+    Column statistics of a dataset built from its chunks in one pass
+    '''
+    def __init__(self):
+        self.rows = 0
+        self.columns = {}
+
+    def update(self, chunk):
+        for column in chunk.columns:
+            if column not in self.columns:
+                # rows seen before the column appeared are missing for it
+                self.columns[column] = ColumnProfile(nulls=self.rows)
+            self.columns[column].update(chunk[column])
+        self.rows += len(chunk)
+        return self
+
+    def summary(self):
+        return {'rows': self.rows,
+                'columns': {column: profile.summary(self.rows) for column, profile in self.columns.items()}}
+
+
+def profile_frame(data):
+    '''
+    Function to profile a DataFrame already in memory, chunk by chunk
+    '''
+    profile = DatasetProfile()
+    for start in range(0, max(len(data), 1), profile_chunk_rows):
+        profile.update(data.iloc[start:start + profile_chunk_rows])
+    return profile
+
+
+def dataset_source_path(folder_path):
+    '''
+    Function to get the file the ingested dataset is read from
+    '''
+    path = datastore.dataset_path(folder_path=folder_path)
+    return path if os.path.exists(path) else datastore.dataset_path('csv', folder_path)
+
+
+def profile_dataset(folder_path=None):
+    '''
+    Function to profile the ingested dataset in one chunked pass
+    '''
+    folder_path = folder_path or dataset_folder_path
+    if dataset_source_path(folder_path).endswith('.csv'):
+        profile = DatasetProfile()
+        for chunk in pd.read_csv(dataset_source_path(folder_path), dtype={'corporation': str}, chunksize=profile_chunk_rows):
+            profile.update(chunk)
+        return profile
+    return profile_frame(datastore.load_dataset(folder_path))
+
+
+##################Functions to save and serve the profile
+def save_profile(profile, folder_path=None):
+    '''
+    Function to atomically write the profile state and its summary next to the ingested dataset
+    '''
+    folder_path = folder_path or dataset_folder_path
+    for file_name, write in ((profile_state_file_name, lambda f: pickle.dump(profile, f)),
+                             (profile_file_name, lambda f: f.write(json.dumps(profile.summary()).encode()))):
+        path = os.path.join(folder_path, file_name)
+        with open(path + '.tmp', 'wb') as f:
+            write(f)
+        os.replace(path + '.tmp', path)
+    logging.info(f"Profiling: Profile of {profile.rows} rows saved to {folder_path}")
+
+
+def load_profile(folder_path=None):
+    '''
+    Function to load the mergeable profile state, returns None if there is none yet
+    '''
+    try:
+        with open(os.path.join(folder_path or dataset_folder_path, profile_state_file_name), 'rb') as f:
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+
+
+def dataset_summary(folder_path=None):
+    '''
+    Function to get the profile summary of the ingested dataset. The summary is rebuilt only when
+    it is missing or older than the dataset, and read from disk only when it changed.
+    '''
+    folder_path = folder_path or dataset_folder_path
+    profile_path = os.path.join(folder_path, profile_file_name)
+    try:
+        profile_mtime = os.stat(profile_path).st_mtime_ns
+    except OSError:
+        profile_mtime = None
+    if profile_mtime is None or profile_mtime < os.stat(dataset_source_path(folder_path)).st_mtime_ns:
+        logging.info("Profiling: Profile missing or stale, profiling the dataset")
+        save_profile(profile_dataset(folder_path), folder_path)
+        profile_mtime = os.stat(profile_path).st_mtime_ns
+
+    cached = summary_cache.get(profile_path)
+    if cached is not None and cached[0] == profile_mtime:
+        return cached[1]
+    with open(profile_path, 'r') as f:
+        summary = json.load(f)
+    with summary_cache_lock:
+        summary_cache[profile_path] = (profile_mtime, summary)
+    return summary
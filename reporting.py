@@ -1,20 +1,27 @@
 # Importing libraries
 import pandas as pd
+import numpy as np
 from sklearn import metrics
-import matplotlib.pyplot as plt
-import seaborn as sns
-import json
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 import os
-from diagnostics import model_predictions
+import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from deployment import list_versions, read_manifest, score_file_name, versions_folder_name
+from diagnostics import model_feature_names, batch_predictions
+from drift import confusion_counts
+from instrumentation import count_cache
+from modelregistry import get_model_cache
 import logging  
+from settings import load_config
 
 # Setting up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 
 ###############Load config.json and get path variables
-with open('config.json','r') as f:
-    config = json.load(f) 
+config = load_config()
 
 dataset_csv_path = os.path.join(config['output_folder_path']) 
 logging.info(f"Reporting: Dataset CSV path: {dataset_csv_path}")
@@ -25,27 +32,146 @@ logging.info(f"Reporting: Test data path: {test_data_path}")
 output_model_path = os.path.join(config['output_model_path'])
 logging.info(f"Reporting: Output model path: {output_model_path}")
 
+deployment_path = os.path.join(config['prod_deployment_path'])
+
+# what the last reports were rendered from, they are only rendered again when it changes
+report_state_file_name = 'reportstate.json'
+report_file_names = {
+    'confusion_matrix': 'confusion_matrix.png',
+    'roc_curve': 'roc_curve.png',
+    'score_history': 'score_history.png'
+}
+
+
+##############Functions for the report inputs
+def data_fingerprint(df):
+    '''
+    Function to get a content hash of the evaluation data, row order included
+    '''
+    digest = hashlib.sha256(','.join(map(str, df.columns)).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def score_history():
+    '''
+    Function to get the deployment time, version and F1 score of every deployed version still on disk, oldest first
+    '''
+    history = []
+    for version in list_versions(deployment_path):
+        try:
+            with open(os.path.join(deployment_path, versions_folder_name, version, score_file_name), 'r') as f:
+                score = float(f.read())
+            history.append((read_manifest(version, deployment_path)['created_at'], version, score))
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f"Reporting: No score for version {version}: {e}")
+    return history
+
+
+##############Functions to render the reports
+# matplotlib's object-oriented API with the Agg canvas: no pyplot global state, each figure
+# belongs to its caller, so figures can be rendered from several threads and are freed with them
+def save_figure(figure, path):
+    '''
+    Function to write a figure as PNG, readers see either the old or the new file
+    '''
+    FigureCanvasAgg(figure).print_png(path + '.tmp')
+    os.replace(path + '.tmp', path)
+    return path
+
+
+def render_confusion_matrix(counts, path):
+    matrix = np.array(counts).reshape(2, 2)
+    figure = Figure(figsize=(8, 6))
+    ax = figure.add_subplot()
+    image = ax.imshow(matrix, cmap='magma', aspect='auto')
+    figure.colorbar(image, ax=ax)
+    # annotate in a color that stays readable on the cell
+    threshold = (matrix.max() + matrix.min()) / 2
+    for (i, j), count in np.ndenumerate(matrix):
+        ax.text(j, i, str(count), ha='center', va='center', color='black' if count > threshold else 'white')
+    ax.set_xticks([0, 1])
+    ax.set_xticklabels(['Predicted:0', 'Predicted:1'])
+    ax.set_yticks([0, 1])
+    ax.set_yticklabels(['True:0', 'True:1'])
+    ax.set_title('Confusion Matrix')
+    return save_figure(figure, path)
+
+
+def render_roc_curve(y_true, probabilities, path):
+    figure = Figure(figsize=(8, 6))
+    ax = figure.add_subplot()
+    if len(np.unique(y_true)) == 2:
+        fpr, tpr, _ = metrics.roc_curve(y_true, probabilities)
+        ax.plot(fpr, tpr, label=f"AUC = {metrics.auc(fpr, tpr):.3f}")
+        ax.legend(loc='lower right')
+    else:
+        ax.text(0.5, 0.5, 'ROC curve needs both classes in the test data', ha='center', va='center')
+    ax.plot([0, 1], [0, 1], linestyle='--', color='grey')
+    ax.set_xlabel('False positive rate')
+    ax.set_ylabel('True positive rate')
+    ax.set_title('ROC Curve')
+    return save_figure(figure, path)
+
+
+def render_score_history(history, path):
+    figure = Figure(figsize=(8, 6))
+    ax = figure.add_subplot()
+    if history:
+        ax.plot(range(len(history)), [score for _, _, score in history], marker='o')
+        ax.set_xticks(range(len(history)))
+        ax.set_xticklabels([created_at[:16] for created_at, _, _ in history], rotation=30, ha='right')
+    else:
+        ax.text(0.5, 0.5, 'No deployed versions', ha='center', va='center')
+    ax.set_ylabel('F1 score')
+    ax.set_title('F1 Score of Deployed Versions')
+    figure.tight_layout()
+    return save_figure(figure, path)
 
 
 ##############Function for reporting
 def cm_model(df):
+    '''
+    Function to write the confusion matrix, ROC curve and score history reports of the deployed
+    model on the test data. Nothing is rendered when the model version and the test data are the
+    same as for the reports already written. Returns the confusion counts [tn, fp, fn, tp].
+    '''
     #calculate a confusion matrix using the test data and the deployed model
-    y_pred = model_predictions(df)
-    y_true = df['exited']
-    conf_matrix = metrics.confusion_matrix(y_true, y_pred)
-    
-    # Create confusion matrix plot
-    plt.figure(figsize=(8, 6))
-    sns.heatmap(conf_matrix, annot=True, fmt='d', 
-                xticklabels=['Predicted:0', 'Predicted:1'],
-                yticklabels=['True:0', 'True:1'])
-    plt.title('Confusion Matrix')
-    
-    # Save the plot
-    plt.savefig(os.path.join(output_model_path, 'confusion_matrix.png'))
-    plt.close()
-    
-    logging.info(f"Reporting: Confusion matrix saved to {output_model_path}/confusion_matrix.png")
+    model, version = get_model_cache(deployment_path).current()
+    fingerprint = data_fingerprint(df)
+    paths = {name: os.path.join(output_model_path, file_name) for name, file_name in report_file_names.items()}
+    state_path = os.path.join(output_model_path, report_state_file_name)
+    try:
+        with open(state_path, 'r') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        state = None
+    hit = state is not None and state['model_version'] == version and state['data_fingerprint'] == fingerprint \
+        and all(os.path.exists(path) for path in paths.values())
+    count_cache('report', hit)
+    if hit:
+        logging.info(f"Reporting: Model version {version} and test data unchanged, reports kept")
+        return state['confusion']
+
+    # one pass of the cached model gives both the labels and the probabilities
+    X = df[model_feature_names(model)].to_numpy(dtype=np.float64)
+    labels, probabilities = batch_predictions(X, model)
+    y_true = df['exited'].to_numpy()
+    counts = confusion_counts(y_true, labels)
+
+    renders = [
+        (render_confusion_matrix, counts, paths['confusion_matrix']),
+        (render_roc_curve, y_true, probabilities, paths['roc_curve']),
+        (render_score_history, score_history(), paths['score_history'])
+    ]
+    with ThreadPoolExecutor(max_workers=len(renders)) as executor:
+        for path in executor.map(lambda render: render[0](*render[1:]), renders):
+            logging.info(f"Reporting: Report saved to {path}")
+
+    with open(state_path + '.tmp', 'w') as f:
+        json.dump({'model_version': version, 'data_fingerprint': fingerprint, 'confusion': counts}, f)
+    os.replace(state_path + '.tmp', state_path)
+    return counts
 
 
 
@@ -1,27 +1,37 @@
 import pandas as pd
 import pickle
 import os
-from sklearn import metrics
 import json
 import logging
+import threading
+import time
+from fingerprints import file_fingerprint
+from instrumentation import traced, annotate, count_cache
+from settings import load_config
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 
 #################Load config.json and get path variables
-with open('config.json','r') as f:
-    config = json.load(f) 
+config = load_config()
 
 dataset_csv_path = os.path.join(config['output_folder_path']) 
 test_data_path = os.path.join(config['test_data_path']) 
 model_path = os.path.join(config['output_model_path']) 
 logging.info(f"Scoring: Model path: {model_path}")
 
+score_cache_file_name = 'scorecache.json'
+score_cache_lock = threading.Lock()
+
 #################Function for model scoring
+@traced('scoring')
 def score_model():
     #this function should take a trained model, load test data, and calculate an F1 score for the model relative to the test data
     #it should write the result to the latestscore.txt file
 
+    # imported here so serving processes, which import this module for the cached score, do not load scikit-learn
+    from sklearn import metrics
+
     # Load the trained model
     with open(os.path.join(model_path, 'trainedmodel.pkl'), 'rb') as f:
         model = pickle.load(f)
@@ -30,6 +40,7 @@ def score_model():
     # Load the test data
     test_data = pd.read_csv(os.path.join(test_data_path, 'testdata.csv'))
     logging.info(f"Scoring: Test data shape: {test_data.shape}")
+    annotate(rows=len(test_data))
 
     # Split the test data into X and y
     X_test = test_data.drop(['exited', 'corporation'], axis=1)
@@ -53,5 +64,69 @@ def score_model():
     
     return f1
 
+#################Function for cached model scoring
+def load_score_cache():
+    '''
+    Function to load the persisted score cache, returns an empty dict if there is none yet
+    '''
+    try:
+        with open(os.path.join(model_path, score_cache_file_name), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_score_cache(cache):
+    '''
+    Function to atomically write the score cache
+    '''
+    cache_path = os.path.join(model_path, score_cache_file_name)
+    tmp_path = cache_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(cache, f)
+    os.replace(tmp_path, cache_path)
+
+
+def score_model_cached():
+    '''
+    Function to get the F1 score of the trained model on the test data, recomputed (and written
+    to latestscore.txt) only when the model or the test data content changed since the last score.
+    Returns the score with cache hit/miss, the age of the score and the fingerprints it is keyed by.
+    '''
+    model_file_path = os.path.join(model_path, 'trainedmodel.pkl')
+    test_file_path = os.path.join(test_data_path, 'testdata.csv')
+
+    with score_cache_lock:
+        cache = load_score_cache()
+        # content hashes are only recomputed when size or mtime changed
+        model_fingerprint = file_fingerprint(model_file_path, cache.get('model'))
+        test_fingerprint = file_fingerprint(test_file_path, cache.get('test_data'))
+        hit = ('f1_score' in cache
+               and cache['model']['sha256'] == model_fingerprint['sha256']
+               and cache['test_data']['sha256'] == test_fingerprint['sha256'])
+        count_cache('score', hit)
+
+        if hit:
+            if cache['model'] != model_fingerprint or cache['test_data'] != test_fingerprint:
+                save_score_cache(dict(cache, model=model_fingerprint, test_data=test_fingerprint))
+            logging.info("Scoring: Score cache hit")
+        else:
+            logging.info("Scoring: Score cache miss, rescoring")
+            f1 = score_model()
+            cache = {'f1_score': f1, 'scored_at': time.time(),
+                     'model': model_fingerprint, 'test_data': test_fingerprint}
+            # do not key the score by files that changed while it was computed
+            if (file_fingerprint(model_file_path, model_fingerprint) == model_fingerprint
+                    and file_fingerprint(test_file_path, test_fingerprint) == test_fingerprint):
+                save_score_cache(cache)
+
+    return {
+        'f1_score': cache['f1_score'],
+        'cache': 'hit' if hit else 'miss',
+        'score_age_seconds': time.time() - cache['scored_at'],
+        'model_version': model_fingerprint['sha256'][:12],
+        'test_data_fingerprint': test_fingerprint['sha256'][:12]
+    }
+
 if __name__ == "__main__":
     score_model()
\ No newline at end of file
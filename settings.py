@@ -0,0 +1,43 @@
+# Importing necessary libraries
+import os
+import json
+
+
+##################Config object shared by the pipeline modules
+class Config(dict):
+    '''
+    The settings of config.json, as the dict json.load returns, plus the file they came from
+    '''
+    def __init__(self, values, path):
+        super().__init__(values)
+        self.path = path
+
+
+# configs already read by this process, keyed by absolute path, with the mtime they were read at
+loaded_configs = {}
+
+
+def load_config(path='config.json'):
+    '''
+    Function to get the config. Every module asking for the same file shares one Config, which is
+    read from disk once per process and again only when the file changed.
+    '''
+    key = os.path.abspath(path)
+    mtime = os.stat(path).st_mtime_ns
+    cached = loaded_configs.get(key)
+    if cached is None or cached[0] != mtime:
+        with open(path, 'r') as f:
+            cached = (mtime, Config(json.load(f), path))
+        loaded_configs[key] = cached
+    return cached[1]
+
+
+def save_config(config, path=None):
+    '''
+    Function to atomically write the config back to its file
+    '''
+    path = path or getattr(config, 'path', 'config.json')
+    with open(path + '.tmp', 'w') as f:
+        json.dump(config, f)
+    os.replace(path + '.tmp', path)
+    loaded_configs[os.path.abspath(path)] = (os.stat(path).st_mtime_ns, Config(config, path))
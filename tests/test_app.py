@@ -0,0 +1,74 @@
+import json
+import asyncio
+import pytest
+import app
+import asgi
+import diagnostics
+
+non_object_bodies = ['[1, 2]', '"x"', '3', 'null']
+
+
+def asgi_post(path, body):
+    '''
+    Function to send one POST request through the ASGI app, returns its status and decoded body
+    '''
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': body.encode(), 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {'type': 'http', 'method': 'POST', 'path': path, 'query_string': b'', 'scheme': 'http',
+             'headers': [(b'host', b'localhost'), (b'content-type', b'application/json')]}
+    asyncio.run(asgi.app(scope, receive, send))
+    return messages[0]['status'], json.loads(messages[1]['body'])
+
+
+@pytest.mark.parametrize('body', non_object_bodies)
+def test_prediction_rejects_non_object_bodies(body):
+    response = app.app.test_client().post('/prediction', data=body, content_type='application/json')
+    assert response.status_code == 400
+    assert response.get_json() == {'error': "request body must be a JSON object"}
+
+
+@pytest.mark.parametrize('body', non_object_bodies)
+def test_asgi_prediction_rejects_non_object_bodies(body):
+    assert asgi_post('/prediction', body) == (400, {'error': "request body must be a JSON object"})
+
+
+@pytest.mark.parametrize('body', non_object_bodies)
+def test_diagnostic_jobs_reject_non_object_bodies(body):
+    response = app.app.test_client().post('/diagnostics/jobs', data=body, content_type='application/json')
+    assert response.status_code == 400
+    assert asgi_post('/diagnostics/jobs', body)[0] == 400
+
+
+@pytest.mark.parametrize('payload', [
+    {'records': [{'a': True, 'b': 1.0}]},
+    {'columns': {'a': [1.0, 2.0], 'b': [False, 3.0]}}
+])
+def test_features_reject_booleans(payload):
+    with pytest.raises(ValueError, match="must be numbers"):
+        diagnostics.features_from_payload(payload, ['a', 'b'])
+
+
+@pytest.mark.parametrize('payload', [
+    {'records': [{'a': [1, 2], 'b': [3, 4]}]},
+    {'records': [{'a': 1.0, 'b': [2.0]}]},
+    {'columns': {'a': [[1, 2]], 'b': [[3, 4]]}},
+    {'columns': {'a': [1.0], 'b': [{'x': 1}]}},
+    {'records': [{'a': '1', 'b': 2}]}
+])
+def test_features_reject_nested_values(payload):
+    with pytest.raises(ValueError, match="must be numbers"):
+        diagnostics.features_from_payload(payload, ['a', 'b'])
+
+
+def test_features_from_records_and_columns_agree():
+    records = diagnostics.features_from_payload({'records': [{'a': 1, 'b': 2.5}, {'a': 3, 'b': 4}]}, ['a', 'b'])
+    columns = diagnostics.features_from_payload({'columns': {'a': [1, 3], 'b': [2.5, 4]}}, ['a', 'b'])
+    assert records.tolist() == columns.tolist() == [[1.0, 2.5], [3.0, 4.0]]
+    assert diagnostics.features_from_payload({'records': []}, ['a', 'b']).shape == (0, 2)
+    assert diagnostics.features_from_payload({'columns': {'a': [], 'b': []}}, ['a', 'b']).shape == (0, 2)
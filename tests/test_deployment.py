@@ -0,0 +1,86 @@
+import os
+import time
+import pytest
+import deployment
+from numpymodel import model_file_name as numpy_model_file_name
+
+
+def model_files(folder, content, names=None):
+    '''
+    Function to write a stand-in for a trained model's files, each holding content, as publish_version takes them
+    '''
+    os.makedirs(folder, exist_ok=True)
+    files = {}
+    for name in names or [deployment.model_file_name, deployment.score_file_name, deployment.record_file_name]:
+        files[name] = os.path.join(folder, name)
+        with open(files[name], 'w') as f:
+            f.write(f"{content} {name}")
+    return files
+
+
+def served(deployment_path, name=deployment.model_file_name):
+    with open(os.path.join(deployment_path, name), 'r') as f:
+        return f.read().split()[0]
+
+
+def publish(tmp_path, content, names=None):
+    return deployment.publish_version(model_files(str(tmp_path / 'models' / content), content, names),
+                                      str(tmp_path / 'prod'))
+
+
+def test_publish_makes_a_verified_read_only_version(tmp_path):
+    deployment_path = str(tmp_path / 'prod')
+    version = publish(tmp_path, 'first')
+    assert deployment.list_versions(deployment_path) == [version]
+    assert deployment.current_version(deployment_path) == version
+    assert served(deployment_path) == 'first'
+    assert deployment.verify_version(version, deployment_path)
+    model_path = os.path.join(deployment.current_version_path(deployment_path), deployment.model_file_name)
+    assert os.stat(model_path).st_mode & 0o222 == 0
+    # the same files again keep the version
+    assert publish(tmp_path, 'first') == version
+
+    os.chmod(model_path, 0o644)
+    with open(model_path, 'w') as f:
+        f.write('tampered')
+    assert not deployment.verify_version(version, deployment_path)
+
+
+def test_rollback_serves_the_previous_version(tmp_path):
+    deployment_path = str(tmp_path / 'prod')
+    first = publish(tmp_path, 'first', [deployment.model_file_name, numpy_model_file_name,
+                                        deployment.score_file_name, deployment.record_file_name])
+    second = publish(tmp_path, 'second')
+    assert served(deployment_path) == 'second'
+    # the second version has no NumPy model, the first one's is not served with it
+    assert not os.path.lexists(os.path.join(deployment_path, numpy_model_file_name))
+
+    assert deployment.rollback(deployment_path=deployment_path) == first
+    assert served(deployment_path) == 'first'
+    assert served(deployment_path, numpy_model_file_name) == 'first'
+    with pytest.raises(ValueError, match="No previous deployment version"):
+        deployment.rollback(deployment_path=deployment_path)
+
+    assert deployment.rollback(second, deployment_path) == second
+    assert served(deployment_path) == 'second'
+    with pytest.raises(ValueError, match="Unknown deployment version"):
+        deployment.rollback('missing', deployment_path)
+
+
+def test_garbage_collection_keeps_newest_current_and_previous(tmp_path):
+    deployment_path = str(tmp_path / 'prod')
+    versions = [publish(tmp_path, content) for content in ('first', 'second', 'third', 'fourth')]
+    deployment.rollback(versions[1], deployment_path)
+    versions_path = os.path.join(deployment_path, deployment.versions_folder_name)
+    stale_path = os.path.join(versions_path, '.tmp-stale')
+    fresh_path = os.path.join(versions_path, '.tmp-fresh')
+    os.makedirs(stale_path)
+    os.makedirs(fresh_path)
+    os.utime(stale_path, (time.time() - 7200, time.time() - 7200))
+
+    # the newest, the current (second) and the one deployed before it (first)
+    assert deployment.collect_garbage(retention=1, deployment_path=deployment_path) == [versions[2]]
+    assert deployment.list_versions(deployment_path) == [versions[0], versions[1], versions[3]]
+    assert served(deployment_path) == 'second'
+    assert not os.path.exists(stale_path)
+    assert os.path.exists(fresh_path)
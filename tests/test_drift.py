@@ -0,0 +1,112 @@
+import os
+import sys
+import json
+import shutil
+import subprocess
+import pytest
+import benchmark
+import datagenerator
+
+# both run inside the sandbox, where every module reads the sandbox's config.json when imported
+deploy_script = '''
+import ingestion, training, scoring, deployment
+ingestion.merge_multiple_dataframe()
+training.train_model()
+scoring.score_model()
+deployment.store_model_into_pickle()
+print('{}')
+'''
+
+check_script = '''
+import json
+import pandas as pd
+from sklearn.metrics import f1_score
+import drift
+import ingestion
+from diagnostics import model_feature_names
+from modelregistry import get_model_cache
+
+ingestion.merge_multiple_dataframe()
+result = drift.check_drift()
+
+# a full re-prediction of every ingested row by the deployed model
+model = get_model_cache(drift.deployment_path).get()
+data = pd.read_csv(drift.csv_source_path(), dtype={'corporation': str})
+predictions = model.predict(data[model_feature_names(model)])
+reference = drift.load_json(drift.os.path.join(drift.output_model_path, drift.reference_file_name))
+state = drift.load_json(drift.os.path.join(drift.output_model_path, drift.state_file_name))
+print(json.dumps({
+    'result': result,
+    'confusion': drift.confusion_counts(data['exited'], predictions),
+    'f1_score': f1_score(data['exited'], predictions),
+    'rows': len(data),
+    # histograms of the rows since training, from the full dataset
+    'histograms': {column: [c - r for c, r in zip(drift.histogram_counts(data[column], feature['edges']),
+                                                  feature['counts'])]
+                   for column, feature in reference['features'].items()},
+    'state_histograms': state['versions'][result['model_version']]['histograms']
+}))
+'''
+
+
+def run_in_sandbox(sandbox_path, code):
+    result = subprocess.run([sys.executable, '-c', code], cwd=sandbox_path, env=benchmark.sandbox_env(),
+                            capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+@pytest.fixture
+def sandbox_path(tmp_path):
+    # a model trained on the first files and deployed, with a reference of its training rows
+    sandbox_path = str(tmp_path / 'sandbox')
+    benchmark.make_sandbox(sandbox_path, rows=3000, files=2, duplicate_rate=0.1)
+    with open(os.path.join(sandbox_path, 'config.json'), 'r') as f:
+        config = json.load(f)
+    # appended rows are read from their byte offset only with an incremental CSV dataset
+    config.update(incremental_ingestion=True, streaming_ingestion=False, dataset_format='csv',
+                  training_mode='batch', training_search=False, training_warm_start=False)
+    with open(os.path.join(sandbox_path, 'config.json'), 'w') as f:
+        json.dump(config, f)
+    run_in_sandbox(sandbox_path, deploy_script)
+    return sandbox_path
+
+
+def assert_matches_full_prediction(checked):
+    assert checked['result']['rows'] == checked['rows']
+    assert checked['result']['confusion'] == checked['confusion']
+    assert abs(checked['result']['f1_score'] - checked['f1_score']) < 1e-12
+    assert checked['state_histograms'] == checked['histograms']
+
+
+def test_running_counts_match_full_prediction(sandbox_path, tmp_path):
+    # rows arriving after training, with label drift, in two later batches
+    later_folder = str(tmp_path / 'later')
+    for batch, seed in (('a', 10), ('b', 20)):
+        for path in datagenerator.write_source_files(later_folder, rows=800, seed=seed, duplicate_rate=0.2,
+                                                     drift=0.3, prefix=f"later{batch}"):
+            shutil.copy(path, os.path.join(sandbox_path, 'sourcedata'))
+        checked = run_in_sandbox(sandbox_path, check_script)
+        assert checked['result']['mode'] == 'incremental'
+        # only the rows of the new batch are predicted
+        assert 0 < checked['result']['rows_scored'] <= 800
+        assert_matches_full_prediction(checked)
+
+
+def test_state_without_histograms_is_rebuilt(sandbox_path):
+    version = run_in_sandbox(sandbox_path, check_script)['result']['model_version']
+    # the counts of a check made before the deployed version had a reference
+    state_path = os.path.join(sandbox_path, 'models', 'driftstate.json')
+    with open(state_path, 'r') as f:
+        state = json.load(f)
+    state['versions'][version].update(confusion=[0, 0, 0, 0], histograms=None)
+    with open(state_path, 'w') as f:
+        json.dump(state, f)
+
+    checked = run_in_sandbox(sandbox_path, check_script)
+    assert checked['result']['mode'] == 'full'
+    assert_matches_full_prediction(checked)
+    # and the rebuilt counts carry on incrementally
+    checked = run_in_sandbox(sandbox_path, check_script)
+    assert checked['result']['mode'] == 'incremental'
+    assert_matches_full_prediction(checked)
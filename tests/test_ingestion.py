@@ -0,0 +1,102 @@
+import os
+import shutil
+import numpy as np
+import pytest
+import datagenerator
+import ingestion
+
+
+@pytest.fixture
+def source_folder(tmp_path):
+    # duplicates within and across files, enough rows for several streaming chunks
+    folder = tmp_path / 'source'
+    datagenerator.write_source_files(str(folder), rows=6000, files=3, duplicate_rate=0.2)
+    return folder
+
+
+def ingest(monkeypatch, input_folder, output_folder, **kwargs):
+    '''
+    Function to run the ingestion between two folders and get the bytes of finaldata.csv
+    '''
+    monkeypatch.setattr(ingestion, 'input_folder_path', str(input_folder))
+    monkeypatch.setattr(ingestion, 'output_folder_path', str(output_folder))
+    ingestion.merge_multiple_dataframe(**kwargs)
+    with open(os.path.join(output_folder, ingestion.file_name), 'rb') as f:
+        return f.read()
+
+
+def incremental_read(read_datasets, expected_files):
+    # fails the run if anything but the new files is parsed
+    def read_new_datasets(files_names, *args, **kwargs):
+        assert files_names == expected_files
+        return read_datasets(files_names, *args, **kwargs)
+    return read_new_datasets
+
+
+def test_incremental_matches_full_rebuild(monkeypatch, source_folder, tmp_path):
+    full = ingest(monkeypatch, source_folder, tmp_path / 'full', incremental=False)
+    # the first two files, then the third one arriving later
+    partial_folder = tmp_path / 'partial'
+    partial_folder.mkdir()
+    files_names = sorted(os.listdir(source_folder))
+    for name in files_names[:2]:
+        shutil.copy(source_folder / name, partial_folder / name)
+    ingest(monkeypatch, partial_folder, tmp_path / 'incremental', incremental=True)
+    assert os.path.exists(tmp_path / 'incremental' / ingestion.manifest_file_name)
+    shutil.copy(source_folder / files_names[2], partial_folder / files_names[2])
+    monkeypatch.setattr(ingestion, 'read_datasets', incremental_read(ingestion.read_datasets, files_names[2:]))
+    assert ingest(monkeypatch, partial_folder, tmp_path / 'incremental', incremental=True) == full
+
+
+def test_full_rebuild_drops_the_manifest(monkeypatch, source_folder, tmp_path):
+    ingest(monkeypatch, source_folder, tmp_path / 'output', incremental=True)
+    assert os.path.exists(tmp_path / 'output' / ingestion.row_hashes_file_name)
+    ingest(monkeypatch, source_folder, tmp_path / 'output', incremental=False)
+    assert not os.path.exists(tmp_path / 'output' / ingestion.manifest_file_name)
+    assert not os.path.exists(tmp_path / 'output' / ingestion.row_hashes_file_name)
+
+
+@pytest.mark.parametrize('executor', ['process', 'thread'])
+def test_parallel_reads_match_full_rebuild(monkeypatch, source_folder, tmp_path, executor):
+    full = ingest(monkeypatch, source_folder, tmp_path / 'full', incremental=False)
+    monkeypatch.setattr(ingestion, 'ingestion_workers', 3)
+    monkeypatch.setattr(ingestion, 'ingestion_executor', executor)
+    assert ingest(monkeypatch, source_folder, tmp_path / 'parallel', incremental=False) == full
+
+
+def test_streaming_matches_full_rebuild(monkeypatch, source_folder, tmp_path):
+    full = ingest(monkeypatch, source_folder, tmp_path / 'full', incremental=False, streaming=False)
+    # the smallest budget streams in chunks of 1000 rows
+    monkeypatch.setattr(ingestion, 'ingestion_memory_budget_mb', 1)
+    streamed = ingest(monkeypatch, source_folder, tmp_path / 'streamed', incremental=False, streaming=True)
+    assert streamed == full
+
+
+def test_streaming_ignores_incremental(monkeypatch, source_folder, tmp_path, caplog):
+    full = ingest(monkeypatch, source_folder, tmp_path / 'full', incremental=False, streaming=False)
+    ingest(monkeypatch, source_folder, tmp_path / 'output', incremental=True, streaming=False)
+    monkeypatch.setattr(ingestion, 'ingestion_memory_budget_mb', 1)
+    # every run streams all the files, the manifest left by the incremental run is not used
+    monkeypatch.setattr(ingestion, 'merge_new_dataframes', None)
+    with caplog.at_level('WARNING'):
+        assert ingest(monkeypatch, source_folder, tmp_path / 'output', incremental=True, streaming=True) == full
+    assert "incremental_ingestion is ignored with streaming_ingestion" in caplog.text
+    assert not os.path.exists(tmp_path / 'output' / ingestion.manifest_file_name)
+
+
+def test_row_hash_index_spills_past_its_budget(tmp_path):
+    rng = np.random.default_rng(0)
+    hashes = rng.integers(0, 2 ** 63, 20000, dtype=np.uint64)
+    hashes = np.concatenate([hashes, hashes[:5000]])
+    rng.shuffle(hashes)
+    index = ingestion.RowHashIndex(str(tmp_path), max_memory_bytes=16 * 1024)
+    new = np.concatenate([index.add_new(chunk) for chunk in np.array_split(hashes, 25)])
+    try:
+        assert index.spilled > 0
+        assert index.memory_bytes() <= 16 * 1024 / 4
+        # first occurrences only, whether the earlier copy is in memory or spilled
+        _, first = np.unique(hashes, return_index=True)
+        assert np.array_equal(np.flatnonzero(new), np.sort(first))
+        assert len(index) == 20000
+    finally:
+        index.close()
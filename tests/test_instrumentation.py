@@ -0,0 +1,45 @@
+import threading
+from instrumentation import Metrics
+
+
+def count_lookups(metrics, hits, misses):
+    for _ in range(hits):
+        metrics.add_local('risk_cache_requests_total', (('cache', 'model'), ('result', 'hit')))
+    for _ in range(misses):
+        metrics.add_local('risk_cache_requests_total', (('cache', 'model'), ('result', 'miss')))
+
+
+def test_thread_counts_add_up():
+    metrics = Metrics()
+    threads = [threading.Thread(target=count_lookups, args=(metrics, 1000, 10)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    metrics.add('risk_cache_requests_total', (('cache', 'model'), ('result', 'miss')), 20)
+    _, values = metrics.snapshot()
+    assert values['risk_cache_requests_total'] == {(('cache', 'model'), ('result', 'hit')): 8000,
+                                                   (('cache', 'model'), ('result', 'miss')): 100}
+    assert 'risk_cache_hit_ratio{cache="model"} 0.9876543209876543' in metrics.render()
+
+
+def count_after(metrics, registered, go, done):
+    count_lookups(metrics, 1, 0)
+    registered.set()
+    go.wait(5)
+    count_lookups(metrics, 5, 0)
+    done.set()
+
+
+def test_counting_a_known_series_takes_no_lock():
+    metrics = Metrics()
+    registered, go, done = threading.Event(), threading.Event(), threading.Event()
+    thread = threading.Thread(target=count_after, args=(metrics, registered, go, done))
+    thread.start()
+    registered.wait(5)
+    with metrics.lock:
+        go.set()
+        # the thread would block on the held lock if counting needed it
+        assert done.wait(5)
+    thread.join()
+    assert metrics.snapshot()[1]['risk_cache_requests_total'][(('cache', 'model'), ('result', 'hit'))] == 6
@@ -0,0 +1,117 @@
+import os
+import sys
+import json
+import time
+import functools
+import tempfile
+import subprocess
+import multiprocessing
+from jobs import JobManager, run_in_process, process_alive
+
+
+def sleep_then_return(seconds=0.0, value='done'):
+    time.sleep(seconds)
+    return value
+
+
+def slow_job():
+    return sleep_then_return(1.0, 'slow')
+
+
+def failing_job():
+    raise RuntimeError('boom')
+
+
+def wait_for(manager, job_id, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = manager.get(job_id)
+        if job['status'] not in ('queued', 'running'):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} still {job['status']}")
+
+
+def test_run_in_process_times_out():
+    start = time.monotonic()
+    status, error = run_in_process(slow_job, timeout=0.2)
+    assert status == 'timeout'
+    assert 'within 0.2 seconds' in error
+    assert time.monotonic() - start < 1.0
+
+
+def test_run_in_process_reports_failures():
+    assert run_in_process(failing_job, timeout=5) == ('failed', 'RuntimeError: boom')
+
+
+def sandboxed_subprocess(state_path):
+    # like the benchmark: a temporary folder and a Python subprocess that outlive the timeout
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(state_path)) as sandbox_path:
+        child = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)'])
+        with open(state_path, 'w') as f:
+            json.dump({'pid': child.pid, 'sandbox_path': sandbox_path}, f)
+        child.wait()
+
+
+def test_timeout_stops_subprocesses_and_cleans_up(tmp_path):
+    state_path = str(tmp_path / 'state.json')
+    status, _ = run_in_process(functools.partial(sandboxed_subprocess, state_path), timeout=1.0)
+    assert status == 'timeout'
+    with open(state_path, 'r') as f:
+        state = json.load(f)
+    assert not os.path.exists(state['sandbox_path'])
+    deadline = time.monotonic() + 5
+    while process_alive(state['pid']) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert not process_alive(state['pid'])
+
+
+def test_job_timeout_is_recorded(tmp_path):
+    manager = JobManager(store_path=str(tmp_path / 'jobs.json'), timeout=0.2)
+    job = wait_for(manager, manager.submit('slow', slow_job)['id'])
+    assert job['status'] == 'timeout'
+    assert job['result'] is None
+
+
+def test_one_job_per_name_across_managers(tmp_path):
+    # two managers on one store stand for two server workers
+    first = JobManager(store_path=str(tmp_path / 'jobs.json'))
+    second = JobManager(store_path=str(tmp_path / 'jobs.json'))
+    job = first.submit('slow', slow_job)
+    assert second.submit('slow', slow_job)['id'] == job['id']
+    assert second.get(job['id'])['name'] == 'slow'
+    done = wait_for(second, job['id'])
+    assert done['status'] == 'done' and done['result'] == 'slow'
+    assert second.latest('slow', status='done')['id'] == job['id']
+
+
+def submit_in_child(store_path, queue):
+    manager = JobManager(store_path=store_path)
+    job = manager.submit('quick', sleep_then_return)
+    wait_for(manager, job['id'])
+    queue.put(job['id'])
+
+
+def test_jobs_are_visible_to_other_processes(tmp_path):
+    store_path = str(tmp_path / 'jobs.json')
+    queue = multiprocessing.Queue()
+    child = multiprocessing.Process(target=submit_in_child, args=(store_path, queue))
+    child.start()
+    job_id = queue.get(timeout=10)
+    child.join(10)
+    job = JobManager(store_path=store_path).get(job_id)
+    assert job['status'] == 'done' and job['result'] == 'done'
+
+
+def test_jobs_of_a_stopped_process_are_interrupted(tmp_path):
+    manager = JobManager(store_path=str(tmp_path / 'jobs.json'))
+    with manager.locked_store() as jobs:
+        jobs['gone'] = {'id': 'gone', 'name': 'slow', 'status': 'running', 'submitted_at': 0.0,
+                        'started_at': 0.0, 'finished_at': None, 'result': None, 'error': None, 'pid': 2 ** 22 + 1}
+        manager.save(jobs)
+    job = manager.get('gone')
+    assert job['status'] == 'failed'
+    assert job['error'] == 'interrupted by a restart'
+    # a new job of that name can start
+    assert manager.submit('slow', slow_job)['id'] != 'gone'
+
@@ -0,0 +1,46 @@
+import json
+import pytest
+import fullprocess
+from pipeline import Pipeline, Stage
+from settings import Config
+
+
+def noop():
+    return None
+
+
+def pipeline_of(deps, tmp_path):
+    stages = [Stage(name, noop, deps=stage_deps, cache=False) for name, stage_deps in deps.items()]
+    return Pipeline(stages, state_path=str(tmp_path / 'state.json'), run_path=str(tmp_path / 'run.json'),
+                    history_path=str(tmp_path / 'runs.jsonl'), trace_path=str(tmp_path / 'trace.json'))
+
+
+@pytest.mark.parametrize('deps, cycle', [
+    ({'a': ['a']}, 'a -> a'),
+    ({'a': [], 'b': ['a', 'd'], 'c': ['b'], 'd': ['c']}, 'b -> d -> c -> b'),
+])
+def test_cycles_are_rejected(deps, cycle, tmp_path):
+    with pytest.raises(ValueError, match=f"in a cycle: {cycle}$"):
+        pipeline_of(deps, tmp_path)
+
+
+def test_unknown_dependencies_are_rejected(tmp_path):
+    with pytest.raises(ValueError, match="unknown stages"):
+        pipeline_of({'a': ['missing']}, tmp_path)
+
+
+def test_diamond_is_accepted(tmp_path):
+    pipeline_of({'a': [], 'b': ['a'], 'c': ['a'], 'd': ['b', 'c']}, tmp_path)
+
+
+def test_new_data_check_reads_the_given_config(tmp_path):
+    source_folder, deployment_folder = tmp_path / 'source', tmp_path / 'prod'
+    source_folder.mkdir()
+    deployment_folder.mkdir()
+    (source_folder / 'a.csv').write_text('x\n1\n')
+    (deployment_folder / 'ingestedfiles.txt').write_text(json.dumps({'ingested_files': ['a.csv']}) + '\n')
+    config = Config({'input_folder_path': str(source_folder), 'prod_deployment_path': str(deployment_folder)},
+                    str(tmp_path / 'config.json'))
+    assert fullprocess.check_new_data(config) is False
+    (source_folder / 'b.csv').write_text('x\n2\n')
+    assert fullprocess.check_new_data(config) is True
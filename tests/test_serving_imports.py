@@ -0,0 +1,20 @@
+import os
+import sys
+import subprocess
+
+repo_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def imported_modules(module):
+    # a fresh interpreter, other tests import scikit-learn into this one
+    code = f"import sys, json, {module}; print(json.dumps(sorted(sys.modules)))"
+    result = subprocess.run([sys.executable, '-c', code], cwd=repo_path, capture_output=True, text=True, check=True)
+    return result.stdout.splitlines()[-1]
+
+
+def test_app_does_not_import_sklearn():
+    assert '"sklearn' not in imported_modules('app')
+
+
+def test_wsgi_does_not_import_sklearn():
+    assert '"sklearn' not in imported_modules('wsgi')
@@ -1,54 +1,337 @@
 import pandas as pd
+import numpy as np
 import pickle
 import os
-from sklearn.linear_model import LogisticRegression
 import json
+import argparse
+import time
+import itertools
+import multiprocessing
+import warnings
+from datetime import datetime
+import sklearn
+from sklearn.linear_model import LogisticRegression, SGDClassifier
+from sklearn.preprocessing import StandardScaler
+from sklearn.model_selection import StratifiedKFold, cross_val_score
+from sklearn.exceptions import ConvergenceWarning
 import logging
+from datastore import load_dataset, iter_dataset
+from numpymodel import export_model, model_file_name as numpy_model_file_name
+from drift import write_reference
+from instrumentation import traced, annotate
+from settings import load_config
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 ###################Load config.json and get path variables
-with open('config.json','r') as f:
-    config = json.load(f) 
+config = load_config()
 
 dataset_csv_path = os.path.join(config['output_folder_path']) 
 model_path = os.path.join(config['output_model_path']) 
+prod_deployment_path = os.path.join(config['prod_deployment_path'])
+# start from the deployed model's coefficients, with a solver that supports it
+training_warm_start = config.get('training_warm_start', False)
+logging.info(f"Training: Warm start: {training_warm_start}")
+training_warm_start_solver = config.get('training_warm_start_solver', 'lbfgs')
+# cross-validated search over C and solver, on a process pool, within a time budget
+training_search = config.get('training_search', False)
+logging.info(f"Training: Search: {training_search}")
+training_search_grid = config.get('training_search_grid', {'C': [0.01, 0.1, 1.0, 10.0, 100.0],
+                                                           'solver': ['liblinear', 'lbfgs']})
+training_search_folds = config.get('training_search_folds', 5)
+training_search_workers = config.get('training_search_workers') or os.cpu_count()
+training_search_budget_seconds = config.get('training_search_budget_seconds', 60)
+# 'batch' fits on the whole dataset in memory, 'incremental' streams it in chunks through an SGD logistic model
+training_mode = config.get('training_mode', 'batch')
+logging.info(f"Training: Mode: {training_mode}")
+training_chunk_rows = config.get('training_chunk_rows', 100000)
+training_sgd_epochs = config.get('training_sgd_epochs', 5)
+
+metadata_file_name = 'modelmetadata.json'
+# scikit-learn 1.1 renamed SGD's logistic loss from 'log' to 'log_loss' and 1.2 added the newton-cholesky solver
+sklearn_version = tuple(int(part) for part in sklearn.__version__.split('.')[:2])
+sgd_log_loss = 'log_loss' if sklearn_version >= (1, 1) else 'log'
+# solvers that can continue from existing coefficients
+warm_start_solvers = ['lbfgs', 'newton-cg', 'sag', 'saga'] + (['newton-cholesky'] if sklearn_version >= (1, 2) else [])
+
+# the logistic regression the model has always been trained with, search and warm start vary C and solver
+base_params = dict(C=1.0, class_weight=None, dual=False, fit_intercept=True,
+                   intercept_scaling=1, l1_ratio=None, max_iter=100,
+                   multi_class='auto', n_jobs=None, penalty='l2',
+                   random_state=0, solver='liblinear', tol=0.0001, verbose=0,
+                   warm_start=False)
+
+
+#################Functions for the hyperparameter search
+# training data of a search worker process, sent once per worker instead of once per candidate
+search_data = None
+
+
+def init_search_worker(X, y, folds):
+    global search_data
+    search_data = (X, y, folds)
+
+
+def evaluate_candidate(params):
+    '''
+    Function run in a search worker: cross-validated F1 of one candidate
+    '''
+    X, y, folds = search_data
+    start = time.perf_counter()
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=ConvergenceWarning)
+        warnings.simplefilter('ignore', category=FutureWarning)
+        scores = cross_val_score(LogisticRegression(**dict(base_params, **params)), X, y, scoring='f1',
+                                 cv=StratifiedKFold(folds, shuffle=True, random_state=0))
+    return {'params': params, 'mean_f1': float(np.mean(scores)), 'std_f1': float(np.std(scores)),
+            'seconds': time.perf_counter() - start}
+
+
+def search_params(X, y, grid=None, folds=None, workers=None, budget_seconds=None):
+    '''
+    Function to cross-validate every C and solver combination of grid on a process pool.
+    Candidates not finished within budget_seconds are dropped and the pool is terminated.
+    Returns the best parameters (the default ones unless a candidate beats them) and the search report.
+    '''
+    grid = grid or training_search_grid
+    budget_seconds = training_search_budget_seconds if budget_seconds is None else budget_seconds
+    # fewer folds when the minority class is small
+    folds = min(folds or training_search_folds, int(np.bincount(np.asarray(y, dtype=np.int64)).min()))
+    default = {'C': base_params['C'], 'solver': base_params['solver']}
+    candidates = [default] + [dict(zip(grid, values)) for values in itertools.product(*grid.values())
+                              if dict(zip(grid, values)) != default]
+    report = {'candidates': [], 'total': len(candidates), 'folds': folds, 'budget_seconds': budget_seconds,
+              'timed_out': False}
+    if folds < 2:
+        logging.warning("Training: Too few rows per class to cross-validate, keeping the default parameters")
+        return default, report
+
+    start = time.perf_counter()
+    pool = multiprocessing.Pool(min(workers or training_search_workers, len(candidates)),
+                                initializer=init_search_worker, initargs=(X, y, folds))
+    try:
+        results = pool.imap_unordered(evaluate_candidate, candidates)
+        for _ in candidates:
+            remaining = budget_seconds - (time.perf_counter() - start)
+            try:
+                report['candidates'].append(results.next(timeout=max(remaining, 0)))
+            except multiprocessing.TimeoutError:
+                report['timed_out'] = True
+                logging.warning(f"Training: Search budget of {budget_seconds}s used up after "
+                                f"{len(report['candidates'])} of {len(candidates)} candidates")
+                break
+    finally:
+        pool.terminate()
+        pool.join()
+    report['seconds'] = time.perf_counter() - start
+
+    report['candidates'].sort(key=lambda result: (-result['mean_f1'], result['params'] != default))
+    best = report['candidates'][0]['params'] if report['candidates'] else default
+    logging.info(f"Training: Search best parameters: {best}")
+    return best, report
+
+
+#################Function for warm starts
+def deployed_model():
+    '''
+    Function to load the currently deployed scikit-learn model, None if there is none
+    '''
+    from deployment import current_version_path
+    try:
+        with open(os.path.join(current_version_path(prod_deployment_path), 'trainedmodel.pkl'), 'rb') as f:
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError) as e:
+        logging.info(f"Training: No deployed model to warm-start from: {e}")
+        return None
+
+
+def warm_start_model(params, previous, X, y):
+    '''
+    Function to make a model that continues from previous's coefficients when they fit the data
+    '''
+    if params['solver'] not in warm_start_solvers:
+        params = dict(params, solver=training_warm_start_solver)
+    model = LogisticRegression(**dict(base_params, **params, warm_start=True))
+    if (previous is not None and getattr(previous, 'coef_', np.empty((0, 0))).shape == (1, X.shape[1])
+            and list(getattr(previous, 'feature_names_in_', X.columns)) == list(X.columns)
+            and list(previous.classes_) == sorted(pd.unique(y))):
+        model.coef_ = previous.coef_.copy()
+        model.intercept_ = previous.intercept_.copy()
+        model.classes_ = previous.classes_.copy()
+        return model, True
+    return model, False
+
+
+#################Functions for out-of-core training
+def split_features(data):
+    '''
+    Function to split a chunk of the dataset into X and y
+    '''
+    return data.drop(['exited', 'corporation'], axis=1), data['exited']
+
+
+def dataset_chunks(chunk_rows=None):
+    '''
+    Function to stream the ingested dataset as (X, y) chunks
+    '''
+    for data in iter_dataset(chunk_rows or training_chunk_rows, dataset_csv_path):
+        yield split_features(data)
+
+
+def fit_incremental(chunk_rows=None, epochs=None):
+    '''
+    Function to fit a logistic model on the ingested dataset one chunk at a time: a first pass gets
+    the feature scaling and the classes, then each epoch feeds every chunk, shuffled, to
+    SGDClassifier.partial_fit. The scaling is folded into the coefficients and the result is returned
+    as a LogisticRegression, so scoring, the NumPy artifact and serving use it like a batch model.
+    '''
+    epochs = epochs or training_sgd_epochs
+    scaler = StandardScaler()
+    classes = set()
+    feature_names = None
+    rows = 0
+    for X, y in dataset_chunks(chunk_rows):
+        feature_names = list(X.columns)
+        scaler.partial_fit(X.to_numpy(dtype=np.float64))
+        classes.update(pd.unique(y).tolist())
+        rows += len(X)
+    if rows == 0:
+        raise ValueError("No rows to train on")
+    classes = np.array(sorted(classes))
+
+    # same regularization strength per row as LogisticRegression's C
+    model = SGDClassifier(loss=sgd_log_loss, penalty='l2', alpha=1.0 / (base_params['C'] * rows),
+                          average=True, random_state=0)
+    rng = np.random.default_rng(0)
+    for epoch in range(epochs):
+        for X, y in dataset_chunks(chunk_rows):
+            order = rng.permutation(len(X))
+            model.partial_fit(scaler.transform(X.to_numpy(dtype=np.float64))[order], y.to_numpy()[order],
+                              classes=classes)
+        logging.info(f"Training: Epoch {epoch + 1} of {epochs} done")
+
+    # w.(x - mean)/scale + b == (w/scale).x + b - w.(mean/scale)
+    fitted = LogisticRegression(**base_params)
+    fitted.coef_ = model.coef_ / scaler.scale_
+    fitted.intercept_ = model.intercept_ - (model.coef_ * scaler.mean_ / scaler.scale_).sum(axis=1)
+    fitted.classes_ = classes
+    fitted.n_features_in_ = len(feature_names)
+    fitted.feature_names_in_ = np.array(feature_names, dtype=object)
+    fitted.n_iter_ = np.array([epochs], dtype=np.int32)
+    return fitted, rows
 
 
 #################Function for training the model
-def train_model():
+@traced('training')
+def train_model(search=None, warm_start=None, mode=None):
+    search = training_search if search is None else search
+    warm_start = training_warm_start if warm_start is None else warm_start
+    mode = training_mode if mode is None else mode
     # Create model directory if it doesn't exist
     os.makedirs(model_path, exist_ok=True)
     
     logging.info("Training: Training model")
+    if mode == 'incremental':
+        return train_incremental()
 
     # read the data
-    data = pd.read_csv(os.path.join(dataset_csv_path, 'finaldata.csv'))
+    data = load_dataset(dataset_csv_path)
     logging.info(f"Training: Data shape: {data.shape}")
+    annotate(rows=len(data))
 
-    logging.info(f"Training:    Infos about the data: {data.info()}")
+    # DataFrame.info() prints a column by column summary, only worth it when debugging
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        data.info()
     # split the data into X and y 
-    X = data.drop(['exited', 'corporation'], axis=1)
-    y = data['exited']
+    X, y = split_features(data)
     logging.info(f"Training: X shape: {X.shape}")
     logging.info(f"Training: y shape: {y.shape}")
 
+    # pick C and solver by cross-validation if configured
+    params = {'C': base_params['C'], 'solver': base_params['solver']}
+    search_report = None
+    if search:
+        params, search_report = search_params(X, y)
+
     # use this logistic regression for training
-    model = LogisticRegression(C=1.0, class_weight=None, dual=False, fit_intercept=True,
-                    intercept_scaling=1, l1_ratio=None, max_iter=100,
-                    multi_class='auto', n_jobs=None, penalty='l2',
-                    random_state=0, solver='liblinear', tol=0.0001, verbose=0,
-                    warm_start=False)
+    warm_started = False
+    if warm_start:
+        model, warm_started = warm_start_model(params, deployed_model(), X, y)
+    else:
+        model = LogisticRegression(**dict(base_params, **params))
     
     #fit the logistic regression to your data
+    start = time.perf_counter()
     model.fit(X, y)
-    logging.info("Training: Model trained")
+    fit_seconds = time.perf_counter() - start
+    logging.info(f"Training: Model trained in {fit_seconds:.3f}s, warm-started: {warm_started}")
 
     #write the trained model to your workspace in a file called trainedmodel.pkl
     with open(os.path.join(model_path, 'trainedmodel.pkl'), 'wb') as f:
         pickle.dump(model, f)   
     logging.info("Training: Model saved")
-     
+
+    #write the compact NumPy artifact used for serving without scikit-learn
+    export_model(model, os.path.join(model_path, numpy_model_file_name), X)
+
+    #write the reference the drift checks of this model start from
+    write_reference(model, [(X, y)], dataset_csv_path, model_path)
+
+    #write how the model was chosen and how long it took
+    write_metadata({
+        'trained_at': datetime.now().isoformat(),
+        'mode': 'batch',
+        'rows': len(X),
+        'params': {key: model.get_params()[key] for key in ('C', 'solver', 'max_iter', 'tol')},
+        'iterations': int(np.max(model.n_iter_)),
+        'warm_started': warm_started,
+        'fit_seconds': fit_seconds,
+        'search': search_report
+    })
+
+
+def train_incremental(chunk_rows=None, epochs=None):
+    '''
+    Function to train in 'incremental' mode, memory use is bounded by the chunk size instead of
+    the dataset size. Warm start and the search only apply to batch training.
+    '''
+    chunk_rows = chunk_rows or training_chunk_rows
+    epochs = epochs or training_sgd_epochs
+    start = time.perf_counter()
+    model, rows = fit_incremental(chunk_rows, epochs)
+    fit_seconds = time.perf_counter() - start
+    logging.info(f"Training: Model trained on {rows} rows in chunks of {chunk_rows} in {fit_seconds:.3f}s")
+    annotate(rows=rows, chunk_rows=chunk_rows, epochs=epochs)
+
+    with open(os.path.join(model_path, 'trainedmodel.pkl'), 'wb') as f:
+        pickle.dump(model, f)
+    logging.info("Training: Model saved")
+
+    # the NumPy artifact is checked against the first chunk
+    X_sample, _ = next(dataset_chunks(chunk_rows))
+    export_model(model, os.path.join(model_path, numpy_model_file_name), X_sample)
+    write_reference(model, dataset_chunks(chunk_rows), dataset_csv_path, model_path)
+
+    write_metadata({
+        'trained_at': datetime.now().isoformat(),
+        'mode': 'incremental',
+        'rows': rows,
+        'params': {'C': base_params['C'], 'solver': 'sgd', 'chunk_rows': chunk_rows, 'epochs': epochs},
+        'iterations': epochs,
+        'warm_started': False,
+        'fit_seconds': fit_seconds,
+        'search': None
+    })
+
+
+def write_metadata(metadata):
+    with open(os.path.join(model_path, metadata_file_name), 'w') as f:
+        json.dump(metadata, f)
+    logging.info(f"Training: Model metadata: {metadata['params']}")
+
+
 if __name__ == "__main__":
-    train_model()
+    parser = argparse.ArgumentParser(description="Train the model on the ingested dataset")
+    parser.add_argument('--mode', choices=['batch', 'incremental'], help="override training_mode")
+    train_model(mode=parser.parse_args().mode)
     
@@ -0,0 +1,222 @@
+# Importing necessary libraries
+import argparse
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import logging
+from settings import load_config
+
+# Setting up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+##################Load config.json and get watcher settings
+config = load_config()
+
+# seconds the CSVs must stay unchanged before a run, seconds between scans without inotify
+watcher_debounce_seconds = config.get('watcher_debounce_seconds', 5.0)
+logging.info(f"Watcher: Debounce seconds: {watcher_debounce_seconds}")
+watcher_poll_interval = config.get('watcher_poll_interval', 10.0)
+logging.info(f"Watcher: Poll interval: {watcher_poll_interval}")
+watcher_use_inotify = config.get('watcher_use_inotify', True)
+
+# inotify event masks, from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_IGNORED = 0x00008000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+event_header = struct.Struct('iIII')
+
+
+##################Change notifications
+class InotifyEvents:
+    '''
+    Linux inotify watch of one folder through libc, without a third-party dependency.
+    wait() blocks until an event or the timeout and returns the names of the files involved.
+    '''
+    def __init__(self, folder_path):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+        if libc.inotify_add_watch(self.fd, os.fsencode(folder_path), mask) < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed on {folder_path}")
+        self.watching = True
+
+    def wait(self, timeout):
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+        names = []
+        while True:
+            try:
+                buffer = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return names
+            offset = 0
+            while offset < len(buffer):
+                _, mask, _, length = event_header.unpack_from(buffer, offset)
+                name = buffer[offset + event_header.size:offset + event_header.size + length].rstrip(b'\0')
+                offset += event_header.size + length
+                if mask & IN_IGNORED:
+                    # the folder itself was removed or unmounted
+                    self.watching = False
+                names.append(os.fsdecode(name))
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingEvents:
+    '''
+    Fallback when inotify is not available: wakes up every poll_interval seconds
+    '''
+    def __init__(self, poll_interval=None):
+        self.poll_interval = watcher_poll_interval if poll_interval is None else poll_interval
+        self.watching = True
+
+    def wait(self, timeout):
+        time.sleep(self.poll_interval if timeout is None else min(timeout, self.poll_interval))
+        return None
+
+    def close(self):
+        pass
+
+
+def open_events(folder_path, use_inotify=None):
+    '''
+    Function to get an inotify watch of folder_path, or polling if inotify is off or not supported
+    '''
+    if watcher_use_inotify if use_inotify is None else use_inotify:
+        try:
+            events = InotifyEvents(folder_path)
+            logging.info(f"Watcher: Watching {folder_path} with inotify")
+            return events
+        except (OSError, AttributeError, TypeError) as e:
+            logging.warning(f"Watcher: inotify not available ({e}), polling instead")
+    logging.info(f"Watcher: Polling {folder_path}")
+    return PollingEvents()
+
+
+##################Watch loop
+def scan_csv_files(folder_path):
+    '''
+    Function to get the size and mtime of every CSV in folder_path
+    '''
+    files = {}
+    try:
+        entries = list(os.scandir(folder_path))
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+        return files
+    for entry in entries:
+        if entry.name.endswith('.csv'):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            files[entry.name] = (stat.st_size, stat.st_mtime_ns)
+    return files
+
+
+def watch(folder_path, on_change, debounce_seconds=None, use_inotify=None, once=False, rescan_interval=300):
+    '''
+    Function to call on_change(names) with the new or changed CSVs of folder_path once they have been
+    left unchanged for debounce_seconds, which lets writers finish. Files already there count as new
+    at start-up, so data that arrived while the watcher was down is processed. Runs until interrupted,
+    or after the first on_change call if once is set.
+    '''
+    debounce_seconds = watcher_debounce_seconds if debounce_seconds is None else debounce_seconds
+    events = open_events(folder_path, use_inotify)
+    processed = {}
+    current = scan_csv_files(folder_path)
+    changed_at = time.monotonic()
+    try:
+        while True:
+            changed = sorted(name for name, state in current.items() if processed.get(name) != state)
+            quiet = time.monotonic() - changed_at
+            if changed and quiet >= debounce_seconds:
+                logging.info(f"Watcher: New or changed files: {changed}")
+                try:
+                    on_change(changed)
+                except Exception:
+                    logging.exception("Watcher: Pipeline run failed")
+                # files written during the run are picked up by the next scan
+                processed = current
+                if once:
+                    return
+                timeout = rescan_interval
+            else:
+                timeout = debounce_seconds - quiet if changed else rescan_interval
+
+            names = events.wait(timeout)
+            if not events.watching:
+                logging.warning(f"Watcher: Lost the watch on {folder_path}, polling instead")
+                events.close()
+                events = PollingEvents()
+            if names is not None and names and not any(name.endswith('.csv') for name in names):
+                continue
+            latest = scan_csv_files(folder_path)
+            if latest != current:
+                # still being written, restart the quiet period
+                current = latest
+                changed_at = time.monotonic()
+    finally:
+        events.close()
+
+
+##################Daemon entry point
+def config_mtime(config_path):
+    try:
+        return os.stat(config_path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def restart():
+    '''
+    Function to replace this process with a fresh run of the daemon
+    '''
+    logging.info("Watcher: config.json changed, restarting to load it")
+    os.execv(sys.executable, [sys.executable] + sys.argv)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the full process whenever new source CSVs arrive")
+    parser.add_argument('--debounce', type=float, help="seconds files must stay unchanged before a run")
+    parser.add_argument('--poll', action='store_true', help="poll the folder instead of using inotify")
+    parser.add_argument('--once', action='store_true', help="exit after the first run")
+    args = parser.parse_args(argv)
+
+    # imported once, so the libraries and the model cache stay warm between runs. The pipeline modules read
+    # their settings from config.json when imported, so when it changes the daemon restarts before the
+    # next run instead, and the files that triggered it are found again at start-up.
+    import fullprocess
+    pipeline_config = fullprocess.production_config(config)
+    started_config_mtime = config_mtime(config.path)
+
+    def on_change(names):
+        if config_mtime(config.path) != started_config_mtime:
+            restart()
+        fullprocess.main(pipeline_config)
+
+    watch(pipeline_config['input_folder_path'], on_change, args.debounce, False if args.poll else None, args.once)
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        logging.info("Watcher: Stopped")
@@ -1,4 +1,38 @@
 from app import app
+import gc
+import logging
+import threading
+import diagnostics
+import instrumentation
+import modelregistry
+
+
+def model_cache():
+    return modelregistry.get_model_cache(diagnostics.deployment_path)
+
+
+def preload():
+    '''
+    Function to load the deployed model before gunicorn forks its workers, then move everything
+    loaded so far out of the garbage collector's reach so the workers keep sharing those pages
+    '''
+    try:
+        model_cache().get()
+    except Exception as e:
+        logging.warning(f"WSGI: No deployed model to preload, workers load it on first use: {e}")
+    gc.freeze()
+
+
+def reset_locks():
+    '''
+    Function run in each forked worker: locks copied from the master start released
+    '''
+    model_cache().lock = threading.Lock()
+    modelregistry.model_caches_lock = threading.Lock()
+    instrumentation.metrics.lock = threading.Lock()
+
+
+preload()
 
 
 if __name__ == "__main__":